@@ -1,7 +1,8 @@
 # cart/admin.py
 
 from django.contrib import admin
-from .models import Product, CartItem, Location, Department, Cart, CartItem, Order, OrderItem
+from .models import Product, CartItem, Location, Department, Cart, CartItem, Order, OrderItem, SalesRollup, InventoryMovement, TaxRate
+from .pricing import price_items
 
 @admin.register(Location)
 class LocationAdmin(admin.ModelAdmin):
@@ -24,12 +25,20 @@ class ProductAdmin(admin.ModelAdmin):
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ('product', 'quantity', 'subtotal', 'tax', 'total_price', 'created_at', 'updated_at')
     list_filter = ('product__department', 'product__location', 'product__department__is_taxable')
+    list_select_related = ('product__department',)
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        price_items(changelist.result_list)
+        return changelist
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'total', 'created_at', 'updated_at')
+    list_display = ('user', 'item_count', 'subtotal', 'tax', 'total', 'created_at', 'updated_at')
+    list_select_related = ('user',)
     list_filter = ('user',)
     search_fields = ('user',)
+    readonly_fields = ('subtotal', 'tax', 'total', 'item_count')
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -39,6 +48,35 @@ class OrderAdmin(admin.ModelAdmin):
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ('product', 'quantity')
+    list_display = ('product_name', 'barcode', 'quantity', 'price', 'tax', 'order')
+    list_select_related = ('order__user',)
     list_filter = ('product__department', 'product__location', 'product__department__is_taxable')
-    search_fields = ('product', 'quantity', 'subtotal', 'tax', 'total_price')
+    search_fields = ('product_name', 'barcode')
+
+@admin.register(SalesRollup)
+class SalesRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'department', 'location', 'units', 'revenue', 'tax', 'cost')
+    list_filter = ('department', 'location')
+    list_select_related = ('department', 'location')
+    date_hierarchy = 'day'
+
+
+@admin.register(InventoryMovement)
+class InventoryMovementAdmin(admin.ModelAdmin):
+    list_display = ('product', 'quantity', 'reason', 'reference', 'created_at')
+    list_filter = ('reason',)
+    list_select_related = ('product',)
+    search_fields = ('product__name', 'product__barcode', 'reference')
+
+    # The ledger is append-only; corrections are new movements.
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(TaxRate)
+class TaxRateAdmin(admin.ModelAdmin):
+    list_display = ('location', 'department', 'rate', 'updated_at')
+    list_filter = ('location', 'department')
+    list_select_related = ('location', 'department')
@@ -0,0 +1,127 @@
+# cart/async_views.py
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from .authentication import ClaimsJWTAuthentication
+from .cache import aget_product_by_barcode
+from .models import Cart, CartItem, Product
+from .pricing import price_items, rate_table
+from .serializers import CartReadSerializer, ProductReadSerializer, ProductSerializer
+
+# Async-native versions of the hot read endpoints, served under /api/async/.
+# Each returns the same JSON as the DRF view it mirrors, which stays the
+# canonical API; these exist so an ASGI worker is not held while the
+# database answers.
+
+
+def render(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status, content_type='application/json')
+
+
+async def authenticate(request):
+    # Only reads the Authorization header and the cache, unless the user has
+    # to be loaded from the database.
+    try:
+        result = await sync_to_async(ClaimsJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as exc:
+        return None, render({'detail': exc.detail}, status=exc.status_code)
+    if result is None:
+        return None, render({'detail': 'Authentication credentials were not provided.'}, status=401)
+    return result[0], None
+
+
+def filter_products(request):
+    # Reuse ProductViewSet's filter, search and ordering backends. Building
+    # the queryset runs in a thread because django-filter validates the
+    # department/location choices with a query; evaluating it does not.
+    from .views import ProductViewSet
+    view = ProductViewSet(request=Request(request), format_kwarg=None, action='list')
+    return view, view.filter_queryset(view.get_queryset())
+
+
+async def product_list(request):
+    try:
+        view, queryset = await sync_to_async(filter_products)(request)
+    except ValidationError as exc:
+        # An invalid filter value; answer as DRF's exception handler would.
+        return render(exc.detail, status=exc.status_code)
+    paginator = view.pagination_class()
+    try:
+        page_size = min(int(request.GET[paginator.page_size_query_param]), paginator.max_page_size)
+        if page_size < 1:
+            raise ValueError
+    except (KeyError, ValueError):
+        page_size = paginator.page_size
+    try:
+        page = int(request.GET.get(paginator.page_query_param, 1))
+    except ValueError:
+        page = 0
+
+    count = await queryset.acount()
+    pages = max(1, -(-count // page_size))
+    if not 1 <= page <= pages:
+        return render({'detail': 'Invalid page.'}, status=404)
+    if not queryset.ordered:
+        queryset = queryset.order_by('id')
+
+    read_serializer = ProductReadSerializer(context={'request': request})
+    offset = (page - 1) * page_size
+    rows = [row async for row in read_serializer.values(queryset)[offset:offset + page_size]]
+
+    url = request.build_absolute_uri()
+    previous = None
+    if page == 2:
+        previous = remove_query_param(url, paginator.page_query_param)
+    elif page > 2:
+        previous = replace_query_param(url, paginator.page_query_param, page - 1)
+    return render({
+        'count': count,
+        'next': replace_query_param(url, paginator.page_query_param, page + 1) if page < pages else None,
+        'previous': previous,
+        'results': read_serializer.many_from_values(rows),
+    })
+
+
+async def product_detail(request, pk):
+    read_serializer = ProductReadSerializer(context={'request': request})
+    try:
+        row = await read_serializer.values(Product.objects.filter(pk=pk)).aget()
+    except Product.DoesNotExist:
+        return render({'detail': 'Not found.'}, status=404)
+    return render(read_serializer.from_values(row))
+
+
+async def product_by_barcode(request, code):
+    async def load(code):
+        product = await Product.objects.filter(barcode=code).order_by('id').afirst()
+        if product is None:
+            return None
+        return product.pk, dict(ProductSerializer(product).data)
+
+    data = await aget_product_by_barcode(code, load)
+    if data is None:
+        return render({'error': 'Product not found'}, status=404)
+    if data['image']:
+        data = {**data, 'image': request.build_absolute_uri(data['image'])}
+    return render(data)
+
+
+async def cart_detail(request):
+    user, error = await authenticate(request)
+    if error is not None:
+        return error
+    cart, _ = await Cart.objects.aget_or_create(user=user)
+    items = CartItem.objects.filter(cart=cart).select_related('product__department')
+    # Loading the rate table may query; keep that off the event loop.
+    table = await sync_to_async(rate_table)()
+    # What prefetch_related('items') would leave behind; async iteration
+    # does not support prefetching in this Django version.
+    prefetched = cart.items.all()
+    prefetched._result_cache = price_items([item async for item in items], table)
+    prefetched._prefetch_done = True
+    cart._prefetched_objects_cache = {'items': prefetched}
+    return render(CartReadSerializer(context={'request': request}).to_representation(cart))
@@ -0,0 +1,102 @@
+# cart/authentication.py
+
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .models import TokenWatermark
+
+# Fields known without the users table: from the token's claims (added by
+# CustomTokenObtainPairSerializer) or from the short-lived cache entry.
+USER_FIELDS = ('username', 'is_staff', 'is_active')
+
+
+def user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def changed_key(user_id):
+    return f'auth:user-changed:{user_id}'
+
+
+def _timeout():
+    return getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+
+
+def invalidate_user(user_id):
+    """
+    Call after deactivating a user or changing username/is_staff outside
+    of User.save() (signals cover save() and delete()). Tokens issued
+    before now stop being trusted for their claims until they expire.
+    """
+    changed_at = int(time.time()) + 1
+    TokenWatermark.objects.update_or_create(user_id=user_id, defaults={'changed_at': changed_at})
+    cache.set(changed_key(user_id), changed_at, _timeout())
+    cache.delete(user_key(user_id))
+
+
+def token_watermark(user_id):
+    # 0 when the user never changed; cached like the user's fields, so with a
+    # per-process cache other workers notice within AUTH_USER_CACHE_TIMEOUT.
+    changed_at = TokenWatermark.objects.filter(user_id=user_id).values_list('changed_at', flat=True).first()
+    return changed_at or 0
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that skips the per-request users SELECT.
+
+    The user is built from the token's username/is_staff claims, or failing
+    that from a short-TTL cache of the same fields, as a User with every
+    other field deferred; touching one of those loads it on demand. Once
+    invalidate_user() has run for a user, tokens issued earlier fall back
+    to the database. The watermark it records is stored in TokenWatermark
+    and only cached, so a cold or evicted cache never re-trusts old claims;
+    configure a shared CACHES backend for the change to apply to every
+    worker at once.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+        if api_settings.CHECK_REVOKE_TOKEN:
+            return super().get_user(validated_token)
+
+        keys = cache.get_many([changed_key(user_id), user_key(user_id)])
+        changed_at = keys.get(changed_key(user_id))
+        if changed_at is None:
+            changed_at = token_watermark(user_id)
+            cache.set(changed_key(user_id), changed_at, _timeout())
+        claims_trusted = validated_token.get('iat', 0) >= changed_at
+        if claims_trusted and all(field in validated_token for field in USER_FIELDS):
+            fields = {field: validated_token[field] for field in USER_FIELDS}
+        else:
+            fields = keys.get(user_key(user_id))
+            if fields is None:
+                fields = self.load_fields(user_id)
+                cache.set(user_key(user_id), fields, _timeout())
+
+        if not fields['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return self.build_user(user_id, fields)
+
+    def load_fields(self, user_id):
+        user_model = get_user_model()
+        try:
+            return user_model.objects.values(*USER_FIELDS).get(**{api_settings.USER_ID_FIELD: user_id})
+        except user_model.DoesNotExist:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+
+    def build_user(self, user_id, fields):
+        user_model = get_user_model()
+        known = {api_settings.USER_ID_FIELD: user_id, **fields}
+        # from_db() expects values in concrete field order.
+        names = [field.attname for field in user_model._meta.concrete_fields if field.attname in known]
+        return user_model.from_db('default', names, [known[name] for name in names])
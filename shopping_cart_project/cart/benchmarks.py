@@ -0,0 +1,358 @@
+# cart/benchmarks.py
+
+import json
+import random
+import socket
+import statistics
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+from .inventory import reserve_many
+from .models import Cart, CartItem, Department, InventoryMovement, Location, Order, OrderItem, Product, SalesRollup
+from .reports import rebuild_rollups
+from .pricing import cart_totals, price_line
+from .totals import CENT, TOTAL_FIELDS, empty_totals
+
+
+@contextmanager
+def rolled_back():
+    # Seed and measure inside a transaction that is always rolled back, so
+    # benchmarks can run against a development database without touching it.
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def uncached_catalog():
+    # Repeated identical requests would otherwise all be catalog cache hits
+    # after the first, and time the cache instead of the queries.
+    return override_settings(CATALOG_CACHE_TIMEOUT=0)
+
+
+def request_factory():
+    # 'testserver' is only allowed under the test runner.
+    hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+    return APIRequestFactory(SERVER_NAME=hosts[0] if hosts else 'localhost')
+
+
+def seed_catalog(products, departments=10, locations=5, seed=0, batch_size=2000, on_hand=None):
+    rng = random.Random(seed)
+    department_rows = Department.objects.bulk_create([
+        Department(name=f'Department {i}', is_taxable=i % 3 != 0) for i in range(departments)
+    ])
+    location_rows = Location.objects.bulk_create([
+        Location(name=f'Location {i}') for i in range(locations)
+    ])
+    for start in range(0, products, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, products)):
+            price = Decimal(rng.randint(100, 100000)) / 100
+            batch.append(Product(
+                name=f'Product {rng.randint(0, products)} {i}',
+                description=f'Seeded product number {i}',
+                price=price,
+                cost=(price * Decimal('0.6')).quantize(Decimal('0.01')),
+                barcode=f'{i:012d}',
+                department=department_rows[i % departments],
+                location=location_rows[i % locations],
+                is_available=rng.random() > 0.1,
+                on_hand=rng.randint(0, 500) if on_hand is None else on_hand,
+            ))
+        Product.objects.bulk_create(batch)
+        InventoryMovement.objects.bulk_create([
+            InventoryMovement(product=product, quantity=product.on_hand, reason=InventoryMovement.RESTOCK)
+            for product in batch if product.on_hand
+        ])
+    return department_rows, location_rows
+
+
+def seed_shoppers(users, carts=0, orders=0, lines=5, days=30, seed=0, password='bench-password',
+                  prefix='shopper', batch_size=2000):
+    """
+    Users, open carts and past orders over the products already seeded, all
+    with bulk inserts. Cart lines reserve their stock like the API does;
+    order dates are spread over the last `days` days and the sales rollups
+    rebuilt to match. Returns the users.
+    """
+    rng = random.Random(seed)
+    catalog = list(Product.objects.filter(is_available=True).order_by('id').values_list(
+        'id', 'name', 'barcode', 'price', 'cost', 'department_id', 'location_id', 'department__is_taxable'
+    ))
+    if not catalog:
+        raise ValueError('Seed the catalog before the shoppers.')
+    lines = min(lines, len(catalog))
+
+    password = make_password(password)
+    user_rows = User.objects.bulk_create([
+        User(username=f'{prefix}{i}', password=password) for i in range(users)
+    ], batch_size=batch_size)
+
+    cart_rows = Cart.objects.bulk_create([Cart(user=user) for user in user_rows[:carts]], batch_size=batch_size)
+    picks, wanted = [], defaultdict(int)
+    for cart in cart_rows:
+        for product in rng.sample(catalog, rng.randint(1, lines)):
+            quantity = rng.randint(1, 3)
+            picks.append((cart, product, quantity))
+            wanted[product[0]] += quantity
+    short = reserve_many(wanted, reference='seed')
+    picks = [pick for pick in picks if pick[1][0] not in short]
+    CartItem.objects.bulk_create([
+        CartItem(cart=cart, product_id=product[0], quantity=quantity) for cart, product, quantity in picks
+    ], batch_size=batch_size)
+    totals = cart_totals((cart.pk, product[3], quantity, product[7], product[6], product[5])
+                         for cart, product, quantity in picks)
+    for cart in cart_rows:
+        for name, value in (totals.get(cart.pk) or empty_totals()).items():
+            setattr(cart, name, value)
+    Cart.objects.bulk_update(cart_rows, TOTAL_FIELDS, batch_size=batch_size)
+
+    order_rows, order_lines = [], []
+    for _ in range(orders if user_rows else 0):
+        items, total = [], Decimal('0.00')
+        for pk, name, barcode, price, cost, department_id, location_id, is_taxable in rng.sample(
+                catalog, rng.randint(1, lines)):
+            quantity = rng.randint(1, 3)
+            subtotal, tax = price_line(price, quantity, is_taxable, location_id, department_id)
+            total += subtotal + tax
+            items.append(OrderItem(
+                product_id=pk, quantity=quantity, price=price, product_name=name, barcode=barcode,
+                tax=tax, cost=cost, department_id=department_id, location_id=location_id,
+            ))
+        order_rows.append(Order(user=rng.choice(user_rows), total=total.quantize(CENT), status='delivered'))
+        order_lines.append(items)
+    Order.objects.bulk_create(order_rows, batch_size=batch_size)
+    # created_at is auto_now_add, so back-date the orders a day's slice at a time.
+    now = timezone.now()
+    per_day = -(-len(order_rows) // days) if order_rows else 0
+    for day in range(days if per_day else 0):
+        pks = [order.pk for order in order_rows[day * per_day:(day + 1) * per_day]]
+        Order.objects.filter(pk__in=pks).update(created_at=now - timedelta(days=day, seconds=rng.randrange(3600)))
+    for order, items in zip(order_rows, order_lines):
+        for item in items:
+            item.order = order
+    OrderItem.objects.bulk_create([item for items in order_lines for item in items], batch_size=batch_size)
+    rebuild_rollups(SalesRollup, OrderItem)
+    return user_rows
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30, alive=lambda: True):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not alive():
+            return False
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def measure(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summarize(samples):
+    return {
+        'runs': len(samples),
+        'mean_ms': statistics.fmean(samples) * 1000,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+    }
+
+
+def format_summary(label, summary):
+    return (f"{label:<40} mean {summary['mean_ms']:8.2f} ms  p50 {summary['p50_ms']:8.2f} ms  "
+            f"p95 {summary['p95_ms']:8.2f} ms  p99 {summary['p99_ms']:8.2f} ms")
+
+
+class ClientTransport:
+    """Requests through Django's test client: the full stack, no sockets."""
+
+    def __init__(self):
+        from django.test import Client
+        self.client = Client(SERVER_NAME=request_factory().defaults['SERVER_NAME'])
+
+    def request(self, method, path, body, headers):
+        response = self.client.generic(
+            method, path, json.dumps(body) if body is not None else '', content_type='application/json',
+            **{f"HTTP_{name.upper().replace('-', '_')}": value for name, value in headers.items()},
+        )
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response.status_code, content
+
+    def close(self):
+        pass
+
+
+class HTTPTransport:
+    """Requests over a keep-alive connection to a local server."""
+
+    def __init__(self, port):
+        import http.client
+        self.port = port
+        self.errors = (OSError, http.client.HTTPException)
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+    def request(self, method, path, body, headers):
+        payload = json.dumps(body).encode() if body is not None else None
+        try:
+            self.connection.request(method, path, payload, {**headers, 'Content-Type': 'application/json'})
+            response = self.connection.getresponse()
+            return response.status, response.read()
+        except self.errors:
+            self.connection.close()
+            return 0, b''
+
+    def close(self):
+        self.connection.close()
+
+
+class Session:
+    """One simulated shopper: a transport, a token and the ids to pick from."""
+
+    def __init__(self, transport, token, products, departments, seed=0):
+        self.transport = transport
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.products = products
+        self.departments = departments
+        self.rng = random.Random(seed)
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def call(self, label, method, path, body=None, expect=200):
+        started = time.perf_counter()
+        status, content = self.transport.request(method, path, body, self.headers)
+        elapsed = time.perf_counter() - started
+        if status != expect:
+            self.errors[label] += 1
+            return None
+        self.samples[label].append(elapsed)
+        return json.loads(content) if content else None
+
+
+def local_path(url):
+    parts = urlsplit(url)
+    return f'{parts.path}?{parts.query}' if parts.query else parts.path
+
+
+def browse(session):
+    department = session.rng.choice(session.departments)
+    page = session.call('product list (filtered)', 'GET',
+                        f'/api/products/?department={department}&ordering=price&page_size=20')
+    if page and page['results']:
+        product = session.rng.choice(page['results'])
+        session.call('product detail', 'GET', f"/api/products/{product['id']}/")
+
+
+def add_item(session):
+    session.call('add item', 'POST', '/api/carts/add_item/',
+                 {'product_id': session.rng.choice(session.products), 'quantity': 1})
+
+
+def checkout(session):
+    for product_id in session.rng.sample(session.products, min(3, len(session.products))):
+        session.call('add item', 'POST', '/api/carts/add_item/', {'product_id': product_id, 'quantity': 1})
+    session.call('checkout', 'POST', '/api/orders/checkout/', expect=201)
+
+
+def order_history(session):
+    page = session.call('order history', 'GET', '/api/orders/?page_size=20')
+    if page and page['next']:
+        session.call('order history (next page)', 'GET', local_path(page['next']))
+
+
+SCENARIOS = {
+    'browse': browse,
+    'add_item': add_item,
+    'checkout': checkout,
+    'order_history': order_history,
+}
+
+
+def run_scenario(scenario, sessions, duration):
+    """
+    Run `scenario` in a loop on one thread per session for `duration`
+    seconds and return {endpoint label: summary with throughput and errors}.
+    """
+    for session in sessions:
+        session.samples.clear()
+        session.errors.clear()
+    stop_at = time.monotonic() + duration
+
+    def loop(session):
+        while time.monotonic() < stop_at:
+            scenario(session)
+
+    started = time.perf_counter()
+    if len(sessions) == 1:
+        loop(sessions[0])
+    else:
+        threads = [threading.Thread(target=loop, args=(session,)) for session in sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples, errors = defaultdict(list), defaultdict(int)
+    for session in sessions:
+        for label, values in session.samples.items():
+            samples[label].extend(values)
+        for label, count in session.errors.items():
+            errors[label] += count
+    results = {}
+    for label in sorted(set(samples) | set(errors)):
+        summary = summarize(samples[label]) if samples[label] else {'runs': 0}
+        summary['throughput_rps'] = len(samples[label]) / elapsed
+        summary['errors'] = errors[label]
+        results[label] = summary
+    return results
+
+
+def compare_results(baseline, current, threshold):
+    """
+    (scenario, label, baseline p95, current p95, change %) for every endpoint
+    in both runs, plus the ones whose p95 grew by more than `threshold` %.
+    """
+    rows, regressions = [], []
+    for scenario, endpoints in current.items():
+        for label, summary in endpoints.items():
+            before = baseline.get(scenario, {}).get(label)
+            if not before or 'p95_ms' not in before or 'p95_ms' not in summary:
+                continue
+            change = (summary['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+            row = (scenario, label, before['p95_ms'], summary['p95_ms'], change)
+            rows.append(row)
+            if change > threshold:
+                regressions.append(row)
+    return rows, regressions
@@ -0,0 +1,177 @@
+# cart/cache.py
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+class LRUCache:
+    """A small thread-safe LRU with a per-entry time to live."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Other processes only learn about writes through the shared cache, so the
+# local tier keeps entries for a few seconds at most.
+local_cache = LRUCache(
+    maxsize=getattr(settings, 'PRODUCT_LOCAL_CACHE_SIZE', 4096),
+    ttl=getattr(settings, 'PRODUCT_LOCAL_CACHE_TTL', 5),
+)
+
+
+def _timeout():
+    return getattr(settings, 'PRODUCT_CACHE_TIMEOUT', 300)
+
+
+def barcode_key(code):
+    # Hash so arbitrary scanner input is always a valid cache key.
+    return 'product:barcode:' + hashlib.md5(code.encode('utf-8')).hexdigest()
+
+
+def product_key(pk):
+    return f'product:{pk}'
+
+
+def _get(key):
+    value = local_cache.get(key)
+    if value is None:
+        value = cache.get(key)
+        if value is not None:
+            local_cache.set(key, value)
+    return value
+
+
+def _set(key, value):
+    cache.set(key, value, _timeout())
+    local_cache.set(key, value)
+
+
+def cached_product_by_barcode(code):
+    pk = _get(barcode_key(code))
+    data = _get(product_key(pk)) if pk is not None else None
+    if data is None or data.get('barcode') != code:
+        return None
+    return data
+
+
+def store_product_by_barcode(code, pk, data):
+    _set(barcode_key(code), pk)
+    _set(product_key(pk), data)
+
+
+def get_product_by_barcode(code, load):
+    """
+    Return the cached representation of the product with this barcode.
+
+    `load(code)` is called on a miss and must return a (pk, data) pair, or
+    None when no product has the barcode.
+    """
+    data = cached_product_by_barcode(code)
+    if data is None:
+        loaded = load(code)
+        if loaded is None:
+            return None
+        store_product_by_barcode(code, *loaded)
+        pk, data = loaded
+    return data
+
+
+async def aget_product_by_barcode(code, load):
+    """get_product_by_barcode() for async views; `load` is a coroutine function."""
+    data = await sync_to_async(cached_product_by_barcode)(code)
+    if data is None:
+        loaded = await load(code)
+        if loaded is None:
+            return None
+        await sync_to_async(store_product_by_barcode)(code, *loaded)
+        pk, data = loaded
+    return data
+
+
+def invalidate_products(pks=(), barcodes=()):
+    """
+    Evict products once the current transaction commits. Evicting earlier
+    lets a concurrent reader cache the old row again, under the new version,
+    for the full timeout.
+    """
+    keys = [product_key(pk) for pk in pks]
+    keys += [barcode_key(code) for code in barcodes if code]
+    if keys:
+        transaction.on_commit(lambda: _evict(keys))
+
+
+def _evict(keys):
+    local_cache.delete(*keys)
+    cache.delete_many(keys)
+    bump_catalog_version(PRODUCTS_VERSION_KEY)
+
+
+# Departments and locations change rarely; products change with every cart
+# reservation. Separate versions keep stock moves from discarding the
+# department and location caches.
+CATALOG_VERSION_KEY = 'catalog:version'
+PRODUCTS_VERSION_KEY = 'catalog:products-version'
+
+
+def catalog_version(key=CATALOG_VERSION_KEY):
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so an evicted counter never reuses old keys.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def catalog_versions(keys):
+    versions = cache.get_many(keys)
+    return [versions[key] if key in versions else catalog_version(key) for key in keys]
+
+
+def bump_catalog_version(key=CATALOG_VERSION_KEY):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return catalog_version(key)
+
+
+def clear():
+    local_cache.clear()
+    cache.clear()
@@ -0,0 +1,207 @@
+# cart/importers.py
+
+import codecs
+import csv
+import json
+import time
+from functools import partial
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from .cache import invalidate_products
+from .models import Department, InventoryMovement, Location, Product
+from .pricing import reprice_carts
+
+IMPORT_FIELDS = ('name', 'price', 'cost', 'description', 'is_available', 'on_hand')
+REQUIRED_FIELDS = ('name', 'price', 'cost', 'department', 'location')
+# Spreadsheet exports spell booleans many ways; BooleanField only knows a few.
+BOOLEANS = {'true': True, 'yes': True, '1': True, 'false': False, 'no': False, '0': False}
+
+
+def parse_csv(lines):
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def parse_ndjson(lines):
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, ValueError(f'Invalid JSON: {exc}')
+            continue
+        yield line_number, row if isinstance(row, dict) else ValueError('Expected a JSON object')
+
+
+PARSERS = {'csv': parse_csv, 'ndjson': parse_ndjson}
+
+
+def guess_format(name):
+    name = (name or '').lower()
+    if 'csv' in name:
+        return 'csv'
+    if 'ndjson' in name or 'jsonl' in name or 'json' in name:
+        return 'ndjson'
+    return None
+
+
+def decode_lines(stream, encoding='utf-8-sig'):
+    # Works on anything that yields bytes lines: files, uploads, HttpRequest.
+    return codecs.iterdecode(stream, encoding)
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rows(self):
+        return self.created + self.updated + len(self.errors)
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'errors': [{'line': line, 'error': error} for line, error in self.errors],
+            'seconds': round(self.elapsed, 3),
+            'rows_per_sec': round(self.rows_per_sec, 1),
+        }
+
+
+class ProductImporter:
+    """
+    Upsert products by barcode from parsed rows, a batch at a time.
+
+    Department and location are given by name and resolved through maps
+    loaded once. Each batch looks up which barcodes already exist, then
+    issues one bulk_create() for the new ones and one bulk_update() per set
+    of supplied columns for the rest; barcode carries no unique constraint,
+    so ON CONFLICT upserts are not available. Rows that fail validation are
+    reported by line number and skipped.
+    """
+    batch_size = 1000
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or self.batch_size
+        self.departments = self.name_map(Department)
+        self.locations = self.name_map(Location)
+        self.fields = {name: Product._meta.get_field(name) for name in IMPORT_FIELDS}
+
+    @staticmethod
+    def name_map(model):
+        names = {}
+        for pk, name in model.objects.order_by('-id').values_list('id', 'name'):
+            names[name] = pk
+        return names
+
+    def run(self, rows):
+        result = ImportResult()
+        batch = {}
+        for line, row in rows:
+            try:
+                barcode, values = self.clean(row)
+            except ValidationError as exc:
+                result.errors.append((line, '; '.join(exc.messages)))
+                continue
+            except ValueError as exc:
+                result.errors.append((line, str(exc)))
+                continue
+            # A barcode repeated within a batch: the later row wins.
+            batch[barcode] = (line, values)
+            if len(batch) >= self.batch_size:
+                self.flush(batch, result)
+                batch = {}
+        if batch:
+            self.flush(batch, result)
+        result.elapsed = time.perf_counter() - result.started
+        return result
+
+    def clean(self, row):
+        if isinstance(row, Exception):
+            raise row
+        barcode = str(row.get('barcode') or '').strip()
+        if not barcode:
+            raise ValidationError('barcode: This field is required.')
+        values, errors = {}, []
+        for name, field in self.fields.items():
+            if name not in row or row[name] is None:
+                continue
+            raw = row[name]
+            if isinstance(raw, str):
+                raw = raw.strip()
+                if name in ('is_available', 'on_hand', 'price', 'cost') and raw == '':
+                    continue
+                if name == 'is_available':
+                    raw = BOOLEANS.get(raw.lower(), raw)
+            try:
+                values[name] = field.clean(raw, None)
+            except ValidationError as exc:
+                errors.extend(f'{name}: {message}' for message in exc.messages)
+        for name, names in (('department', self.departments), ('location', self.locations)):
+            if row.get(name) in (None, ''):
+                continue
+            pk = names.get(str(row[name]).strip())
+            if pk is None:
+                errors.append(f'{name}: Unknown {name} "{row[name]}".')
+            else:
+                values[f'{name}_id'] = pk
+        if errors:
+            raise ValidationError(errors)
+        return barcode, values
+
+    def flush(self, batch, result):
+        now = timezone.now()
+        with transaction.atomic():
+            # on_hand is written back as an absolute value, so lock the rows
+            # until then: a reservation in between would be lost, and the
+            # adjustment measured against a stale balance.
+            existing = {
+                barcode: (pk, on_hand) for barcode, pk, on_hand in
+                Product.objects.select_for_update().filter(barcode__in=list(batch)).order_by('-id')
+                .values_list('barcode', 'id', 'on_hand')
+            }
+            created, updates, movements = [], {}, []
+            for barcode, (line, values) in batch.items():
+                pk, on_hand = existing.get(barcode, (None, None))
+                if pk is None:
+                    missing = [name for name in REQUIRED_FIELDS
+                               if name not in values and f'{name}_id' not in values]
+                    if missing:
+                        result.errors.append((line, 'New product is missing: ' + ', '.join(missing)))
+                        continue
+                    created.append(Product(barcode=barcode, **values))
+                else:
+                    product = Product(pk=pk, barcode=barcode, updated_at=now, **values)
+                    updates.setdefault(tuple(sorted(values)), []).append(product)
+                    if 'on_hand' in values and values['on_hand'] != on_hand:
+                        movements.append(InventoryMovement(product_id=pk, quantity=values['on_hand'] - on_hand,
+                                                           reason=InventoryMovement.ADJUSTMENT, reference='import'))
+            Product.objects.bulk_create(created)
+            repriced = []
+            for fields, products in updates.items():
+                Product.objects.bulk_update(products, [*fields, 'updated_at'])
+                if not {Product._meta.get_field(name).attname for name in fields}.isdisjoint(Product.pricing_fields):
+                    repriced += [product.pk for product in products]
+            # Bulk writes skip Product.save(), which normally keeps the ledger.
+            movements += [InventoryMovement(product_id=product.pk, quantity=product.on_hand,
+                                            reason=InventoryMovement.RESTOCK, reference='import')
+                          for product in created if product.on_hand]
+            InventoryMovement.objects.bulk_create(movements, batch_size=self.batch_size)
+            if repriced:
+                transaction.on_commit(partial(reprice_carts, product_ids=repriced))
+        # Nor do they send the post_save signals that normally evict these.
+        invalidate_products(pks=[pk for pk, _ in existing.values()], barcodes=list(batch))
+        result.created += len(created)
+        result.updated += sum(len(products) for products in updates.values())
@@ -0,0 +1,148 @@
+# cart/inventory.py
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .cache import invalidate_products
+from .models import InventoryCheckpoint, InventoryMovement, Product
+
+# Keep each CASE/OR statement well inside SQLite's parameter and
+# expression-depth limits.
+BATCH_SIZE = 200
+
+
+class _Shortfall(Exception):
+    pass
+
+
+def _batches(quantities):
+    items = list(quantities.items())
+    for start in range(0, len(items), BATCH_SIZE):
+        yield items[start:start + BATCH_SIZE]
+
+
+def _apply(batch, sign, guarded):
+    products = Product.objects.filter(pk__in=[pk for pk, _ in batch])
+    if guarded:
+        condition = Q()
+        for pk, quantity in batch:
+            condition |= Q(pk=pk, on_hand__gte=quantity)
+        products = products.filter(condition)
+    on_hand = Case(*[When(pk=pk, then=F('on_hand') + sign * quantity) for pk, quantity in batch])
+    return products.update(on_hand=on_hand)
+
+
+def _record(quantities, sign, reason, reference):
+    InventoryMovement.objects.bulk_create([
+        InventoryMovement(product_id=pk, quantity=sign * quantity, reason=reason, reference=reference)
+        for pk, quantity in quantities.items()
+    ], batch_size=BATCH_SIZE)
+
+
+def reserve_many(quantities, reference=''):
+    """
+    Take stock for a {product_id: quantity} mapping and return the ids of the
+    products that did not have enough on hand; the others stay reserved.
+    """
+    wanted = {pk: quantity for pk, quantity in quantities.items() if quantity > 0}
+    failed = set()
+    for batch in _batches(wanted):
+        try:
+            with transaction.atomic():
+                if _apply(batch, -1, guarded=True) != len(batch):
+                    raise _Shortfall
+        except _Shortfall:
+            # Someone in this batch is short: retry line by line to find out who.
+            for pk, quantity in batch:
+                if not _apply([(pk, quantity)], -1, guarded=True):
+                    failed.add(pk)
+    _record({pk: quantity for pk, quantity in wanted.items() if pk not in failed},
+            -1, InventoryMovement.RESERVE, reference)
+    invalidate_products(pks=set(wanted) - failed)
+    return failed
+
+
+def release_many(quantities, reference=''):
+    """Return stock for a {product_id: quantity} mapping."""
+    returned = {pk: quantity for pk, quantity in quantities.items() if quantity > 0}
+    for batch in _batches(returned):
+        _apply(batch, 1, guarded=False)
+    _record(returned, 1, InventoryMovement.RELEASE, reference)
+    invalidate_products(pks=returned)
+
+
+def record_sale(quantities, reference=''):
+    """
+    Mark the reserved stock in a {product_id: quantity} mapping as sold.
+    on_hand already dropped when it was reserved, so each line releases the
+    reservation and records the checkout, leaving the balance unchanged.
+    """
+    InventoryMovement.objects.bulk_create([
+        InventoryMovement(product_id=pk, quantity=sign * quantity, reason=reason, reference=reference)
+        for pk, quantity in quantities.items() if quantity > 0
+        for sign, reason in ((1, InventoryMovement.RELEASE), (-1, InventoryMovement.CHECKOUT))
+    ], batch_size=BATCH_SIZE)
+
+
+def available(product_ids):
+    """
+    {product_id: units available}. on_hand is the ledger's live balance, kept
+    in step by every movement, so this is one primary-key read.
+    """
+    return dict(Product.objects.filter(pk__in=list(product_ids)).values_list('id', 'on_hand'))
+
+
+def _pending_movements(product_ids=None):
+    # Movements not yet folded into their product's checkpoint.
+    watermark = InventoryCheckpoint.objects.filter(product_id=OuterRef('product_id')).values('watermark')
+    movements = InventoryMovement.objects.filter(id__gt=Coalesce(Subquery(watermark), Value(0)))
+    if product_ids is not None:
+        movements = movements.filter(product_id__in=list(product_ids))
+    return movements
+
+
+def ledger_balances(product_ids=None):
+    """
+    {product_id: balance} according to the ledger: checkpoint plus the
+    movements after it. Compaction keeps the second part short, so this is
+    two indexed queries however long the history is.
+    """
+    checkpoints = InventoryCheckpoint.objects.all()
+    if product_ids is not None:
+        checkpoints = checkpoints.filter(product_id__in=list(product_ids))
+    balances = dict(checkpoints.values_list('product_id', 'balance'))
+    pending = _pending_movements(product_ids).values('product_id').annotate(change=Sum('quantity'))
+    for row in pending.order_by():
+        balances[row['product_id']] = balances.get(row['product_id'], 0) + row['change']
+    return balances
+
+
+def compact_ledger(older_than=timedelta(minutes=1)):
+    """
+    Fold movements older than `older_than` into the checkpoints. The grace
+    period keeps transactions that have taken an id but not yet committed
+    out of the fold. Returns (products, movements) folded.
+    """
+    with transaction.atomic():
+        settled = _pending_movements().filter(created_at__lt=timezone.now() - older_than)
+        upto = settled.aggregate(upto=Max('id'))['upto']
+        if upto is None:
+            return 0, 0
+        # Fold by id, not created_at: the watermark moves past everything up to
+        # `upto`, whatever clock stamped it.
+        changes = _pending_movements().filter(id__lte=upto).values('product_id').annotate(
+            change=Sum('quantity'), count=Sum(Value(1))
+        ).order_by()
+        changes = {row['product_id']: row for row in changes}
+        balances = dict(InventoryCheckpoint.objects.filter(product_id__in=list(changes))
+                        .values_list('product_id', 'balance'))
+        InventoryCheckpoint.objects.bulk_create([
+            InventoryCheckpoint(product_id=pk, balance=balances.get(pk, 0) + row['change'], watermark=upto,
+                                updated_at=timezone.now())
+            for pk, row in changes.items()
+        ], update_conflicts=True, unique_fields=['product'], update_fields=['balance', 'watermark', 'updated_at'],
+            batch_size=BATCH_SIZE)
+    return len(changes), sum(row['count'] for row in changes.values())
@@ -0,0 +1,177 @@
+# cart/management/commands/bench_api.py
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from importlib.util import find_spec
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from cart.benchmarks import (
+    SCENARIOS, ClientTransport, HTTPTransport, Session, compare_results, free_port, run_scenario,
+    seed_catalog, seed_shoppers, wait_for_port,
+)
+from cart.models import Department, Product
+from cart.serializers import CustomTokenObtainPairSerializer
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = ('Seed a scratch SQLite database and drive scripted browse, add-item, checkout and '
+            'order-history scenarios through the test client or a local WSGI/ASGI server, '
+            'reporting throughput and p50/p95/p99 per endpoint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=['client', 'wsgi', 'asgi'], default='client',
+                            help='client: Django test client in-process; wsgi: threaded wsgiref server; '
+                                 'asgi: uvicorn subprocess.')
+        parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=list(SCENARIOS))
+        parser.add_argument('--duration', type=float, default=5, help='Seconds per scenario.')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Simulated shoppers for server targets; the client target uses one.')
+        parser.add_argument('--workers', type=int, default=1, help='uvicorn workers for --target asgi.')
+        parser.add_argument('--products', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', dest='json_path', help='Write the results to this file.')
+        parser.add_argument('--compare', help='Results file from an earlier run to compare p95 against.')
+        parser.add_argument('--threshold', type=float, default=10,
+                            help='Fail --compare when an endpoint p95 grows by more than this percent.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('bench_api runs against a scratch SQLite file; '
+                               'set DATABASE_ENGINE=sqlite to run it.')
+        if options['target'] == 'asgi' and find_spec('uvicorn') is None:
+            raise CommandError('--target asgi needs uvicorn: pip install uvicorn')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)['results']
+
+        settings_dict = connection.settings_dict
+        original = settings_dict['NAME']
+        with tempfile.TemporaryDirectory() as directory:
+            connection.close()
+            settings_dict['NAME'] = str(Path(directory) / 'bench.sqlite3')
+            try:
+                results = self.run(options)
+            finally:
+                connection.close()
+                settings_dict['NAME'] = original
+
+        for scenario, endpoints in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(scenario))
+            for label, summary in endpoints.items():
+                self.stdout.write(self.format_row(label, summary))
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'commit': self.commit(),
+            'options': {name: options[name] for name in
+                        ('target', 'duration', 'concurrency', 'workers', 'products', 'users', 'orders', 'seed')},
+            'results': results,
+        }
+        if options['json_path']:
+            with open(options['json_path'], 'w') as output:
+                json.dump(report, output, indent=2)
+        if baseline is not None:
+            self.compare(baseline, results, options['threshold'])
+
+    def run(self, options):
+        call_command('migrate', verbosity=0, interactive=False)
+        seed_catalog(options['products'], seed=options['seed'], on_hand=10 ** 6)
+        users = seed_shoppers(options['users'], orders=options['orders'], seed=options['seed'])
+        products = list(Product.objects.filter(is_available=True).values_list('id', flat=True))
+        departments = list(Department.objects.values_list('id', flat=True))
+        tokens = [str(CustomTokenObtainPairSerializer.get_token(user).access_token) for user in users]
+
+        shoppers = 1 if options['target'] == 'client' else options['concurrency']
+        with self.serve(options) as make_transport:
+            sessions = [
+                Session(make_transport(), tokens[i % len(tokens)], products, departments, seed=options['seed'] + i)
+                for i in range(shoppers)
+            ]
+            try:
+                return {name: run_scenario(SCENARIOS[name], sessions, options['duration'])
+                        for name in options['scenarios']}
+            finally:
+                for session in sessions:
+                    session.transport.close()
+
+    @contextmanager
+    def serve(self, options):
+        """Yield a factory for one transport per simulated shopper."""
+        if options['target'] == 'client':
+            yield ClientTransport
+            return
+        port = free_port()
+        if options['target'] == 'wsgi':
+            server = make_server('127.0.0.1', port, WSGIHandler(), ThreadingWSGIServer, QuietHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            stop = lambda: (server.shutdown(), server.server_close())
+        else:
+            stop = self.start_uvicorn(port, options)
+        try:
+            yield lambda: HTTPTransport(port)
+        finally:
+            stop()
+
+    def start_uvicorn(self, port, options):
+        environ = {**os.environ, 'DATABASE_ENGINE': 'sqlite', 'DATABASE_NAME': connection.settings_dict['NAME']}
+        server = subprocess.Popen([
+            sys.executable, '-m', 'uvicorn', 'shopping_cart_project.asgi:application',
+            '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(options['workers']), '--log-level', 'warning', '--no-access-log',
+        ], cwd=settings.BASE_DIR, env=environ)
+
+        def stop():
+            server.terminate()
+            server.wait()
+
+        if not wait_for_port(port, alive=lambda: server.poll() is None):
+            stop()
+            raise CommandError('uvicorn did not start accepting connections.')
+        return stop
+
+    def format_row(self, label, summary):
+        if not summary['runs']:
+            return self.style.ERROR(f"  {label:<28} no successful requests ({summary['errors']} errors)")
+        return (f"  {label:<28} {summary['throughput_rps']:9.1f} req/s  p50 {summary['p50_ms']:8.2f} ms  "
+                f"p95 {summary['p95_ms']:8.2f} ms  p99 {summary['p99_ms']:8.2f} ms  errors {summary['errors']}")
+
+    def compare(self, baseline, results, threshold):
+        rows, regressions = compare_results(baseline, results, threshold)
+        self.stdout.write(self.style.MIGRATE_HEADING('p95 against baseline'))
+        for scenario, label, before, after, change in rows:
+            line = f'  {scenario + " / " + label:<44} {before:8.2f} ms -> {after:8.2f} ms  {change:+6.1f}%'
+            self.stdout.write(self.style.ERROR(line) if change > threshold else line)
+        if regressions:
+            raise CommandError(f'{len(regressions)} endpoint(s) regressed by more than {threshold:g}%.')
+
+    def commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,93 @@
+# cart/management/commands/bench_connections.py
+
+import json
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from cart.benchmarks import format_summary, measure, request_factory, seed_catalog, summarize
+from cart.models import Product
+from cart.serializers import CustomTokenObtainPairSerializer
+
+VARIANTS = [
+    # label, CONN_MAX_AGE, SQLite pragmas
+    ('new connection per request', 0, {'journal_mode': 'DELETE'}),
+    ('persistent connection', 60, {'journal_mode': 'DELETE'}),
+    ('persistent + tuned pragmas', 60, None),
+]
+
+
+class Command(BaseCommand):
+    help = ('Compare request latency with and without persistent connections and the tuned '
+            'SQLite pragmas, through the full WSGI handler against a scratch SQLite database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=300)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('bench_connections runs against a scratch SQLite file; '
+                               'set DATABASE_ENGINE=sqlite to run it.')
+        settings_dict = connection.settings_dict
+        original = settings_dict['NAME'], settings_dict['CONN_MAX_AGE']
+        with tempfile.TemporaryDirectory() as directory:
+            connection.close()
+            settings_dict['NAME'] = str(Path(directory) / 'bench.sqlite3')
+            try:
+                results = self.run(options)
+            finally:
+                connection.close()
+                settings_dict['NAME'], settings_dict['CONN_MAX_AGE'] = original
+
+        for label, summaries in results.items():
+            for name, summary in summaries.items():
+                self.stdout.write(format_summary(f'{name} / {label}', summary))
+
+    def run(self, options):
+        call_command('migrate', verbosity=0, interactive=False)
+        seed_catalog(options['products'])
+        user = User.objects.create_user(username='bench', password='bench-password')
+        product = Product.objects.order_by('id').first()
+        Product.objects.filter(pk=product.pk).update(on_hand=10 ** 9, is_available=True)
+        token = CustomTokenObtainPairSerializer.get_token(user).access_token
+
+        handler = WSGIHandler()
+        factory = request_factory()
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        body = json.dumps({'product_id': product.pk, 'quantity': 1})
+
+        def call(request):
+            def start_response(status, response_headers, exc_info=None):
+                if not status.startswith('200'):
+                    raise CommandError(f'{request.path} returned {status}')
+            response = handler(request.environ, start_response)
+            b''.join(response)
+            # Fires request_finished, which closes the connection unless
+            # CONN_MAX_AGE keeps it open.
+            response.close()
+
+        scenarios = {
+            'cart read': lambda: call(factory.get('/api/carts/', **headers)),
+            'add item': lambda: call(factory.post('/api/carts/add_item/', body,
+                                                  content_type='application/json', **headers)),
+        }
+
+        results = {}
+        for label, max_age, pragmas in VARIANTS:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = max_age
+            overrides = {} if pragmas is None else {'SQLITE_PRAGMAS': pragmas}
+            with override_settings(**overrides):
+                for scenario in scenarios.values():
+                    scenario()
+                results[label] = {
+                    name: summarize(measure(scenario, options['repeat']))
+                    for name, scenario in scenarios.items()
+                }
+        return results
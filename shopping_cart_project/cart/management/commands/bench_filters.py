@@ -0,0 +1,68 @@
+# cart/management/commands/bench_filters.py
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from cart.benchmarks import (
+    format_summary, measure, request_factory, rolled_back, seed_catalog, summarize, uncached_catalog,
+)
+from cart.models import Product
+from cart.views import ProductViewSet
+
+
+class Command(BaseCommand):
+    help = 'Time ProductFilter, barcode and ordering query shapes with and without the Product indexes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000, help='Products to seed (rolled back afterwards).')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        view = ProductViewSet.as_view({'get': 'list'})
+        factory = request_factory()
+
+        def fetch(params):
+            def run():
+                response = view(factory.get('/api/products/', params))
+                assert response.status_code == 200, response.data
+            return run
+
+        with rolled_back(), uncached_catalog():
+            departments, locations = seed_catalog(options['products'])
+            barcode = Product.objects.order_by('-id').values_list('barcode', flat=True).first()
+            scenarios = {
+                'department + price range': fetch({
+                    'is_available': 'true', 'department': departments[0].pk,
+                    'min_price': 10, 'max_price': 50,
+                }),
+                'location + price, by price': fetch({
+                    'is_available': 'true', 'location': locations[0].pk,
+                    'min_price': 10, 'max_price': 50, 'ordering': 'price',
+                }),
+                'newest first': fetch({'ordering': '-created_at'}),
+                'barcode lookup': lambda: Product.objects.filter(barcode=barcode).first(),
+            }
+
+            # Issue the DDL directly: SQLite's schema editor refuses to run
+            # inside the surrounding transaction, which we need for rollback.
+            editor = connection.schema_editor()
+            for index in Product._meta.indexes:
+                editor.execute(index.remove_sql(Product, editor))
+            before = self.run_scenarios(scenarios, options['repeat'])
+
+            for index in Product._meta.indexes:
+                editor.execute(index.create_sql(Product, editor))
+            after = self.run_scenarios(scenarios, options['repeat'])
+
+        for label in scenarios:
+            self.stdout.write(format_summary(f'{label} (no indexes)', before[label]))
+            self.stdout.write(format_summary(f'{label} (indexed)', after[label]))
+
+    def run_scenarios(self, scenarios, repeat):
+        # Fresh planner statistics, as the seeded rows are all new.
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        results = {}
+        for label, scenario in scenarios.items():
+            scenario()
+            results[label] = summarize(measure(scenario, repeat))
+        return results
@@ -0,0 +1,56 @@
+# cart/management/commands/bench_pagination.py
+
+from django.core.management.base import BaseCommand
+from cart.benchmarks import (
+    format_summary, measure, request_factory, rolled_back, seed_catalog, summarize, uncached_catalog,
+)
+from cart.models import Product
+from cart.pagination import ProductKeysetPagination
+from cart.views import ProductViewSet
+
+
+class Command(BaseCommand):
+    help = 'Compare deep-page latency of page-number and keyset pagination on /api/products/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=25000, help='Products to seed (rolled back afterwards).')
+        parser.add_argument('--page', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--ordering', default='price', help='One of the ProductViewSet ordering fields.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        page, page_size, ordering = options['page'], options['page_size'], options['ordering']
+        view = ProductViewSet.as_view({'get': 'list'})
+        factory = request_factory()
+
+        def fetch(params):
+            response = view(factory.get('/api/products/', params))
+            response.render()
+            assert response.status_code == 200, response.data
+
+        with rolled_back(), uncached_catalog():
+            seed_catalog(options['products'])
+            offset = (page - 1) * page_size
+            if Product.objects.count() <= offset:
+                self.stderr.write(f'Not enough products for page {page}; seed more with --products.')
+                return
+
+            paginator = ProductKeysetPagination()
+            paginator.ordering = paginator.get_ordering(Product.objects.order_by(ordering))
+            last_row = Product.objects.order_by(*paginator.ordering)[offset - 1]
+            cursor = paginator.encode_cursor(last_row)
+
+            page_params = {'page': page, 'page_size': page_size, 'ordering': ordering}
+            keyset_params = {'pagination': 'keyset', 'cursor': cursor, 'page_size': page_size, 'ordering': ordering}
+            for params in (page_params, keyset_params):
+                fetch(params)
+
+            results = {
+                'page number': summarize(measure(lambda: fetch(page_params), options['repeat'])),
+                'keyset': summarize(measure(lambda: fetch(keyset_params), options['repeat'])),
+            }
+
+        self.stdout.write(f'Page {page} of {page_size} ordered by {ordering}:')
+        for label, summary in results.items():
+            self.stdout.write(format_summary(label, summary))
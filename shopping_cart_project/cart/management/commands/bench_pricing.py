@@ -0,0 +1,82 @@
+# cart/management/commands/bench_pricing.py
+
+import random
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from cart.benchmarks import format_summary, measure, summarize
+from cart.models import CartItem, Department, Product
+from cart.pricing import RateTable, cart_totals, price_items, price_lines
+from cart.totals import CENT
+
+
+def line_amounts(price, quantity, is_taxable, rate):
+    # The per-line arithmetic CartItem's properties used to run, kept here
+    # as the baseline the engine is measured and checked against.
+    subtotal = Decimal(str(price)) * quantity
+    if is_taxable:
+        return subtotal, (subtotal * rate).quantize(CENT, rounding=ROUND_HALF_UP)
+    return subtotal, Decimal('0.00')
+
+
+class Command(BaseCommand):
+    help = ('Price a batch of cart lines with the pricing engine and with the per-item '
+            'property arithmetic it replaces; no database needed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=100000)
+        parser.add_argument('--carts', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        departments = [Department(pk=i, name=f'Department {i}', is_taxable=i % 3 != 0) for i in range(1, 11)]
+        items = []
+        for i in range(options['lines']):
+            department = rng.choice(departments)
+            product = Product(pk=i + 1, price=Decimal(rng.randint(1, 100000)) / 100, department=department,
+                              location_id=rng.randint(1, 5))
+            items.append(CartItem(cart_id=rng.randint(1, options['carts']), product=product,
+                                  quantity=rng.randint(1, 5)))
+        rows = [(item.cart_id, item.product.price, item.quantity, item.product.department.is_taxable,
+                 item.product.location_id, item.product.department_id) for item in items]
+        flat = RateTable(settings.TAX_RATE)
+        regional = RateTable(settings.TAX_RATE, [(1, None, '0.0725'), (2, None, '0.06'), (None, 4, '0.02'),
+                                                 (3, 5, '0.1')])
+
+        def per_item_properties():
+            # What CartItem.subtotal/tax/total_price did for every read:
+            # recompute the line, once per property.
+            for item in items:
+                product = item.product
+                for _ in range(3):
+                    line_amounts(product.price, item.quantity, product.department.is_taxable, settings.TAX_RATE)
+
+        def engine_lines():
+            price_lines((row[1:] for row in rows), flat)
+
+        def engine_items():
+            price_items(items, flat)
+            for item in items:
+                item.subtotal, item.tax, item.total_price
+
+        def engine_cart_totals():
+            cart_totals(rows, regional)
+
+        expected = [line_amounts(price, quantity, is_taxable, settings.TAX_RATE)
+                    for _, price, quantity, is_taxable, _, _ in rows]
+        if price_lines((row[1:] for row in rows), flat) != expected:
+            raise CommandError('Engine amounts differ from the per-item computation.')
+
+        results = {
+            'per-item properties (3 reads/line)': summarize(measure(per_item_properties, options['repeat'])),
+            'price_lines, flat rate': summarize(measure(engine_lines, options['repeat'])),
+            'price_items + 3 reads/line': summarize(measure(engine_items, options['repeat'])),
+            'cart_totals, regional rates': summarize(measure(engine_cart_totals, options['repeat'])),
+        }
+        self.stdout.write(f"Price {options['lines']} lines across {options['carts']} carts "
+                          f"(amounts verified identical):")
+        for label, summary in results.items():
+            self.stdout.write(format_summary(label, summary))
@@ -0,0 +1,48 @@
+# cart/management/commands/bench_serializers.py
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from cart.benchmarks import format_summary, measure, request_factory, rolled_back, seed_catalog, summarize
+from cart.models import Product
+from cart.serializers import ProductReadSerializer, ProductSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare ProductSerializer with the compiled read path on a seeded catalog.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000, help='Products to seed (rolled back afterwards).')
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        context = {'request': Request(request_factory().get('/api/products/'))}
+        renderer = JSONRenderer()
+
+        with rolled_back():
+            seed_catalog(options['products'])
+            queryset = Product.objects.order_by('id')
+            fast = ProductReadSerializer(context=context)
+
+            def model_serializer():
+                return renderer.render(ProductSerializer(queryset.all(), many=True, context=context).data)
+
+            def compiled_values():
+                return renderer.render(fast.many_from_values(fast.values(queryset.all())))
+
+            def compiled_instances():
+                return renderer.render(fast.many(queryset.all()))
+
+            expected = model_serializer()
+            if compiled_values() != expected or compiled_instances() != expected:
+                raise CommandError('Compiled serializer output differs from ProductSerializer.')
+
+            results = {
+                'ProductSerializer': summarize(measure(model_serializer, options['repeat'])),
+                'compiled, .values() rows': summarize(measure(compiled_values, options['repeat'])),
+                'compiled, model instances': summarize(measure(compiled_instances, options['repeat'])),
+            }
+
+        self.stdout.write(f"Query + serialize + render {options['products']} products (output verified identical):")
+        for label, summary in results.items():
+            self.stdout.write(format_summary(label, summary))
@@ -0,0 +1,48 @@
+# cart/management/commands/check_inventory.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from cart.inventory import ledger_balances
+from cart.models import InventoryMovement, Product
+
+
+class Command(BaseCommand):
+    help = 'Compare Product.on_hand with the inventory ledger and report (or fix) any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Append adjustments so the ledger matches on_hand.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = drifted = 0
+        last_id = 0
+        while True:
+            # Lock the batch so a reservation can't commit between reading
+            # on_hand and reading the ledger and show up as drift.
+            with transaction.atomic():
+                stock = dict(Product.objects.select_for_update().filter(pk__gt=last_id).order_by('pk')
+                             .values_list('pk', 'on_hand')[:batch_size])
+                if not stock:
+                    break
+                last_id = max(stock)
+
+                balances = ledger_balances(stock)
+                corrections = []
+                for pk, on_hand in stock.items():
+                    balance = balances.get(pk, 0)
+                    if balance != on_hand:
+                        self.stdout.write(f'product {pk}: on_hand {on_hand} != ledger {balance}')
+                        corrections.append(InventoryMovement(
+                            product_id=pk, quantity=on_hand - balance,
+                            reason=InventoryMovement.ADJUSTMENT, reference='consistency-check',
+                        ))
+                checked += len(stock)
+                drifted += len(corrections)
+
+                if options['fix'] and corrections:
+                    InventoryMovement.objects.bulk_create(corrections)
+
+        action = 'fixed' if options['fix'] else 'found'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} products, {action} {drifted} with drift.'))
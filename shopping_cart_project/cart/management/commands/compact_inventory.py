@@ -0,0 +1,18 @@
+# cart/management/commands/compact_inventory.py
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from cart.inventory import compact_ledger
+
+
+class Command(BaseCommand):
+    help = 'Fold settled inventory movements into the per-product checkpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=60,
+                            help='Only fold movements at least this many seconds old.')
+
+    def handle(self, *args, **options):
+        products, movements = compact_ledger(timedelta(seconds=options['older_than']))
+        self.stdout.write(self.style.SUCCESS(f'Folded {movements} movements for {products} products.'))
@@ -0,0 +1,41 @@
+# cart/management/commands/import_products.py
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from cart.importers import PARSERS, ProductImporter, decode_lines, guess_format
+
+
+class Command(BaseCommand):
+    help = 'Upsert products by barcode from a CSV or NDJSON file, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for stdin.")
+        parser.add_argument('--format', choices=sorted(PARSERS), help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=ProductImporter.batch_size)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        source_format = options['format'] or guess_format(path)
+        if source_format is None:
+            raise CommandError('Cannot tell the format from the file name; pass --format.')
+
+        if path == '-':
+            result = self.run(sys.stdin.buffer, source_format, options)
+        else:
+            try:
+                with open(path, 'rb') as stream:
+                    result = self.run(stream, source_format, options)
+            except OSError as exc:
+                raise CommandError(str(exc))
+
+        for line, error in result.errors:
+            self.stderr.write(f'line {line}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {result.created}, updated {result.updated}, {len(result.errors)} errors '
+            f'in {result.elapsed:.2f}s ({result.rows_per_sec:.0f} rows/sec).'
+        ))
+
+    def run(self, stream, source_format, options):
+        rows = PARSERS[source_format](decode_lines(stream))
+        return ProductImporter(batch_size=options['batch_size']).run(rows)
@@ -0,0 +1,120 @@
+# cart/management/commands/loadtest.py
+
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+from cart.benchmarks import free_port, seed_catalog, summarize, wait_for_port
+from cart.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Serve the project with uvicorn and compare requests/sec and latency of the '
+            'sync DRF endpoints with their /api/async/ counterparts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent client connections.')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds to run each endpoint.')
+        parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes.')
+        parser.add_argument('--username', help='Also load the cart endpoints as this user.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed this many products first if the catalog is empty (kept).')
+
+    def handle(self, *args, **options):
+        if find_spec('uvicorn') is None:
+            raise CommandError('The load test needs uvicorn: pip install uvicorn')
+        if options['seed'] and not Product.objects.exists():
+            seed_catalog(options['seed'])
+        product = Product.objects.exclude(barcode__isnull=True).exclude(barcode='').order_by('id').first()
+        if product is None:
+            raise CommandError('No products with a barcode to load; pass --seed.')
+
+        headers = {}
+        endpoints = [
+            ('product list', '/api/products/?page_size=20', '/api/async/products/?page_size=20'),
+            ('product detail', f'/api/products/{product.pk}/', f'/api/async/products/{product.pk}/'),
+            ('barcode lookup', f'/api/products/by-barcode/{product.barcode}/',
+             f'/api/async/products/by-barcode/{product.barcode}/'),
+        ]
+        if options['username']:
+            try:
+                user = User.objects.get(username=options['username'])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['username']!r} does not exist.")
+            headers['Authorization'] = f'Bearer {RefreshToken.for_user(user).access_token}'
+            endpoints.append(('cart', '/api/carts/', '/api/async/carts/'))
+
+        port = free_port()
+        # The async views have no catalog cache; without this the sync list
+        # and detail would be timed against the cache rather than the ORM.
+        environ = {**os.environ, 'CATALOG_CACHE_TIMEOUT': '0'}
+        server = subprocess.Popen([
+            sys.executable, '-m', 'uvicorn', 'shopping_cart_project.asgi:application',
+            '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(options['workers']), '--log-level', 'warning', '--no-access-log',
+        ], cwd=settings.BASE_DIR, env=environ)
+        try:
+            self.wait_for(port, server)
+            for label, sync_path, async_path in endpoints:
+                for kind, path in (('sync', sync_path), ('async', async_path)):
+                    self.run_endpoint(f'{label} ({kind})', port, path, headers, options)
+        finally:
+            server.terminate()
+            server.wait()
+
+    def wait_for(self, port, server):
+        if not wait_for_port(port, alive=lambda: server.poll() is None):
+            raise CommandError('uvicorn did not start accepting connections.')
+
+    def run_endpoint(self, label, port, path, headers, options):
+        samples, errors = [], []
+        lock = threading.Lock()
+        stop_at = time.monotonic() + options['duration']
+
+        def client():
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            local, failed = [], 0
+            while time.monotonic() < stop_at:
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        failed += 1
+                        continue
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                    continue
+                local.append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                samples.extend(local)
+                errors.append(failed)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client) for _ in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if not samples:
+            self.stdout.write(self.style.ERROR(f'{label:<28} no successful requests ({sum(errors)} errors)'))
+            return
+        summary = summarize(samples)
+        self.stdout.write(
+            f"{label:<28} {len(samples) / elapsed:9.1f} req/s  p50 {summary['p50_ms']:8.2f} ms  "
+            f"p99 {summary['p99_ms']:8.2f} ms  errors {sum(errors)}"
+        )
@@ -0,0 +1,23 @@
+# cart/management/commands/reap_carts.py
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from cart.reaper import reap_abandoned_carts
+
+
+class Command(BaseCommand):
+    help = 'Empty carts idle longer than the reservation TTL and release their stock.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, help='Idle seconds before a cart is reaped '
+                                                    '(default: settings.CART_RESERVATION_TTL).')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        ttl = timedelta(seconds=options['ttl']) if options['ttl'] is not None else None
+        result = reap_abandoned_carts(ttl, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Reaped {result.carts} carts: {result.lines} lines, {result.units} units released '
+            f'in {result.seconds:.3f}s.'
+        ))
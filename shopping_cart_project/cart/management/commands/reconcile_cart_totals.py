@@ -0,0 +1,53 @@
+# cart/management/commands/reconcile_cart_totals.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from cart.models import Cart, CartItem
+from cart.pricing import CART_LINE_FIELDS, cart_totals
+from cart.totals import TOTAL_FIELDS, empty_totals
+
+
+class Command(BaseCommand):
+    help = 'Recompute cart totals from their lines and report (or fix) any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Write the recomputed totals back.')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = drifted = 0
+        last_id = 0
+        while True:
+            # Lock the batch so an add_item increment can't land between
+            # reading the lines and writing absolute totals back.
+            with transaction.atomic():
+                carts = list(Cart.objects.select_for_update().filter(pk__gt=last_id).order_by('pk')
+                             .only('pk', *TOTAL_FIELDS)[:batch_size])
+                if not carts:
+                    break
+                last_id = carts[-1].pk
+
+                lines = CartItem.objects.filter(cart_id__in=[cart.pk for cart in carts]).values_list(*CART_LINE_FIELDS)
+                expected = cart_totals(lines)
+
+                stale = []
+                for cart in carts:
+                    totals = expected.get(cart.pk) or empty_totals()
+                    diff = {name: (getattr(cart, name), value) for name, value in totals.items()
+                            if getattr(cart, name) != value}
+                    if diff:
+                        self.stdout.write(f'cart {cart.pk}: ' + ', '.join(
+                            f'{name} {stored} != {value}' for name, (stored, value) in diff.items()
+                        ))
+                        for name, value in totals.items():
+                            setattr(cart, name, value)
+                        stale.append(cart)
+                checked += len(carts)
+                drifted += len(stale)
+
+                if options['fix'] and stale:
+                    Cart.objects.bulk_update(stale, TOTAL_FIELDS)
+
+        action = 'fixed' if options['fix'] else 'found'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} carts, {action} {drifted} with drift.'))
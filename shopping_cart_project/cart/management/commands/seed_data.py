@@ -0,0 +1,45 @@
+# cart/management/commands/seed_data.py
+
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from cart.benchmarks import seed_catalog, seed_shoppers
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a realistic synthetic shop: departments, locations, products, '
+            'users, open carts and order history, using bulk inserts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--departments', type=int, default=10)
+        parser.add_argument('--locations', type=int, default=5)
+        parser.add_argument('--products', type=int, default=10000)
+        parser.add_argument('--carts', type=int, default=300, help='Users that get an open cart.')
+        parser.add_argument('--orders', type=int, default=5000)
+        parser.add_argument('--lines', type=int, default=5, help='Most lines per cart or order.')
+        parser.add_argument('--days', type=int, default=30, help='Spread orders over this many days.')
+        parser.add_argument('--password', default='bench-password', help='Password for every seeded user.')
+        parser.add_argument('--prefix', default='shopper', help='Username prefix.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+
+    def handle(self, *args, **options):
+        if options['carts'] > options['users']:
+            raise CommandError('--carts cannot exceed --users.')
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(f"Users named {options['prefix']}* already exist; pass another --prefix.")
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            seed_catalog(options['products'], options['departments'], options['locations'], seed=options['seed'])
+            seed_shoppers(
+                options['users'], carts=options['carts'], orders=options['orders'], lines=options['lines'],
+                days=options['days'], seed=options['seed'], password=options['password'],
+                prefix=options['prefix'],
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {options['products']} products, {options['users']} users, {options['carts']} carts and "
+            f"{options['orders']} orders in {time.perf_counter() - started:.1f}s."
+        ))
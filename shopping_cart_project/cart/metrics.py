@@ -0,0 +1,208 @@
+# cart/metrics.py
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Upper bounds in seconds for request latency and in bytes for responses.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """
+    In-process metrics, exported in the Prometheus text format. Each worker
+    process keeps its own; scrape them per process or aggregate upstream.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.help = {}
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def render(self):
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        lines = []
+        described = set()
+
+        def header(name):
+            if name not in described and name in self.help:
+                kind, text = self.help[name]
+                lines.append(f'# HELP {name} {text}')
+                lines.append(f'# TYPE {name} {kind}')
+            described.add(name)
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f'{name}{format_labels(labels)} {value:g}')
+        for (name, labels), histogram in histograms:
+            header(name)
+            cumulative = 0
+            bounds = [f'{bound:g}' for bound in histogram.buckets] + ['+Inf']
+            for bound, count in zip(bounds, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels((*labels, ("le", bound)))} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum:g}')
+            lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in labels
+    ) + '}'
+
+
+registry = Registry()
+registry.describe('http_request_duration_seconds', 'histogram', 'Request latency by route.')
+registry.describe('http_response_size_bytes', 'histogram', 'Response body size by route.')
+registry.describe('http_requests_total', 'counter', 'Requests by route, method and status.')
+registry.describe('db_queries_total', 'counter', 'Database queries run while serving a route.')
+registry.describe('db_query_seconds_total', 'counter', 'Time spent in the database while serving a route.')
+registry.describe('cart_reaper_runs_total', 'counter', 'Abandoned-cart reaper runs.')
+registry.describe('cart_reaper_carts_total', 'counter', 'Carts emptied by the reaper.')
+registry.describe('cart_reaper_released_units_total', 'counter', 'Units returned to stock by the reaper.')
+registry.describe('cart_reaper_seconds_total', 'counter', 'Time spent reaping carts.')
+
+
+class QueryTimer:
+    """connection.execute_wrapper() hook counting queries and their time."""
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+_request_timer = ContextVar('request_query_timer', default=None)
+
+
+def time_queries(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection by cart.signals. Async
+    views run their queries on another thread's connection, so the request's
+    QueryTimer travels in a ContextVar rather than connection.execute_wrapper().
+    """
+    timer = _request_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """
+    Records latency, response size and ORM cost per route into `registry`,
+    and with METRICS_SERVER_TIMING reports them back in a Server-Timing
+    header. Routes are labelled by URL name, so /api/products/1/ and
+    /api/products/2/ share a series. Runs sync or async, whichever the rest
+    of the stack is, so ASGI requests are not pushed onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timer = QueryTimer()
+        token = _request_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_timer.reset(token)
+        return self.record(request, response, timer, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        token = _request_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_timer.reset(token)
+        return self.record(request, response, timer, time.perf_counter() - started)
+
+    def record(self, request, response, timer, elapsed):
+
+        match = request.resolver_match
+        route = match.view_name if match is not None else '<unmatched>'
+        labels = (('route', route),)
+        registry.observe('http_request_duration_seconds', labels, elapsed, LATENCY_BUCKETS)
+        registry.inc('http_requests_total', (*labels, ('method', request.method), ('status', response.status_code)))
+        registry.inc('db_queries_total', labels, timer.count)
+        registry.inc('db_query_seconds_total', labels, timer.seconds)
+        if not response.streaming:
+            registry.observe('http_response_size_bytes', labels, len(response.content), SIZE_BUCKETS)
+
+        if getattr(settings, 'METRICS_SERVER_TIMING', False):
+            response['Server-Timing'] = (
+                f'app;dur={elapsed * 1000:.2f}, db;dur={timer.seconds * 1000:.2f};desc="{timer.count} queries"'
+            )
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, open to METRICS_ALLOWED_IPS only."""
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
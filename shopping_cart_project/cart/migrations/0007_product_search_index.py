@@ -0,0 +1,66 @@
+from django.db import migrations
+
+# Copied rather than imported from cart.search, so that this migration keeps
+# doing what it did when it was written.
+SQLITE_FTS_SQL = [
+    "DROP TRIGGER IF EXISTS cart_product_fts_ai",
+    "DROP TRIGGER IF EXISTS cart_product_fts_ad",
+    "DROP TRIGGER IF EXISTS cart_product_fts_au",
+    "DROP TABLE IF EXISTS cart_product_fts",
+    """CREATE VIRTUAL TABLE cart_product_fts USING fts5(
+        name, description, barcode,
+        content='cart_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER cart_product_fts_ai AFTER INSERT ON cart_product BEGIN
+        INSERT INTO cart_product_fts(rowid, name, description, barcode)
+        VALUES (new.id, new.name, new.description, new.barcode);
+    END""",
+    """CREATE TRIGGER cart_product_fts_ad AFTER DELETE ON cart_product BEGIN
+        INSERT INTO cart_product_fts(cart_product_fts, rowid, name, description, barcode)
+        VALUES ('delete', old.id, old.name, old.description, old.barcode);
+    END""",
+    """CREATE TRIGGER cart_product_fts_au AFTER UPDATE OF name, description, barcode ON cart_product BEGIN
+        INSERT INTO cart_product_fts(cart_product_fts, rowid, name, description, barcode)
+        VALUES ('delete', old.id, old.name, old.description, old.barcode);
+        INSERT INTO cart_product_fts(rowid, name, description, barcode)
+        VALUES (new.id, new.name, new.description, new.barcode);
+    END""",
+    "INSERT INTO cart_product_fts(cart_product_fts) VALUES ('rebuild')",
+]
+
+# PostgresSearchBackend.document without the table prefix; the two must
+# match for the planner to use the index.
+POSTGRES_SEARCH_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS cart_product_search_idx ON cart_product USING GIN ("
+    "to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, '') || ' ' || coalesce(barcode, '')))"
+)
+
+
+def install_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_FTS_SQL:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_SEARCH_INDEX_SQL)
+
+
+def remove_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_FTS_SQL[:4]:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS cart_product_search_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0006_product_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, remove_search_index),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.14 on 2026-10-18 11:07
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import migrations, models
+
+CENT = Decimal('0.01')
+
+
+def backfill_cart_totals(apps, schema_editor):
+    # Flat settings.TAX_RATE, rounded per line, as cart totals were priced
+    # when this migration was written.
+    Cart = apps.get_model('cart', 'Cart')
+    CartItem = apps.get_model('cart', 'CartItem')
+    rows = CartItem.objects.values_list(
+        'cart_id', 'product__price', 'quantity', 'product__department__is_taxable'
+    ).order_by('cart_id').iterator(chunk_size=2000)
+    carts = {}
+    for cart_id, price, quantity, is_taxable in rows:
+        subtotal = price * quantity
+        tax = Decimal('0.00')
+        if is_taxable:
+            tax = (subtotal * settings.TAX_RATE).quantize(CENT, rounding=ROUND_HALF_UP)
+        cart = carts.setdefault(cart_id, Cart(pk=cart_id, subtotal=0, tax=0, total=0, item_count=0))
+        cart.subtotal += subtotal
+        cart.tax += tax
+        cart.total += subtotal + tax
+        cart.item_count += quantity
+    Cart.objects.bulk_update(list(carts.values()), ['subtotal', 'tax', 'total', 'item_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0007_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='tax',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_cart_totals, migrations.RunPython.noop),
+    ]
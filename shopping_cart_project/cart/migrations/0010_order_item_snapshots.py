@@ -0,0 +1,60 @@
+# Generated by Django 4.2.14 on 2026-10-18 11:19
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.db import migrations, models
+
+CENT = Decimal('0.01')
+
+
+def backfill_order_item_snapshots(apps, schema_editor):
+    # Orders placed before snapshots existed take the product's current
+    # name, barcode and cost; tax is recomputed from the price paid at the
+    # flat settings.TAX_RATE.
+    OrderItem = apps.get_model('cart', 'OrderItem')
+    rows = OrderItem.objects.values_list(
+        'id', 'price', 'quantity', 'product__name', 'product__barcode', 'product__cost',
+        'product__department__is_taxable',
+    ).order_by('id').iterator(chunk_size=2000)
+    batch = []
+    for pk, price, quantity, name, barcode, cost, is_taxable in rows:
+        tax = Decimal('0.00')
+        if is_taxable:
+            tax = (price * quantity * settings.TAX_RATE).quantize(CENT, rounding=ROUND_HALF_UP)
+        batch.append(OrderItem(pk=pk, product_name=name, barcode=barcode, cost=cost, tax=tax))
+        if len(batch) >= 500:
+            OrderItem.objects.bulk_update(batch, ['product_name', 'barcode', 'cost', 'tax'])
+            batch = []
+    OrderItem.objects.bulk_update(batch, ['product_name', 'barcode', 'cost', 'tax'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0009_order_user_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='barcode',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='product_name',
+            field=models.CharField(default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='tax',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_order_item_snapshots, migrations.RunPython.noop),
+    ]
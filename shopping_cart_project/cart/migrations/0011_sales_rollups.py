@@ -0,0 +1,72 @@
+# Generated by Django 4.2.14 on 2026-10-18 11:21
+
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+LINE_AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+
+
+def backfill_sales_rollups(apps, schema_editor):
+    # The aggregation is cart.reports.rebuild_rollups() as of this
+    # migration, copied so that later changes there don't rewrite it.
+    OrderItem = apps.get_model('cart', 'OrderItem')
+    Product = apps.get_model('cart', 'Product')
+    SalesRollup = apps.get_model('cart', 'SalesRollup')
+    products = Product.objects.filter(pk=OuterRef('product_id'))
+    OrderItem.objects.update(
+        department_id=Subquery(products.values('department_id')[:1]),
+        location_id=Subquery(products.values('location_id')[:1]),
+    )
+    rows = OrderItem.objects.filter(department__isnull=False, location__isnull=False).annotate(
+        day=TruncDate('order__created_at')
+    ).values('day', 'department_id', 'location_id').annotate(
+        units=Sum('quantity'),
+        revenue=Sum(ExpressionWrapper(F('price') * F('quantity'), output_field=LINE_AMOUNT)),
+        total_tax=Sum('tax'),
+        total_cost=Sum(ExpressionWrapper(F('cost') * F('quantity'), output_field=LINE_AMOUNT)),
+    ).order_by('day', 'department_id', 'location_id')
+    SalesRollup.objects.bulk_create([
+        SalesRollup(day=row['day'], department_id=row['department_id'], location_id=row['location_id'],
+                    units=row['units'], revenue=row['revenue'], tax=row['total_tax'], cost=row['total_cost'])
+        for row in rows.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0010_order_item_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='department',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='cart.department'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='cart.location'),
+        ),
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units', models.PositiveBigIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('tax', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cost', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cart.department')),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cart.location')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='salesrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'department', 'location'), name='sales_rollup_key'),
+        ),
+        migrations.RunPython(backfill_sales_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.14 on 2026-10-18 11:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def open_checkpoints(apps, schema_editor):
+    # Existing stock becomes each product's opening balance.
+    Product = apps.get_model('cart', 'Product')
+    InventoryCheckpoint = apps.get_model('cart', 'InventoryCheckpoint')
+    checkpoints = [
+        InventoryCheckpoint(product_id=pk, balance=on_hand, watermark=0)
+        for pk, on_hand in Product.objects.values_list('id', 'on_hand').iterator()
+    ]
+    InventoryCheckpoint.objects.bulk_create(checkpoints, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0011_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryCheckpoint',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='inventory_checkpoint', serialize=False, to='cart.product')),
+                ('balance', models.IntegerField(default=0)),
+                ('watermark', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InventoryMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('reason', models.CharField(choices=[('reserve', 'Cart reserve'), ('release', 'Cart release'), ('restock', 'Restock'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='cart.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'id'], name='inventory_mv_product_id_idx')],
+            },
+        ),
+        migrations.RunPython(open_checkpoints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.14 on 2026-10-18 11:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0013_cart_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rate', models.DecimalField(decimal_places=4, max_digits=6)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cart.department')),
+                ('location', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cart.location')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='taxrate',
+            constraint=models.UniqueConstraint(condition=models.Q(('department__isnull', False), ('location__isnull', False)), fields=('location', 'department'), name='tax_rate_location_department'),
+        ),
+        migrations.AddConstraint(
+            model_name='taxrate',
+            constraint=models.UniqueConstraint(condition=models.Q(('department__isnull', True)), fields=('location',), name='tax_rate_location'),
+        ),
+        migrations.AddConstraint(
+            model_name='taxrate',
+            constraint=models.UniqueConstraint(condition=models.Q(('location__isnull', True)), fields=('department',), name='tax_rate_department'),
+        ),
+        migrations.AddConstraint(
+            model_name='taxrate',
+            constraint=models.CheckConstraint(check=models.Q(('location__isnull', False), ('department__isnull', False), _connector='OR'), name='tax_rate_has_scope'),
+        ),
+    ]
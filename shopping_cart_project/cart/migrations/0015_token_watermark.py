@@ -0,0 +1,20 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0014_tax_rates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenWatermark',
+            fields=[
+                ('user_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('changed_at', models.BigIntegerField()),
+            ],
+        ),
+    ]
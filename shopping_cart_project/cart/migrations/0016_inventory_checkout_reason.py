@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-18 12:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0015_token_watermark'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inventorymovement',
+            name='reason',
+            field=models.CharField(choices=[('reserve', 'Cart reserve'), ('release', 'Cart release'), ('checkout', 'Checkout'), ('restock', 'Restock'), ('adjustment', 'Adjustment')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# cart/mixins.py
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+from .cache import CATALOG_VERSION_KEY, catalog_versions
+
+
+class CachedCatalogMixin:
+    """
+    Serve list/retrieve from the cache, keyed by the full query string and
+    the catalog versions in `catalog_version_keys`, which the
+    Product/Department/Location signals bump.
+
+    The ETag is derived from that key alone, so a matching If-None-Match is
+    answered with 304 before any query or serialization. Last-Modified comes
+    from the rows' updated_at and is informational: stock moves do not touch
+    updated_at, so If-Modified-Since is not used to answer 304.
+
+    A CATALOG_CACHE_TIMEOUT of 0 turns all of this off.
+    """
+    catalog_cache_prefix = 'catalog'
+    catalog_version_keys = (CATALOG_VERSION_KEY,)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_catalog_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_catalog_response(super().retrieve, request, *args, **kwargs)
+
+    def catalog_cache_key(self, request):
+        parts = [
+            request.path,
+            '&'.join(sorted(request.GET.urlencode().split('&'))),
+            request.accepted_renderer.format,
+        ]
+        digest = hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+        version = '-'.join(map(str, catalog_versions(self.catalog_version_keys)))
+        return f'{self.catalog_cache_prefix}:{version}:{digest}'
+
+    def cached_catalog_response(self, handler, request, *args, **kwargs):
+        timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600)
+        if not timeout:
+            return handler(request, *args, **kwargs)
+        key = self.catalog_cache_key(request)
+        etag = '"%s"' % key.split(':', 1)[1].replace(':', '-')
+        if self.etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        entry = cache.get(key)
+        if entry is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = {'data': response.data, 'last_modified': self.last_modified(response.data)}
+            cache.set(key, entry, timeout)
+
+        headers = {'ETag': etag}
+        if entry['last_modified']:
+            headers['Last-Modified'] = http_date(entry['last_modified'].timestamp())
+        return Response(entry['data'], headers=headers)
+
+    @staticmethod
+    def etag_matches(request, etag):
+        header = request.META.get('HTTP_IF_NONE_MATCH')
+        if not header:
+            return False
+        candidates = [candidate.strip() for candidate in header.split(',')]
+        return any(candidate.removeprefix('W/') == etag for candidate in candidates)
+
+    @staticmethod
+    def last_modified(data):
+        rows = data.get('results', [data]) if isinstance(data, dict) else data
+        stamps = [parse_datetime(row['updated_at']) for row in rows
+                  if isinstance(row, dict) and row.get('updated_at')]
+        return max(stamps, default=None)
+
+
+class FastListMixin:
+    """
+    Render `list` through `read_serializer_class`, a CompiledSerializer that
+    builds the same JSON straight from `.values()` rows. Views opt in by
+    setting the attribute; leaving it as None keeps the regular serializer.
+    """
+    read_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        if self.read_serializer_class is None:
+            return super().list(request, *args, **kwargs)
+        read_serializer = self.read_serializer_class(context=self.get_serializer_context())
+        rows = read_serializer.values(self.filter_queryset(self.get_queryset()))
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(read_serializer.many_from_values(page))
+        return Response(read_serializer.many_from_values(rows))
@@ -1,9 +1,46 @@
 # cart/models.py
-from django.db import models
-from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from decimal import Decimal
+from django.utils import timezone
+from .cache import invalidate_products
+from .pricing import CART_LINE_FIELDS, cart_totals, item_row, price_lines
+from .totals import empty_totals
+
+
+class TracksPricing:
+    """
+    Remembers the `pricing_fields` (attnames) an instance was loaded with,
+    so a save that changes what its cart lines cost can reprice open carts.
+    """
+    pricing_fields = ()
+    _loaded_pricing = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_pricing()
+        return instance
+
+    def _pricing(self):
+        # to_python(), since unsaved values may still be the str or int assigned.
+        return {name: self._meta.get_field(name).to_python(self.__dict__[name])
+                for name in self.pricing_fields if name in self.__dict__}
+
+    def remember_pricing(self):
+        self._loaded_pricing = self._pricing()
+
+    def pricing_changed(self, update_fields=None):
+        if update_fields is not None:
+            written = {self._meta.get_field(name).attname for name in update_fields}
+            if written.isdisjoint(self.pricing_fields):
+                return False
+        loaded = self._loaded_pricing
+        if loaded is None:
+            return True
+        return any(name not in loaded or value != loaded[name] for name, value in self._pricing().items())
+
 
 class Location(models.Model):
     name = models.CharField(max_length=200)
@@ -13,16 +50,18 @@ class Location(models.Model):
         return self.name
 
 
-class Department(models.Model):
+class Department(TracksPricing, models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     is_taxable = models.BooleanField(default=True)
 
+    pricing_fields = ('is_taxable',)
+
     def __str__(self):
         return self.name
 
 
-class Product(models.Model):
+class Product(TracksPricing, models.Model):
     name = models.CharField(max_length=200)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     description = models.TextField(blank=True)
@@ -36,27 +75,185 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Shaped after ProductFilter, barcode scans and created_at ordering.
+        indexes = [
+            models.Index(fields=['is_available', 'department', 'price'], name='product_avail_dept_price_idx'),
+            models.Index(fields=['is_available', 'location', 'price'], name='product_avail_loc_price_idx'),
+            models.Index(fields=['barcode'], name='product_barcode_idx'),
+            models.Index(fields=['created_at'], name='product_created_at_idx'),
+        ]
+
+    pricing_fields = ('price', 'location_id', 'department_id')
+
+    # Barcode as loaded from the database, so a rename can evict the old
+    # barcode from the lookup cache.
+    _loaded_barcode = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_barcode = instance.__dict__.get('barcode')
+        return instance
+
     def __str__(self):
         return self.name
 
-    def update_inventory(self, quantity):
-        if self.on_hand + quantity < 0:
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        stock_written = update_fields is None or 'on_hand' in update_fields
+        with transaction.atomic(savepoint=False):
+            # save() writes on_hand as an absolute value, so the movement is
+            # measured against the locked row rather than what was loaded,
+            # which reservations may have moved since.
+            current = None
+            if stock_written and not adding:
+                current = Product.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'on_hand', flat=True).first()
+            super().save(*args, **kwargs)
+            if not stock_written:
+                return
+            if current is None:
+                change, reason = self.on_hand, InventoryMovement.RESTOCK
+            else:
+                change, reason = self.on_hand - current, InventoryMovement.ADJUSTMENT
+            if change:
+                InventoryMovement.objects.create(product=self, quantity=change, reason=reason)
+
+    def update_inventory(self, quantity, reason=None, reference=''):
+        # Apply the change as one conditional UPDATE so concurrent reservations
+        # can't both pass the stock check, and only on_hand is written; the
+        # ledger row goes in the same transaction.
+        products = Product.objects.filter(pk=self.pk)
+        if quantity < 0:
+            products = products.filter(on_hand__gte=-quantity)
+        with transaction.atomic(savepoint=False):
+            updated = products.update(on_hand=F('on_hand') + quantity)
+            if updated:
+                InventoryMovement.objects.create(
+                    product_id=self.pk, quantity=quantity, reference=reference,
+                    reason=reason or InventoryMovement.ADJUSTMENT,
+                )
+        if not updated:
+            self.refresh_from_db(fields=['on_hand'])
             raise ValidationError(f"Not enough inventory. Only {self.on_hand} available.")
         self.on_hand += quantity
-        self.save()
+        invalidate_products(pks=[self.pk])
+
+
+class InventoryMovement(models.Model):
+    """
+    Append-only record of every change to Product.on_hand. on_hand stays the
+    live balance that reservations are checked against; the ledger explains
+    it, and InventoryCheckpoint folds old movements into a running total.
+    """
+    RESERVE = 'reserve'
+    RELEASE = 'release'
+    CHECKOUT = 'checkout'
+    RESTOCK = 'restock'
+    ADJUSTMENT = 'adjustment'
+    REASON_CHOICES = (
+        (RESERVE, 'Cart reserve'),
+        (RELEASE, 'Cart release'),
+        (CHECKOUT, 'Checkout'),
+        (RESTOCK, 'Restock'),
+        (ADJUSTMENT, 'Adjustment'),
+    )
+
+    product = models.ForeignKey(Product, related_name='movements', on_delete=models.CASCADE)
+    quantity = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    reference = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Balances sum a product's movements past its checkpoint.
+            models.Index(fields=['product', 'id'], name='inventory_mv_product_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity:+d} {self.product_id} ({self.reason})"
+
+
+class InventoryCheckpoint(models.Model):
+    """Ledger balance of a product up to and including movement `watermark`."""
+    product = models.OneToOneField(Product, primary_key=True, related_name='inventory_checkpoint',
+                                   on_delete=models.CASCADE)
+    balance = models.IntegerField(default=0)
+    watermark = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.product_id}: {self.balance} through movement {self.watermark}"
+
+
+class TaxRate(models.Model):
+    """
+    A tax rate for a location, a department, or the two together; leave one
+    blank to cover every value of it. Lines not matched by any row are taxed
+    at settings.TAX_RATE. See cart.pricing for how rows are chosen.
+    """
+    location = models.ForeignKey(Location, null=True, blank=True, related_name='+', on_delete=models.CASCADE)
+    department = models.ForeignKey(Department, null=True, blank=True, related_name='+', on_delete=models.CASCADE)
+    rate = models.DecimalField(max_digits=6, decimal_places=4)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # NULLs never collide in a plain unique index, hence one per scope.
+        constraints = [
+            models.UniqueConstraint(fields=['location', 'department'], name='tax_rate_location_department',
+                                    condition=models.Q(location__isnull=False, department__isnull=False)),
+            models.UniqueConstraint(fields=['location'], name='tax_rate_location',
+                                    condition=models.Q(department__isnull=True)),
+            models.UniqueConstraint(fields=['department'], name='tax_rate_department',
+                                    condition=models.Q(location__isnull=True)),
+            models.CheckConstraint(check=models.Q(location__isnull=False) | models.Q(department__isnull=False),
+                                   name='tax_rate_has_scope'),
+        ]
+
+    def __str__(self):
+        scope = ' / '.join(str(part) for part in (self.location, self.department) if part is not None)
+        return f"{scope}: {self.rate}"
 
 
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
+    # Maintained incrementally by CartItem.save()/delete() and the bulk paths;
+    # `manage.py reconcile_cart_totals` recomputes them from the lines.
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    tax = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # The reaper looks for carts idle past the reservation TTL.
+        indexes = [models.Index(fields=['updated_at'], name='cart_updated_at_idx')]
+
     def __str__(self):
         return f"Cart for {self.user.username}"
 
-    @property
-    def total(self):
-        return sum(item.subtotal for item in self.items.all())
+    @classmethod
+    def adjust_totals(cls, cart_id, subtotal, tax, item_count):
+        cls.objects.filter(pk=cart_id).update(
+            subtotal=F('subtotal') + subtotal,
+            tax=F('tax') + tax,
+            total=F('total') + subtotal + tax,
+            item_count=F('item_count') + item_count,
+            updated_at=timezone.now(),
+        )
+
+    def computed_totals(self):
+        return cart_totals(self.items.values_list(*CART_LINE_FIELDS)).get(self.pk) or empty_totals()
+
+    def recalculate(self):
+        totals = self.computed_totals()
+        for name, value in totals.items():
+            setattr(self, name, value)
+        Cart.objects.filter(pk=self.pk).update(**totals)
 
 
 class CartItem(models.Model):
@@ -69,36 +266,81 @@ class CartItem(models.Model):
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
+    # (quantity, amounts) from the last pricing of this line, so the three
+    # properties below cost one computation between them.
+    _priced = None
+
+    def prime_amounts(self, amounts):
+        self._priced = (self.quantity, amounts)
+
+    def amounts(self, quantity=None):
+        quantity = self.quantity if quantity is None else quantity
+        priced = self._priced
+        if priced is not None and priced[0] == quantity:
+            return priced[1]
+        price, _, *place = item_row(self)
+        amounts = price_lines([(price, quantity, *place)])[0]
+        if quantity == self.quantity:
+            self._priced = (quantity, amounts)
+        return amounts
+
     @property
     def subtotal(self):
-        return self.product.price * self.quantity
+        return self.amounts()[0]
 
     @property
     def tax(self):
-        if self.product.department.is_taxable:
-            return self.subtotal * settings.TAX_RATE
-        return Decimal('0.00')
+        return self.amounts()[1]
 
     @property
     def total_price(self):
-        return self.subtotal + self.tax
-    
+        return sum(self.amounts())
+
+
+    # Quantity as last read from or written to the database, so save() can
+    # reserve just the difference without re-reading the row.
+    _saved_quantity = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_quantity = instance.__dict__.get('quantity')
+        return instance
+
+    def _persisted_quantity(self):
+        if self._state.adding:
+            return 0
+        if self._saved_quantity is None:
+            return CartItem.objects.filter(pk=self.pk).values_list('quantity', flat=True).get()
+        return self._saved_quantity
+
+    def _adjust_cart_totals(self, old_quantity, new_quantity):
+        old_subtotal, old_tax = self.amounts(old_quantity)
+        new_subtotal, new_tax = self.amounts(new_quantity)
+        Cart.adjust_totals(self.cart_id, new_subtotal - old_subtotal, new_tax - old_tax,
+                           new_quantity - old_quantity)
+
     def save(self, *args, **kwargs):
-        if self.pk:
-            old_quantity = CartItem.objects.get(pk=self.pk).quantity
-            quantity_change = self.quantity - old_quantity
-        else:
-            quantity_change = self.quantity
-
-        try:
-            self.product.update_inventory(-quantity_change)
+        old_quantity = self._persisted_quantity()
+        quantity_change = self.quantity - old_quantity
+        with transaction.atomic():
+            if quantity_change:
+                self.product.update_inventory(
+                    -quantity_change,
+                    InventoryMovement.RESERVE if quantity_change > 0 else InventoryMovement.RELEASE,
+                    f'cart:{self.cart_id}',
+                )
             super().save(*args, **kwargs)
-        except ValidationError as e:
-            raise ValidationError(str(e))
+            if quantity_change:
+                self._adjust_cart_totals(old_quantity, self.quantity)
+        self._saved_quantity = self.quantity
 
     def delete(self, *args, **kwargs):
-        self.product.update_inventory(self.quantity)
-        super().delete(*args, **kwargs)
+        quantity = self._persisted_quantity()
+        with transaction.atomic():
+            self.product.update_inventory(quantity, InventoryMovement.RELEASE, f'cart:{self.cart_id}')
+            self._adjust_cart_totals(quantity, 0)
+            return super().delete(*args, **kwargs)
 
 
 class Order(models.Model):
@@ -116,6 +358,12 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Order history pages by (created_at, id) within one user.
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='order_user_created_at_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} - {self.user.username}"
 
@@ -125,6 +373,50 @@ class OrderItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)  # Price at the time of purchase
+    # Also as of checkout, so order reads never depend on the live Product.
+    product_name = models.CharField(max_length=200, default='')
+    barcode = models.CharField(max_length=100, blank=True, default='')
+    tax = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    department = models.ForeignKey(Department, null=True, blank=True, on_delete=models.SET_NULL,
+                                   related_name='+')
+    location = models.ForeignKey(Location, null=True, blank=True, on_delete=models.SET_NULL,
+                                 related_name='+')
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_name} in Order {self.order_id}"
+
+
+class SalesRollup(models.Model):
+    """
+    Sales per day, department and location, added to at checkout by
+    cart.reports.record_sales() and rebuilt from OrderItem by
+    `manage.py rebuild_sales_rollups`. Reports read only this table.
+    """
+    day = models.DateField()
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='+')
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='+')
+    units = models.PositiveBigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tax = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'department', 'location'], name='sales_rollup_key'),
+        ]
+
+    def __str__(self):
+        return f"Sales on {self.day} for department {self.department_id} at location {self.location_id}"
+
+class TokenWatermark(models.Model):
+    """
+    JWTs issued before `changed_at` (a Unix timestamp) no longer vouch for
+    their username/is_staff/is_active claims. Kept without a foreign key so
+    the watermark outlives a deleted user's tokens.
+    """
+    user_id = models.BigIntegerField(primary_key=True)
+    changed_at = models.BigIntegerField()
 
     def __str__(self):
-        return f"{self.quantity} x {self.product.name} in Order {self.order.id}"
\ No newline at end of file
+        return f"Tokens of user {self.user_id} issued before {self.changed_at}"
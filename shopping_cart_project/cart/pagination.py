@@ -0,0 +1,170 @@
+# cart/pagination.py
+
+import json
+from base64 import b64decode, b64encode
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class ProductPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pages by the values of the last row seen instead of an OFFSET, so deep
+    pages cost the same as the first one and no COUNT(*) is issued.
+
+    The queryset's own ordering (e.g. from OrderingFilter) is honoured and
+    `tiebreaker` is appended to make it total.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    default_ordering = ('id',)
+    tiebreaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        values, reverse = self.decode_cursor(request)
+
+        ordering = [self.invert(field) for field in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.after(ordering, values))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = values is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_ordering(self, queryset):
+        ordering = [field for field in queryset.query.order_by if isinstance(field, str)]
+        ordering = ordering or list(self.default_ordering)
+        if not any(field.lstrip('-') in (self.tiebreaker, 'pk') for field in ordering):
+            descending = ordering[-1].startswith('-')
+            ordering.append(f'-{self.tiebreaker}' if descending else self.tiebreaker)
+        return ordering
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def after(ordering, values):
+        # (a, b, c) > (x, y, z) spelled out per column, honouring each direction.
+        condition = Q()
+        for position, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[position]})
+            for previous, value in zip(ordering[:position], values):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.link(self.page[0], reverse=True)
+
+    def link(self, row, reverse):
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(row, reverse))
+
+    def encode_cursor(self, row, reverse=False):
+        # Rows may be model instances or .values() dicts.
+        get = row.__getitem__ if isinstance(row, dict) else row.__getattribute__
+        values = [self.encode_value(get(field.lstrip('-'))) for field in self.ordering]
+        token = json.dumps({'v': values, 'r': reverse}, separators=(',', ':'))
+        return b64encode(token.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+        try:
+            token = json.loads(b64decode(encoded.encode('ascii')).decode('ascii'))
+            values, reverse = token['v'], bool(token['r'])
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    @staticmethod
+    def encode_value(value):
+        # Full precision: DjangoJSONEncoder would truncate datetimes to
+        # milliseconds and break equality on the tiebreak step.
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+
+class ProductKeysetPagination(KeysetPagination):
+    page_size = 20
+    max_page_size = 100
+
+
+class OrderPagination(KeysetPagination):
+    # Newest first; served by the (user, created_at) index.
+    default_ordering = ('-created_at',)
+    page_size = 20
+    max_page_size = 100
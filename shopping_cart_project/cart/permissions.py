@@ -10,4 +10,5 @@ class IsAdminOrReadOnly(permissions.BasePermission):
 
 class IsOwnerOrAdmin(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.user == request.user or request.user.is_staff
\ No newline at end of file
+        # Compare ids so the owner is never loaded just for this check.
+        return obj.user_id == request.user.pk or request.user.is_staff
\ No newline at end of file
@@ -0,0 +1,199 @@
+# cart/pricing.py
+
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from .totals import CENT, empty_totals
+
+ZERO = Decimal('0.00')
+RATES_VERSION_KEY = 'pricing:rates-version'
+
+
+class RateTable:
+    """
+    Tax rates by (location_id, department_id). The most specific entry
+    wins: location and department, then location alone, then department
+    alone, then `default`. Non-taxable departments are never taxed.
+    """
+
+    def __init__(self, default, rates=()):
+        self.default = Decimal(default)
+        self.rates = {(location_id, department_id): Decimal(rate) for location_id, department_id, rate in rates}
+        self._resolved = {}
+
+    def rate(self, location_id, department_id, is_taxable=True):
+        if not is_taxable:
+            return ZERO
+        key = (location_id, department_id)
+        rate = self._resolved.get(key)
+        if rate is None:
+            for candidate in (key, (location_id, None), (None, department_id)):
+                if candidate in self.rates:
+                    rate = self.rates[candidate]
+                    break
+            else:
+                rate = self.default
+            self._resolved[key] = rate
+        return rate
+
+
+_lock = threading.Lock()
+_table = None
+_version = None
+_checked_at = 0.0
+
+
+def load_rate_table():
+    TaxRate = apps.get_model('cart', 'TaxRate')
+    return RateTable(settings.TAX_RATE, TaxRate.objects.values_list('location_id', 'department_id', 'rate'))
+
+
+def rates_version():
+    """
+    Fingerprint of the TaxRate rows: how many there are and the latest
+    updated_at. Every save() and delete() changes it, and because it comes
+    from the table, a process whose cache never saw a change still finds it.
+    """
+    TaxRate = apps.get_model('cart', 'TaxRate')
+    stats = TaxRate.objects.aggregate(count=Count('id'), latest=Max('updated_at'))
+    return f"{stats['count']}:{stats['latest'].isoformat() if stats['latest'] else ''}"
+
+
+def _version_timeout():
+    return getattr(settings, 'TAX_RATE_VERSION_TIMEOUT', 60)
+
+
+def rate_table():
+    """
+    The process-wide RateTable. It is loaded once and reloaded when the
+    version changes. The version is checked at most every
+    TAX_RATE_CHECK_INTERVAL seconds, from the cache, which recomputes it
+    from the database at least every TAX_RATE_VERSION_TIMEOUT seconds.
+    """
+    global _table, _version, _checked_at
+    now = time.monotonic()
+    if _table is not None and now - _checked_at < getattr(settings, 'TAX_RATE_CHECK_INTERVAL', 5):
+        return _table
+    with _lock:
+        version = cache.get(RATES_VERSION_KEY)
+        if version is None:
+            version = rates_version()
+            cache.set(RATES_VERSION_KEY, version, _version_timeout())
+        # Read after the version, so the rows are never older than it says.
+        if _table is None or version != _version:
+            _table, _version = load_rate_table(), version
+        _checked_at = now
+        return _table
+
+
+def invalidate_rates():
+    """
+    Publish a rate change and drop this process's table. Run it after the
+    change commits (the TaxRate signals use transaction.on_commit), or
+    another process can load the old rows under the new version.
+    """
+    global _table
+    cache.set(RATES_VERSION_KEY, rates_version(), _version_timeout())
+    with _lock:
+        _table = None
+
+
+def price_lines(rows, table=None):
+    """
+    [(subtotal, tax)] for (price, quantity, is_taxable, location_id,
+    department_id) rows, in one pass. Tax is rounded half-up to the cent
+    per line, so stored cart totals can be adjusted line by line and still
+    equal a full recomputation.
+    """
+    rate_for = (table or rate_table()).rate
+    quantize = Decimal.quantize
+    results = []
+    append = results.append
+    for price, quantity, is_taxable, location_id, department_id in rows:
+        if type(price) is not Decimal:
+            # Unsaved instances may still hold the float or str they were built with.
+            price = Decimal(str(price))
+        subtotal = price * quantity
+        rate = rate_for(location_id, department_id, is_taxable)
+        append((subtotal, quantize(subtotal * rate, CENT, ROUND_HALF_UP) if rate else ZERO))
+    return results
+
+
+def price_line(price, quantity, is_taxable, location_id, department_id, table=None):
+    return price_lines([(price, quantity, is_taxable, location_id, department_id)], table)[0]
+
+
+def cart_totals(rows, table=None):
+    """
+    Fold (cart_id, price, quantity, is_taxable, location_id, department_id)
+    rows into {cart_id: totals}.
+    """
+    rows = list(rows)
+    totals = defaultdict(empty_totals)
+    amounts = price_lines((row[1:] for row in rows), table)
+    for (cart_id, _, quantity, *_), (subtotal, tax) in zip(rows, amounts):
+        cart = totals[cart_id]
+        cart['subtotal'] += subtotal
+        cart['tax'] += tax
+        cart['total'] += subtotal + tax
+        cart['item_count'] += quantity
+    return totals
+
+
+def item_row(item):
+    product = item.product
+    return product.price, item.quantity, product.department.is_taxable, product.location_id, product.department_id
+
+
+def price_items(items, table=None):
+    """
+    Price CartItems (with product and department loaded) in one batch and
+    keep each result on its item, so the subtotal/tax/total_price properties
+    read by serializers and the admin do no further arithmetic.
+    """
+    items = list(items)
+    for item, amounts in zip(items, price_lines(map(item_row, items), table)):
+        item.prime_amounts(amounts)
+    return items
+
+
+CART_LINE_FIELDS = ('cart_id', 'product__price', 'quantity', 'product__department__is_taxable',
+                    'product__location_id', 'product__department_id')
+
+
+def reprice_carts(location_id=None, department_id=None, batch_size=500, table=None, product_ids=None):
+    """
+    Recompute stored totals of carts holding products a rate or product
+    change can affect (all carts when nothing narrows it). Each batch of
+    carts is locked first, so increments made meanwhile by add_item aren't
+    overwritten. Returns how many were updated.
+    """
+    Cart = apps.get_model('cart', 'Cart')
+    CartItem = apps.get_model('cart', 'CartItem')
+    lines = CartItem.objects.all()
+    if product_ids is not None:
+        lines = lines.filter(product_id__in=list(product_ids))
+    if location_id is not None:
+        lines = lines.filter(product__location_id=location_id)
+    if department_id is not None:
+        lines = lines.filter(product__department_id=department_id)
+    cart_ids = sorted(set(lines.values_list('cart_id', flat=True)))
+    table = table or rate_table()
+    for start in range(0, len(cart_ids), batch_size):
+        batch = cart_ids[start:start + batch_size]
+        with transaction.atomic():
+            batch = list(Cart.objects.select_for_update().filter(pk__in=batch).order_by('pk')
+                         .values_list('pk', flat=True))
+            totals = cart_totals(CartItem.objects.filter(cart_id__in=batch).values_list(*CART_LINE_FIELDS), table)
+            Cart.objects.bulk_update(
+                [Cart(pk=pk, **(totals.get(pk) or empty_totals())) for pk in batch],
+                ['subtotal', 'tax', 'total', 'item_count'],
+            )
+    return len(cart_ids)
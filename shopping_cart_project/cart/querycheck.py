@@ -0,0 +1,212 @@
+# cart/querycheck.py
+
+import functools
+import logging
+import re
+import traceback
+import warnings
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# `IN (%s, %s, ...)` of any length is one shape.
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+# Query hooks sit between the caller and the database; never blame them.
+HOOK_FILES = {Path(__file__).resolve(), Path(metrics.__file__).resolve()}
+
+# ContextVars, unlike thread locals, follow a request or test into the
+# threads sync_to_async() and async_to_sync() run it on.
+_budget = ContextVar('query_budget', default=None)
+_recorder = ContextVar('request_query_recorder', default=None)
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_shape(sql):
+    return IN_LIST.sub('IN (...)', sql)
+
+
+def call_site():
+    """The innermost project frame outside the query hooks, as 'path:line in function'."""
+    base_dir = Path(settings.BASE_DIR).resolve()
+    for frame in reversed(traceback.extract_stack()):
+        path = Path(frame.filename).resolve()
+        if path not in HOOK_FILES and base_dir in path.parents and 'site-packages' not in path.parts:
+            return f'{path.relative_to(base_dir)}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+class QueryRecorder:
+    """
+    Execute wrapper that counts queries and SELECT shapes.
+    The stack is only walked when a shape repeats, so the common case stays
+    a dict increment.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.shapes = Counter()
+        self.sites = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        if sql.startswith('SELECT'):
+            shape = query_shape(sql)
+            self.shapes[shape] += 1
+            if self.shapes[shape] == 2:
+                self.sites[shape] = call_site()
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold):
+        return [(shape, count, self.sites[shape]) for shape, count in self.shapes.items() if count >= threshold]
+
+
+def record_queries(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection by cart.signals."""
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+class QueryCheckMiddleware:
+    """
+    Flags requests that run the same SELECT shape NPLUSONE_THRESHOLD or more
+    times, the signature of a lazy relation loaded inside a loop, and
+    enforces the budget set by @max_queries. NPLUSONE_MODE is 'raise',
+    'warn' or None (off); the test runner below sets 'raise'. Runs sync or
+    async, whichever the rest of the stack is. A streaming response is
+    checked once its content has been consumed, counting the queries that
+    run while it is.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        mode, budget = getattr(settings, 'NPLUSONE_MODE', None), _budget.get()
+        if mode is None and budget is None:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.check(request, response, recorder, mode, budget)
+
+    async def __acall__(self, request):
+        mode, budget = getattr(settings, 'NPLUSONE_MODE', None), _budget.get()
+        if mode is None and budget is None:
+            return await self.get_response(request)
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        return self.check(request, response, recorder, mode, budget)
+
+    def check(self, request, response, recorder, mode, budget):
+        if response.streaming:
+            record_stream = self.arecord_stream if response.is_async else self.record_stream
+            response.streaming_content = record_stream(
+                response.streaming_content, request, response, recorder, mode, budget
+            )
+            return response
+        return self.check_recorded(request, response, recorder, mode, budget)
+
+    def record_stream(self, content, request, response, recorder, mode, budget):
+        chunks = iter(content)
+        while True:
+            # A generator shares its consumer's context, so set the
+            # recorder around each step rather than once.
+            token = _recorder.set(recorder)
+            try:
+                chunk = next(chunks, None)
+            finally:
+                _recorder.reset(token)
+            if chunk is None:
+                break
+            yield chunk
+        self.check_recorded(request, response, recorder, mode, budget)
+
+    async def arecord_stream(self, content, request, response, recorder, mode, budget):
+        chunks = aiter(content)
+        while True:
+            token = _recorder.set(recorder)
+            try:
+                chunk = await anext(chunks, None)
+            finally:
+                _recorder.reset(token)
+            if chunk is None:
+                break
+            yield chunk
+        self.check_recorded(request, response, recorder, mode, budget)
+
+    def check_recorded(self, request, response, recorder, mode, budget):
+        if budget is not None and recorder.count > budget:
+            raise QueryBudgetExceeded(
+                f'{request.method} {request.path} ran {recorder.count} queries, more than the {budget} allowed.'
+            )
+        repeated = recorder.repeated(getattr(settings, 'NPLUSONE_THRESHOLD', 3)) if mode else []
+        if repeated:
+            message = f'Repeated queries in {request.method} {request.path}:\n' + '\n'.join(
+                f'  {count}x from {site}: {shape}' for shape, count, site in repeated
+            )
+            if mode == 'raise':
+                raise NPlusOneError(message)
+            warnings.warn(message, stacklevel=2)
+            logger.warning(message)
+        return response
+
+
+def max_queries(limit):
+    """
+    Fail a test if any request it makes runs more than `limit` queries,
+    savepoints included, as assertNumQueries counts them.
+    """
+    def decorator(test):
+        @functools.wraps(test)
+        def wrapper(*args, **kwargs):
+            token = _budget.set(limit)
+            try:
+                return test(*args, **kwargs)
+            finally:
+                _budget.reset(token)
+        return wrapper
+    return decorator
+
+
+class QueryCheckRunner(DiscoverRunner):
+    """Test runner that turns repeated-query warnings into failures."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.nplusone = override_settings(NPLUSONE_MODE='raise')
+        self.nplusone.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.nplusone.disable()
+        super().teardown_test_environment(**kwargs)
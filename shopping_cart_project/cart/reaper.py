@@ -0,0 +1,114 @@
+# cart/reaper.py
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .inventory import release_many
+from .metrics import registry
+from .models import Cart, CartItem
+from .totals import empty_totals
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReapResult:
+    carts: int = 0
+    lines: int = 0
+    units: int = 0
+    seconds: float = 0.0
+
+
+def _ttl():
+    return timedelta(seconds=getattr(settings, 'CART_RESERVATION_TTL', 2 * 60 * 60))
+
+
+def reap_abandoned_carts(ttl=None, batch_size=500):
+    """
+    Empty carts that have not changed for `ttl` and put their stock back.
+
+    Each batch of carts is emptied in one transaction: the lines go in a
+    single DELETE and their quantities, summed per product, return through
+    release_many()'s batched UPDATEs, so a product held by a thousand
+    abandoned carts is written once per batch rather than once per line.
+    """
+    started = time.perf_counter()
+    cutoff = timezone.now() - (ttl if ttl is not None else _ttl())
+    result = ReapResult()
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            stale = Cart.objects.filter(pk__gt=last_id, updated_at__lt=cutoff, item_count__gt=0)
+            # Locking the carts holds off CartItem.save(), which bumps
+            # updated_at on the same row, until the batch is done.
+            cart_ids = list(stale.select_for_update().order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not cart_ids:
+                break
+            last_id = cart_ids[-1]
+            lines = CartItem.objects.filter(cart_id__in=cart_ids)
+            quantities = dict(lines.values('product_id').annotate(units=Sum('quantity'))
+                              .order_by().values_list('product_id', 'units'))
+            deleted, _ = lines.delete()
+            release_many(quantities, reference='reaper')
+            Cart.objects.filter(pk__in=cart_ids).update(**empty_totals())
+        result.carts += len(cart_ids)
+        result.lines += deleted
+        result.units += sum(quantities.values())
+    result.seconds = time.perf_counter() - started
+    registry.inc('cart_reaper_runs_total')
+    registry.inc('cart_reaper_carts_total', value=result.carts)
+    registry.inc('cart_reaper_released_units_total', value=result.units)
+    registry.inc('cart_reaper_seconds_total', value=result.seconds)
+    logger.info('Reaped %d carts: %d lines, %d units released in %.3fs',
+                result.carts, result.lines, result.units, result.seconds)
+    return result
+
+
+class Scheduler(threading.Thread):
+    """
+    Runs `job` every `interval` seconds on a daemon thread, for deployments
+    without cron. Errors are logged and the next run goes ahead.
+    """
+
+    def __init__(self, job, interval):
+        super().__init__(name=f'cart-scheduler-{job.__name__}', daemon=True)
+        self.job = job
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            close_old_connections()
+            try:
+                self.job()
+            except Exception:
+                logger.exception('Scheduled %s failed', self.job.__name__)
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self.stopped.set()
+
+
+_reaper = None
+
+
+def start_reaper(interval=None):
+    """
+    Start the in-process reaper once per process; CART_REAPER_INTERVAL
+    enables it. Called from the WSGI and ASGI entrypoints only.
+    """
+    global _reaper
+    interval = interval or getattr(settings, 'CART_REAPER_INTERVAL', None)
+    if not interval or _reaper is not None:
+        return _reaper
+    _reaper = Scheduler(reap_abandoned_carts, interval)
+    _reaper.start()
+    return _reaper
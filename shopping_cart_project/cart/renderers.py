@@ -0,0 +1,62 @@
+# cart/renderers.py
+
+import csv
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class StreamingRenderer(BaseRenderer):
+    """
+    Renderer whose `stream(rows, fields)` yields encoded chunks for a
+    StreamingHttpResponse. `render()` covers ordinary responses, such as
+    errors, by streaming them as a single row.
+    """
+    charset = 'utf-8'
+    rows_per_chunk = 500
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        fields = list(rows[0]) if rows and isinstance(rows[0], dict) else []
+        return b''.join(self.stream(rows, fields))
+
+    def stream(self, rows, fields):
+        buffer = []
+        for line in self.lines(rows, fields):
+            buffer.append(line)
+            if len(buffer) >= self.rows_per_chunk:
+                yield ''.join(buffer).encode(self.charset)
+                buffer = []
+        if buffer:
+            yield ''.join(buffer).encode(self.charset)
+
+    def lines(self, rows, fields):
+        raise NotImplementedError
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def lines(self, rows, fields):
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        for row in rows:
+            yield encoder.encode(row) + '\n'
+
+
+class EchoBuffer:
+    def write(self, value):
+        return value
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def lines(self, rows, fields):
+        writer = csv.writer(EchoBuffer())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow(['' if row.get(field) is None else row[field] for field in fields])
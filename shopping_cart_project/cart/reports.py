@@ -0,0 +1,76 @@
+# cart/reports.py
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import SalesRollup
+
+MEASURES = ('units', 'revenue', 'tax', 'cost')
+LINE_AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+
+
+def rollup_key(day, department_id, location_id):
+    return {'day': day, 'department_id': department_id, 'location_id': location_id}
+
+
+def sales_by_key(order, items):
+    """Fold one order's lines into {(day, department_id, location_id): measures}."""
+    day = timezone.localdate(order.created_at)
+    sales = defaultdict(lambda: {'units': 0, 'revenue': Decimal('0.00'), 'tax': Decimal('0.00'),
+                                 'cost': Decimal('0.00')})
+    for item in items:
+        measures = sales[day, item.department_id, item.location_id]
+        measures['units'] += item.quantity
+        measures['revenue'] += item.price * item.quantity
+        measures['tax'] += item.tax
+        measures['cost'] += item.cost * item.quantity
+    return sales
+
+
+def record_sales(order, items):
+    """
+    Add a just-placed order to the rollups. Missing rows are inserted with
+    ignore_conflicts first so that the increments are plain UPDATEs and
+    concurrent checkouts never race on creating the same row.
+    """
+    sales = sales_by_key(order, items)
+    SalesRollup.objects.bulk_create([SalesRollup(**rollup_key(*key)) for key in sales], ignore_conflicts=True)
+    for key, measures in sales.items():
+        SalesRollup.objects.filter(**rollup_key(*key)).update(
+            **{name: F(name) + value for name, value in measures.items()}
+        )
+
+
+def aggregate_order_items(order_item_model, since=None):
+    """Rollup rows computed from OrderItem, as .values() dicts."""
+    items = order_item_model.objects.filter(department__isnull=False, location__isnull=False)
+    if since is not None:
+        items = items.filter(order__created_at__date__gte=since)
+    return items.annotate(day=TruncDate('order__created_at')).values(
+        'day', 'department_id', 'location_id'
+    ).annotate(
+        units=Sum('quantity'),
+        revenue=Sum(ExpressionWrapper(F('price') * F('quantity'), output_field=LINE_AMOUNT)),
+        total_tax=Sum('tax'),
+        total_cost=Sum(ExpressionWrapper(F('cost') * F('quantity'), output_field=LINE_AMOUNT)),
+    ).order_by('day', 'department_id', 'location_id')
+
+
+def rebuild_rollups(rollup_model, order_item_model, since=None, batch_size=1000):
+    """Replace the rollups (from `since` on, or all of them) with fresh aggregates."""
+    existing = rollup_model.objects.all()
+    if since is not None:
+        existing = existing.filter(day__gte=since)
+    existing.delete()
+    rows = [
+        rollup_model(
+            day=row['day'], department_id=row['department_id'], location_id=row['location_id'],
+            units=row['units'], revenue=row['revenue'], tax=row['total_tax'], cost=row['total_cost'],
+        )
+        for row in aggregate_order_items(order_item_model, since).iterator()
+    ]
+    rollup_model.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
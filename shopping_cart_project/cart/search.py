@@ -0,0 +1,127 @@
+# cart/search.py
+
+import re
+from functools import reduce
+from operator import and_, or_
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework import filters
+
+WORD = re.compile(r'\w', re.UNICODE)
+
+# The word-prefix indexes cannot find a barcode suffix or a fragment from the
+# middle of a word, so terms with digits or shorter than this keep substring
+# matching.
+MIN_PREFIX_LENGTH = 3
+
+
+def needs_substring_search(terms):
+    return any(
+        len(term) < MIN_PREFIX_LENGTH or not WORD.search(term) or any(char.isdigit() for char in term)
+        for term in terms
+    )
+
+
+class SimpleSearchBackend:
+    """Substring matching, equivalent to DRF's SearchFilter."""
+    ranked = False
+    fields = ('name', 'description', 'barcode')
+
+    def search(self, queryset, terms):
+        return queryset.filter(reduce(and_, [
+            reduce(or_, [Q(**{f'{field}__icontains': term}) for field in self.fields])
+            for term in terms
+        ]))
+
+
+class SQLiteFTS5SearchBackend:
+    """
+    Prefix matching over the cart_product_fts FTS5 table, ranked by bm25 with
+    name weighted above barcode and description. Barcode and very short
+    terms fall back to substring matching.
+
+    Migration 0007 creates the table and the triggers that keep it in step
+    with cart_product, so bulk_create()/update() writes are covered too.
+    Django's SQLite schema editor rebuilds tables on most ALTERs and drops
+    their triggers, so a migration that alters cart_product must recreate
+    them with its own copy of that SQL.
+    """
+    ranked = True
+    table = 'cart_product_fts'
+    weights = (10.0, 1.0, 5.0)  # name, description, barcode
+
+    def match_expression(self, terms):
+        return ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+
+    def search(self, queryset, terms):
+        if needs_substring_search(terms):
+            return SimpleSearchBackend().search(queryset, terms)
+        match = self.match_expression(terms)
+        weights = ', '.join(str(weight) for weight in self.weights)
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [match])
+        ).annotate(search_rank=RawSQL(
+            # bm25 is lower-is-better; negate so every backend sorts by -search_rank.
+            f'SELECT -bm25({self.table}, {weights}) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = cart_product.id',
+            [match], output_field=FloatField()
+        ))
+
+
+class PostgresSearchBackend:
+    """Prefix tsquery against the GIN expression index created in migration 0007."""
+    ranked = True
+    config = 'english'
+    # Must stay identical to the indexed expression for the planner to use it.
+    document = ("to_tsvector('english', coalesce(cart_product.name, '') || ' ' || "
+                "coalesce(cart_product.description, '') || ' ' || coalesce(cart_product.barcode, ''))")
+
+    def tsquery(self, terms):
+        words = [word for term in terms for word in re.findall(r'\w+', term, re.UNICODE)]
+        return ' & '.join(f"{word}:*" for word in words)
+
+    def search(self, queryset, terms):
+        query = self.tsquery(terms)
+        if not query or needs_substring_search(terms):
+            return SimpleSearchBackend().search(queryset, terms)
+        return queryset.filter(
+            id__in=RawSQL(
+                f"SELECT id FROM cart_product WHERE {self.document} @@ to_tsquery('{self.config}', %s)",
+                [query]
+            )
+        ).annotate(search_rank=RawSQL(
+            f"ts_rank({self.document}, to_tsquery('{self.config}', %s))",
+            [query], output_field=FloatField()
+        ))
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTS5SearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend():
+    path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return VENDOR_BACKENDS.get(connection.vendor, SimpleSearchBackend)()
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """SearchFilter that delegates to the configured search backend and, unless
+    an explicit ordering was requested, sorts by relevance."""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        backend = get_search_backend()
+        queryset = backend.search(queryset, terms)
+        if backend.ranked and 'search_rank' in queryset.query.annotations:
+            queryset = queryset.order_by('-search_rank')
+        return queryset
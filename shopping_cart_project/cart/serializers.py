@@ -3,6 +3,10 @@
 from .models import Location, Department, Product, CartItem, Cart, Order, OrderItem
 from django.contrib.auth.models import User
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+from rest_framework import ISO_8601
+from django.utils import timezone
+import decimal
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -54,21 +58,64 @@ class CartItemSerializer(serializers.ModelSerializer):
                   'created_at', 'updated_at']
 
 
+class CartItemDeltaSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField()
+
+
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
-    total = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
         model = Cart
-        fields = ['id', 'user', 'items', 'total', 'created_at', 'updated_at']
+        fields = ['id', 'user', 'items', 'subtotal', 'tax', 'total', 'item_count',
+                  'created_at', 'updated_at']
+        read_only_fields = ['subtotal', 'tax', 'total', 'item_count']
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
-    product_name = serializers.CharField(source='product.name', read_only=True)
-
     class Meta:
         model = OrderItem
-        fields = ['id', 'product', 'product_name', 'quantity', 'price']
+        fields = ['id', 'product', 'product_name', 'barcode', 'quantity', 'price', 'tax']
+        read_only_fields = ['product_name', 'barcode', 'price', 'tax']
+
+
+class SalesReportQuerySerializer(serializers.Serializer):
+    GROUPS = ('day', 'department', 'location')
+
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    department = serializers.IntegerField(required=False)
+    location = serializers.IntegerField(required=False)
+    group_by = serializers.CharField(required=False, default='day')
+
+    def validate_group_by(self, value):
+        groups = [group.strip() for group in value.split(',') if group.strip()]
+        unknown = [group for group in groups if group not in self.GROUPS]
+        if not groups or unknown:
+            raise serializers.ValidationError(f"Group by one or more of: {', '.join(self.GROUPS)}.")
+        return groups
+
+    def validate(self, attrs):
+        if attrs.get('start') and attrs.get('end') and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError('start must not be after end.')
+        return attrs
+
+
+class SalesReportRowSerializer(serializers.Serializer):
+    # Only the grouped-by columns are present in a row; the rest are skipped.
+    day = serializers.DateField(required=False)
+    department = serializers.IntegerField(source='department_id', required=False)
+    department_name = serializers.CharField(source='department__name', required=False)
+    location = serializers.IntegerField(source='location_id', required=False)
+    location_name = serializers.CharField(source='location__name', required=False)
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=16, decimal_places=2)
+    tax = serializers.DecimalField(max_digits=16, decimal_places=2)
+    cost = serializers.DecimalField(max_digits=16, decimal_places=2)
+    margin = serializers.DecimalField(max_digits=16, decimal_places=2)
+    # Room for margin * 100 / 0.01, the smallest non-zero revenue.
+    margin_percent = serializers.DecimalField(max_digits=20, decimal_places=2, allow_null=True)
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -79,6 +126,159 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'status', 'total', 'items', 'created_at', 'updated_at']
 
 
+
+class CompiledSerializer:
+    """
+    Read-only fast path for a ModelSerializer's output.
+
+    The serializer's fields are inspected once per class and turned into
+    (key, attribute, converter) steps, so rendering a row skips DRF's
+    per-field get_attribute/SkipField machinery. Output is identical to
+    `serializer_class(...).data`. Works on model instances (nested
+    serializers included) and, for flat serializers, on `.values()` rows.
+    """
+    serializer_class = None
+    # to_representation() of these is the identity for values read from the DB
+    identity_fields = (serializers.CharField, serializers.IntegerField, serializers.BooleanField)
+    _compiled = None
+
+    def __init__(self, context=None):
+        self.context = context or {}
+        self.request = self.context.get('request')
+        steps, self.columns = self.compile()
+        self.steps = [
+            (name, attribute, kind, self.bind(kind, convert))
+            for name, attribute, kind, convert in steps
+        ]
+
+    def bind(self, kind, convert):
+        if kind == 'plain':
+            return self.converter(convert)
+        if kind in ('many', 'one'):
+            return convert(self.context)
+        return convert
+
+    @classmethod
+    def compile(cls):
+        if cls.__dict__.get('_compiled') is None:
+            model = cls.serializer_class.Meta.model
+            steps, columns = [], []
+            for name, field in cls.serializer_class().fields.items():
+                if field.write_only:
+                    continue
+                if isinstance(field, serializers.BaseSerializer):
+                    many = isinstance(field, serializers.ListSerializer)
+                    child = type(field.child if many else field)
+                    nested = type(f'Compiled{child.__name__}', (CompiledSerializer,), {'serializer_class': child})
+                    steps.append((name, field.source, 'many' if many else 'one', nested))
+                    columns = None
+                    continue
+                if isinstance(field, serializers.PrimaryKeyRelatedField):
+                    attribute, kind, convert = model._meta.get_field(field.source).attname, 'plain', None
+                elif isinstance(field, serializers.FileField):
+                    attribute, kind, convert = field.source, 'file', getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+                elif type(field) in cls.identity_fields:
+                    attribute, kind, convert = field.source, 'plain', None
+                else:
+                    attribute, kind, convert = field.source, 'plain', field
+                steps.append((name, attribute, kind, convert))
+                if columns is not None:
+                    columns.append(attribute)
+            cls._compiled = (steps, columns)
+        return cls._compiled
+
+    @staticmethod
+    def converter(field):
+        # Precompute what DecimalField/DateTimeField.to_representation look
+        # up on every call (decimal context, current timezone); anything
+        # unusual falls back to the field itself.
+        if field is None:
+            return None
+        if (type(field) is serializers.DecimalField and field.decimal_places is not None
+                and getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+                and not field.localize and not getattr(field, 'normalize_output', False)):
+            context = decimal.getcontext().copy()
+            if field.max_digits is not None:
+                context.prec = field.max_digits
+            exponent = decimal.Decimal('.1') ** field.decimal_places
+            rounding = field.rounding
+
+            def convert_decimal(value):
+                if not isinstance(value, decimal.Decimal):
+                    value = decimal.Decimal(str(value).strip())
+                return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+            return convert_decimal
+        if (type(field) is serializers.DateTimeField
+                and (getattr(field, 'format', api_settings.DATETIME_FORMAT) or '').lower() == ISO_8601):
+            field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+            if field_timezone is not None:
+                def convert_datetime(value):
+                    if not value or isinstance(value, str) or not timezone.is_aware(value):
+                        return field.to_representation(value)
+                    value = value.astimezone(field_timezone).isoformat()
+                    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+                return convert_datetime
+        return field.to_representation
+
+    def file_representation(self, value, use_url):
+        if not value:
+            return None
+        if not use_url:
+            return value.name
+        url = value.url
+        return self.request.build_absolute_uri(url) if self.request is not None else url
+
+    def to_representation(self, instance):
+        data = {}
+        for name, attribute, kind, convert in self.steps:
+            value = getattr(instance, attribute)
+            if kind == 'plain':
+                data[name] = value if value is None or convert is None else convert(value)
+            elif kind == 'file':
+                data[name] = self.file_representation(value, convert)
+            elif kind == 'many':
+                data[name] = [convert.to_representation(item) for item in value.all()]
+            else:
+                data[name] = None if value is None else convert.to_representation(value)
+        return data
+
+    def many(self, instances):
+        return [self.to_representation(instance) for instance in instances]
+
+    def values(self, queryset):
+        """`queryset.values()` with the columns `from_values()` needs, plus
+        annotations such as search ranks that pagination may order by."""
+        if self.columns is None:
+            raise TypeError(f'{type(self).__name__} has nested fields and cannot render .values() rows')
+        return queryset.values(*self.columns, *queryset.query.annotations)
+
+    def from_values(self, row):
+        data = {}
+        for name, attribute, kind, convert in self.steps:
+            value = row[attribute]
+            if kind == 'file':
+                data[name] = self.file_representation(self.field_file(attribute, value), convert)
+            else:
+                data[name] = value if value is None or convert is None else convert(value)
+        return data
+
+    def many_from_values(self, rows):
+        return [self.from_values(row) for row in rows]
+
+    def field_file(self, attribute, name):
+        if not name:
+            return None
+        field = self.serializer_class.Meta.model._meta.get_field(attribute)
+        return field.attr_class(None, field, name)
+
+
+class ProductReadSerializer(CompiledSerializer):
+    serializer_class = ProductSerializer
+
+
+class CartReadSerializer(CompiledSerializer):
+    serializer_class = CartSerializer
+
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -89,6 +289,7 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         # Add custom claims
         token['username'] = user.username
         token['is_staff'] = user.is_staff
+        token['is_active'] = user.is_active
 
         return token
 
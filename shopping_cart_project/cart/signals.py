@@ -0,0 +1,87 @@
+# cart/signals.py
+
+import re
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .authentication import USER_FIELDS, invalidate_user
+from .cache import bump_catalog_version, invalidate_products
+from .metrics import time_queries
+from .querycheck import record_queries
+from .models import Department, Location, Product, TaxRate
+from .pricing import invalidate_rates, load_rate_table, reprice_carts
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    invalidate_products(pks=[instance.pk], barcodes=[instance.barcode, instance._loaded_barcode])
+
+
+@receiver([post_save, post_delete], sender=Department)
+@receiver([post_save, post_delete], sender=Location)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Department)
+@receiver(post_save, sender=Product)
+def reprice_on_product_change(sender, instance, created, update_fields=None, **kwargs):
+    # Open carts were priced at the old price, place or taxability.
+    if not created and instance.pricing_changed(update_fields):
+        if sender is Product:
+            reprice = partial(reprice_carts, product_ids=[instance.pk])
+        else:
+            reprice = partial(reprice_carts, department_id=instance.pk)
+        transaction.on_commit(reprice)
+    instance.remember_pricing()
+
+
+@receiver([post_save, post_delete], sender=TaxRate)
+def reprice_on_rate_change(sender, instance, **kwargs):
+    # Stored cart totals were priced with the old rate. Reprice with the rows
+    # this transaction sees; other processes reload once it commits.
+    reprice_carts(instance.location_id, instance.department_id, table=load_rate_table())
+    transaction.on_commit(invalidate_rates)
+
+
+# What a token carries or is checked against. Saves of other fields, such as
+# update_last_login() on every admin login, leave existing tokens valid.
+TOKEN_FIELDS = frozenset({*USER_FIELDS, 'password'})
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_on_save(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and TOKEN_FIELDS.isdisjoint(update_fields)):
+        return
+    invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=get_user_model())
+def invalidate_user_on_delete(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(connection_created)
+def install_query_hooks(sender, connection, **kwargs):
+    # Reconnecting fires this again on the same wrapper object.
+    for hook in (time_queries, record_queries):
+        if hook not in connection.execute_wrappers:
+            connection.execute_wrappers.append(hook)
+
+
+PRAGMA_VALUE = re.compile(r'^[\w-]+$')
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            if PRAGMA_VALUE.match(name) and PRAGMA_VALUE.match(str(value)):
+                cursor.execute(f'PRAGMA {name} = {value}')
@@ -1,13 +1,70 @@
 # cart/tests.py
 
-from django.test import TestCase
-from django.contrib.auth.models import User
-from rest_framework.test import APIClient
+import csv
+import importlib
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.utils import timezone
+from django.core.cache import cache as shared_cache
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import connection, OperationalError
+from django.db.models import Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import resolve
+from django.contrib.auth.models import User, update_last_login
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
 from rest_framework import status
-from .models import Product, Department, Location, Cart, Order
+from rest_framework_simplejwt.tokens import RefreshToken
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from io import StringIO
+from unittest import mock
+from .models import (Product, Department, Location, Cart, CartItem, Order, OrderItem, SalesRollup,
+                     InventoryCheckpoint, InventoryMovement, TaxRate, TokenWatermark)
+from . import cache, inventory, pricing
+from .authentication import ClaimsJWTAuthentication, invalidate_user
+from .inventory import available, compact_ledger, ledger_balances, reserve_many
+from .reaper import Scheduler, reap_abandoned_carts
+from .metrics import MetricsMiddleware, registry
+from .benchmarks import ClientTransport, SCENARIOS, Session, compare_results, run_scenario, seed_catalog, seed_shoppers
+from .pricing import RATES_VERSION_KEY, RateTable, cart_totals, invalidate_rates, price_lines, rate_table, rates_version
+from .querycheck import NPlusOneError, QueryBudgetExceeded, QueryCheckMiddleware, max_queries, query_shape
+from shopping_cart_project.database import database_settings, sqlite_pragmas
+from .search import SimpleSearchBackend, SQLiteFTS5SearchBackend
+from .serializers import CartReadSerializer, CartSerializer, ProductReadSerializer, ProductSerializer
+
+def setUpModule():
+    # The tax rate table is loaded once per process; load it now, and don't
+    # re-check its version mid-run, so that query counts don't depend on
+    # which test happens to run first or how long the run takes.
+    global rate_check
+    rate_check = override_settings(TAX_RATE_CHECK_INTERVAL=float('inf'))
+    rate_check.enable()
+    rate_table()
+
+
+def tearDownModule():
+    rate_check.disable()
+
 
 class ShoppingCartAPITestCase(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = APIClient()
         self.user = User.objects.create_user(username='testuser', password='testpass123')
         self.admin = User.objects.create_superuser(username='admin', password='admin123')
@@ -20,9 +77,11 @@ class ShoppingCartAPITestCase(TestCase):
             price=99.99,
             department=self.department,
             location=self.location,
-            on_hand=10
+            on_hand=10,
+            cost=50.00
         )
 
+    @max_queries(2)
     def test_product_list(self):
         self.client.force_authenticate(user=self.user)
         response = self.client.get('/api/products/')
@@ -30,6 +89,7 @@ class ShoppingCartAPITestCase(TestCase):
         self.assertIn('results', response.data)
         self.assertGreater(len(response.data['results']), 0)
 
+    @max_queries(22)
     def test_add_to_cart(self):
         self.client.force_authenticate(user=self.user)
         response = self.client.post('/api/carts/add_item/', {'product_id': self.product.id, 'quantity': 2})
@@ -38,6 +98,7 @@ class ShoppingCartAPITestCase(TestCase):
         self.assertEqual(cart.items.count(), 1)
         self.assertEqual(cart.items.first().quantity, 2)
 
+    @max_queries(13)
     def test_checkout(self):
         self.client.force_authenticate(user=self.user)
         cart = Cart.objects.create(user=self.user)
@@ -46,6 +107,7 @@ class ShoppingCartAPITestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
 
+    @max_queries(4)
     def test_admin_create_product(self):
         self.client.force_authenticate(user=self.admin)
         data = {
@@ -53,12 +115,14 @@ class ShoppingCartAPITestCase(TestCase):
             'price': 49.99,
             'department': self.department.id,
             'location': self.location.id,
-            'on_hand': 5
+            'on_hand': 5,
+            'cost': 25.00
         }
         response = self.client.post('/api/products/', data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Product.objects.count(), 2)
 
+    @max_queries(0)
     def test_user_create_product_forbidden(self):
         self.client.force_authenticate(user=self.user)
         data = {
@@ -66,7 +130,1537 @@ class ShoppingCartAPITestCase(TestCase):
             'price': 49.99,
             'department': self.department.id,
             'location': self.location.id,
-            'on_hand': 5
+            'on_hand': 5,
+            'cost': 25.00
         }
         response = self.client.post('/api/products/', data)
-        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class CartFixtureMixin:
+    def setUp(self):
+        # Catalog writes only evict on commit, which TestCase never reaches.
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.department = Department.objects.create(name='Electronics', is_taxable=True)
+        self.location = Location.objects.create(name='Warehouse A')
+        self.client.force_authenticate(user=self.user)
+
+    def fill_cart(self, lines, on_hand=100):
+        products = Product.objects.bulk_create([
+            Product(name=f'Product {i}', price=10, cost=5, on_hand=on_hand,
+                    department=self.department, location=self.location)
+            for i in range(lines)
+        ])
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=1)
+            for product in products
+        ])
+        # bulk_create() skips CartItem.save(), so bring the totals up to date.
+        cart.recalculate()
+        return cart
+
+
+class CartQueryCountTestCase(CartFixtureMixin, TestCase):
+    @max_queries(2)
+    def test_list_query_count_is_constant(self):
+        self.fill_cart(1)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/carts/')
+        self.assertEqual(len(response.data['items']), 1)
+
+        self.fill_cart(199)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/carts/')
+        self.assertEqual(len(response.data['items']), 200)
+        self.assertEqual(response.data['subtotal'], '2000.00')
+        self.assertEqual(response.data['total'], '2160.00')
+
+    @max_queries(16)
+    def test_add_item_query_count_is_constant(self):
+        first, second = [
+            Product.objects.create(name=name, price=1, cost=1, on_hand=100,
+                                   department=self.department, location=self.location)
+            for name in ('First', 'Second')
+        ]
+
+        self.fill_cart(1)
+        with CaptureQueriesContext(connection) as small:
+            self.client.post('/api/carts/add_item/', {'product_id': first.id, 'quantity': 1})
+
+        self.fill_cart(198)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post('/api/carts/add_item/', {'product_id': second.id, 'quantity': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['items']), 201)
+        self.assertEqual(len(small), len(large))
+
+
+class InventoryReservationTestCase(TestCase):
+    def setUp(self):
+        self.department = Department.objects.create(name='Electronics')
+        self.location = Location.objects.create(name='Warehouse A')
+        self.product = Product.objects.create(name='Widget', price=5, cost=2, on_hand=3,
+                                              department=self.department, location=self.location)
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def test_reservation_is_a_single_update(self):
+        # The conditional UPDATE plus its ledger row.
+        with self.assertNumQueries(2):
+            self.product.update_inventory(-2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.on_hand, 1)
+
+    def test_reservation_beyond_stock_fails(self):
+        with self.assertRaises(ValidationError):
+            self.product.update_inventory(-4)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.on_hand, 3)
+
+    def test_cart_item_reserves_only_the_difference(self):
+        item = CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        item = CartItem.objects.select_related('product').get(pk=item.pk)
+        item.quantity = 3
+        item.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.on_hand, 0)
+
+        item.quantity = 4
+        with self.assertRaises(ValidationError):
+            item.save()
+        self.assertEqual(CartItem.objects.get(pk=item.pk).quantity, 3)
+
+        item.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.on_hand, 3)
+
+
+class ConcurrentReservationTestCase(TransactionTestCase):
+    threads = 16
+    attempts_per_thread = 5
+    stock = 40
+
+    def test_concurrent_reservations_never_oversell(self):
+        department = Department.objects.create(name='Electronics')
+        location = Location.objects.create(name='Warehouse A')
+        product = Product.objects.create(name='Hot SKU', price=5, cost=2, on_hand=self.stock,
+                                         department=department, location=location)
+        reserved = []
+        start = threading.Barrier(self.threads)
+
+        def worker():
+            local = Product.objects.get(pk=product.pk)
+            start.wait()
+            try:
+                for _ in range(self.attempts_per_thread):
+                    while True:
+                        try:
+                            local.update_inventory(-1)
+                        except ValidationError:
+                            break
+                        except OperationalError:
+                            # SQLite reports lock contention instead of blocking.
+                            continue
+                        reserved.append(1)
+                        break
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        product.refresh_from_db()
+        self.assertEqual(len(reserved), self.stock)
+        self.assertEqual(product.on_hand, 0)
+
+
+class CheckoutTestCase(CartFixtureMixin, TestCase):
+    @max_queries(13)
+    def test_checkout_total_includes_tax_and_keeps_stock_sold(self):
+        self.fill_cart(3, on_hand=7)
+        response = self.client.post('/api/orders/checkout/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total'], '32.40')
+        self.assertEqual(len(response.data['items']), 3)
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(set(Product.objects.values_list('on_hand', flat=True)), {7})
+
+    @max_queries(23)
+    def test_checkout_query_count_is_constant(self):
+        self.fill_cart(1)
+        with CaptureQueriesContext(connection) as small:
+            self.client.post('/api/orders/checkout/')
+
+        lines = 500
+        self.fill_cart(lines)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post('/api/orders/checkout/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['items']), lines)
+        # Only the OrderItem and ledger inserts grow, split by bulk_create into
+        # batches that fit the backend's bound-parameter limit.
+        fields = [field for field in OrderItem._meta.concrete_fields if not field.primary_key]
+        batch_size = connection.ops.bulk_batch_size(fields, response.data['items'])
+        movement_fields = [field for field in InventoryMovement._meta.concrete_fields if not field.primary_key]
+        movement_batch_size = min(inventory.BATCH_SIZE, connection.ops.bulk_batch_size(movement_fields, []))
+        self.assertEqual(len(large) - len(small),
+                         math.ceil(lines / batch_size) - 1 + math.ceil(2 * lines / movement_batch_size) - 1)
+        inserts = [query for query in large if query['sql'].startswith('INSERT INTO "cart_orderitem"')]
+        self.assertEqual(len(inserts), math.ceil(lines / batch_size))
+
+        def rollup_writes(queries):
+            return [query for query in queries if '"cart_salesrollup"' in query['sql']]
+        self.assertTrue(rollup_writes(small))
+        self.assertEqual(len(rollup_writes(large)), len(rollup_writes(small)))
+
+    @max_queries(4)
+    def test_checkout_empty_cart(self):
+        Cart.objects.create(user=self.user)
+        response = self.client.post('/api/orders/checkout/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+
+class CartBulkTestCase(CartFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Product {i}', price=10, cost=5, on_hand=5,
+                    department=self.department, location=self.location)
+            for i in range(3)
+        ])
+
+    @max_queries(17)
+    def test_bulk_add_update_and_remove(self):
+        first, second, third = self.products
+        self.client.post('/api/carts/bulk/', [
+            {'product_id': first.id, 'quantity': 2},
+            {'product_id': second.id, 'quantity': 3},
+        ], format='json')
+        response = self.client.post('/api/carts/bulk/', {'items': [
+            {'product_id': first.id, 'quantity': 1},
+            {'product_id': second.id, 'quantity': -3},
+            {'product_id': third.id, 'quantity': 4},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['errors'], [])
+        quantities = {item['product']['id']: item['quantity'] for item in response.data['cart']['items']}
+        self.assertEqual(quantities, {first.id: 3, third.id: 4})
+        on_hand = dict(Product.objects.values_list('id', 'on_hand'))
+        self.assertEqual(on_hand, {first.id: 2, second.id: 5, third.id: 1})
+
+    @max_queries(20)
+    def test_bulk_reports_failed_lines(self):
+        first, second, _ = self.products
+        response = self.client.post('/api/carts/bulk/', [
+            {'product_id': first.id, 'quantity': 1},
+            {'product_id': second.id, 'quantity': 6},
+            {'product_id': 9999, 'quantity': 1},
+            {'quantity': 1},
+        ], format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 3])
+        self.assertEqual(response.data['errors'][1]['error'], 'Product not found')
+        self.assertEqual(len(response.data['cart']['items']), 1)
+        self.assertEqual(Product.objects.get(pk=second.id).on_hand, 5)
+        self.assertEqual(Product.objects.get(pk=first.id).on_hand, 4)
+
+    @max_queries(20)
+    def test_bulk_shortfall_reports_current_stock(self):
+        first = self.products[0]
+
+        def sell_first(quantities, reference=''):
+            # Another checkout takes stock between the read and the reservation.
+            Product.objects.filter(pk=first.id).update(on_hand=2)
+            return reserve_many(quantities, reference)
+
+        with mock.patch('cart.views.reserve_many', sell_first):
+            response = self.client.post('/api/carts/bulk/', [{'product_id': first.id, 'quantity': 4}], format='json')
+        self.assertEqual(response.data['errors'][0]['error'], 'Not enough inventory. Only 2 available.')
+
+    @max_queries(13)
+    def test_bulk_query_count_is_constant(self):
+        products = Product.objects.bulk_create([
+            Product(name=f'Bulk {i}', price=1, cost=1, on_hand=10,
+                    department=self.department, location=self.location)
+            for i in range(150)
+        ])
+        Cart.objects.create(user=self.user)
+        with CaptureQueriesContext(connection) as small:
+            self.client.post('/api/carts/bulk/', [{'product_id': products[0].id, 'quantity': 1}], format='json')
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post('/api/carts/bulk/', [
+                {'product_id': product.id, 'quantity': 1} for product in products[1:]
+            ], format='json')
+        self.assertEqual(len(response.data['cart']['items']), 150)
+        self.assertEqual(len(small), len(large))
+
+
+class CartTotalsTestCase(CartFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        exempt = Department.objects.create(name='Groceries', is_taxable=False)
+        self.taxable = Product.objects.create(name='Taxable', price='9.99', cost=5, on_hand=20,
+                                              department=self.department, location=self.location)
+        self.exempt = Product.objects.create(name='Exempt', price='4.25', cost=2, on_hand=20,
+                                             department=exempt, location=self.location)
+
+    def assertTotalsMatch(self, cart):
+        cart.refresh_from_db()
+        self.assertEqual({name: getattr(cart, name) for name in ('subtotal', 'tax', 'total', 'item_count')},
+                         cart.computed_totals())
+        return cart
+
+    @max_queries(22)
+    def test_totals_follow_item_writes(self):
+        self.client.post('/api/carts/add_item/', {'product_id': self.taxable.id, 'quantity': 3})
+        self.client.post('/api/carts/add_item/', {'product_id': self.exempt.id, 'quantity': 2})
+        cart = self.assertTotalsMatch(Cart.objects.get(user=self.user))
+        self.assertEqual(cart.subtotal, Decimal('38.47'))
+        self.assertEqual(cart.tax, Decimal('2.40'))
+        self.assertEqual(cart.item_count, 5)
+
+        item = cart.items.get(product=self.taxable)
+        self.client.delete(f'/api/carts/remove_item/?item_id={item.id}')
+        cart = self.assertTotalsMatch(cart)
+        self.assertEqual(cart.total, Decimal('8.50'))
+
+        self.client.post('/api/carts/bulk/', [
+            {'product_id': self.taxable.id, 'quantity': 4},
+            {'product_id': self.exempt.id, 'quantity': -2},
+        ], format='json')
+        cart = self.assertTotalsMatch(cart)
+        self.assertEqual(cart.item_count, 4)
+
+        self.client.post('/api/orders/checkout/')
+        cart = self.assertTotalsMatch(cart)
+        self.assertEqual(cart.total, Decimal('0.00'))
+
+    @max_queries(19)
+    def test_cart_read_is_a_single_row(self):
+        self.client.post('/api/carts/add_item/', {'product_id': self.taxable.id, 'quantity': 1})
+        with self.assertNumQueries(1):
+            cart = Cart.objects.get(user=self.user)
+            self.assertEqual(cart.total, Decimal('10.79'))
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        cart = self.fill_cart(2)
+        Cart.objects.filter(pk=cart.pk).update(total=0, item_count=7)
+
+        out = StringIO()
+        call_command('reconcile_cart_totals', stdout=out)
+        self.assertIn(f'cart {cart.pk}:', out.getvalue())
+        self.assertEqual(Cart.objects.get(pk=cart.pk).item_count, 7)
+
+        call_command('reconcile_cart_totals', '--fix', stdout=StringIO())
+        self.assertTotalsMatch(cart)
+        out = StringIO()
+        call_command('reconcile_cart_totals', stdout=out)
+        self.assertIn('found 0 with drift', out.getvalue())
+
+
+class ProductKeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        department = Department.objects.create(name='Electronics')
+        location = Location.objects.create(name='Warehouse A')
+        Product.objects.bulk_create([
+            Product(name=f'Product {i % 7}', price=i % 4, cost=1,
+                    department=department, location=location)
+            for i in range(45)
+        ])
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(product['id'] for product in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    @max_queries(1)
+    def test_pages_follow_ordering_with_id_tiebreaker(self):
+        for ordering, expected in (
+            ('price', Product.objects.order_by('price', 'id')),
+            ('-price', Product.objects.order_by('-price', '-id')),
+            ('name', Product.objects.order_by('name', 'id')),
+            ('-created_at', Product.objects.order_by('-created_at', '-id')),
+        ):
+            ids = self.walk(f'/api/products/?pagination=keyset&page_size=10&ordering={ordering}')
+            self.assertEqual(ids, list(expected.values_list('id', flat=True)), ordering)
+
+    @max_queries(1)
+    def test_previous_link_returns_the_earlier_page(self):
+        first = self.client.get('/api/products/?pagination=keyset&page_size=10&ordering=price')
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    @max_queries(1)
+    def test_keyset_page_skips_count_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/products/?pagination=keyset&ordering=price')
+        self.assertEqual(len(queries), 1)
+
+    @max_queries(0)
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/products/?pagination=keyset&cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BarcodeLookupTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        department = Department.objects.create(name='Electronics')
+        location = Location.objects.create(name='Warehouse A')
+        self.product = Product.objects.create(name='Scanner Item', price=5, cost=2, on_hand=4,
+                                              barcode='0123456789', department=department,
+                                              location=location)
+
+    @max_queries(1)
+    def test_lookup_is_cached(self):
+        response = self.client.get('/api/products/by-barcode/0123456789/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], self.product.id)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/by-barcode/0123456789/')
+        self.assertEqual(response.data['name'], 'Scanner Item')
+
+    @max_queries(1)
+    def test_unknown_barcode(self):
+        response = self.client.get('/api/products/by-barcode/missing/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @max_queries(1)
+    def test_save_and_inventory_changes_invalidate(self):
+        self.client.get('/api/products/by-barcode/0123456789/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 7
+            self.product.save()
+        response = self.client.get('/api/products/by-barcode/0123456789/')
+        self.assertEqual(response.data['price'], '7.00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.update_inventory(-1)
+        response = self.client.get('/api/products/by-barcode/0123456789/')
+        self.assertEqual(response.data['on_hand'], 3)
+
+    @max_queries(1)
+    def test_barcode_change_evicts_old_code(self):
+        self.client.get('/api/products/by-barcode/0123456789/')
+        product = Product.objects.get(pk=self.product.pk)
+        product.barcode = '999'
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(self.client.get('/api/products/by-barcode/0123456789/').status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/api/products/by-barcode/999/').data['id'], product.id)
+
+    @max_queries(1)
+    def test_delete_invalidates(self):
+        self.client.get('/api/products/by-barcode/0123456789/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        response = self.client.get('/api/products/by-barcode/0123456789/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @max_queries(1)
+    def test_eviction_waits_for_commit(self):
+        self.client.get('/api/products/by-barcode/0123456789/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 7
+            self.product.save()
+            # Until commit other connections still see the old row.
+            response = self.client.get('/api/products/by-barcode/0123456789/')
+            self.assertEqual(response.data['price'], '5.00')
+        response = self.client.get('/api/products/by-barcode/0123456789/')
+        self.assertEqual(response.data['price'], '7.00')
+
+
+class ProductSearchTestCase(TestCase):
+    queries = [
+        ['widget'], ['Widget'], ['wid'], ['blue', 'widget'], ['gadget'],
+        ['0042'], ['steel'], ['café'], ['nothing-matches'], ['blue', 'gad'],
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        department = Department.objects.create(name='Electronics')
+        location = Location.objects.create(name='Warehouse A')
+        rows = [
+            ('Blue Widget', 'A widget in blue', '00420001'),
+            ('Red Widget', 'Steel frame', '00420002'),
+            ('Gadget', 'Pairs with the blue widget', '00990003'),
+            ('Café Grinder', 'Burr grinder', '00990004'),
+            ('Steel Gadget', '', ''),
+        ]
+        self.products = Product.objects.bulk_create([
+            Product(name=name, description=description, barcode=barcode, price=1, cost=1,
+                    department=department, location=location)
+            for name, description, barcode in rows
+        ])
+
+    def ids(self, backend, terms):
+        return set(backend.search(Product.objects.all(), terms).values_list('id', flat=True))
+
+    def test_fts5_matches_substring_backend_on_word_prefixes(self):
+        for terms in self.queries:
+            self.assertEqual(self.ids(SQLiteFTS5SearchBackend(), terms),
+                             self.ids(SimpleSearchBackend(), terms), terms)
+
+    def test_barcode_and_short_terms_keep_substring_matching(self):
+        gadget, steel_gadget = self.products[2], self.products[4]
+        self.assertEqual(self.ids(SQLiteFTS5SearchBackend(), ['0003']), {gadget.id})
+        self.assertEqual(self.ids(SQLiteFTS5SearchBackend(), ['dg']),
+                         self.ids(SimpleSearchBackend(), ['dg']))
+        self.assertIn(steel_gadget.id, self.ids(SQLiteFTS5SearchBackend(), ['dg']))
+
+    def test_index_follows_product_writes(self):
+        product = self.products[3]
+        product.name = 'Espresso Grinder'
+        product.save()
+        backend = SQLiteFTS5SearchBackend()
+        self.assertEqual(self.ids(backend, ['espresso']), {product.id})
+        self.assertEqual(self.ids(backend, ['café']), set())
+        product.delete()
+        self.assertEqual(self.ids(backend, ['grinder']), set())
+
+    @max_queries(2)
+    def test_endpoint_ranks_name_matches_first(self):
+        response = self.client.get('/api/products/?search=blue')
+        names = [product['name'] for product in response.data['results']]
+        self.assertEqual(names, ['Blue Widget', 'Gadget'])
+
+    @max_queries(2)
+    def test_explicit_ordering_overrides_relevance(self):
+        response = self.client.get('/api/products/?search=widget&ordering=-name')
+        names = [product['name'] for product in response.data['results']]
+        self.assertEqual(names, ['Red Widget', 'Gadget', 'Blue Widget'])
+
+
+class CatalogCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(username='admin', password='admin123')
+        self.department = Department.objects.create(name='Electronics')
+        self.location = Location.objects.create(name='Warehouse A')
+        self.product = Product.objects.create(name='Cached', price=5, cost=2,
+                                              department=self.department, location=self.location)
+
+    @max_queries(2)
+    def test_repeat_list_is_served_from_cache(self):
+        first = self.client.get('/api/products/?ordering=price')
+        self.assertIn('ETag', first)
+        self.assertIn('Last-Modified', first)
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/products/?ordering=price')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    @max_queries(1)
+    def test_matching_etag_returns_304_without_queries(self):
+        etag = self.client.get(f'/api/products/{self.product.id}/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/products/{self.product.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    @max_queries(2)
+    def test_catalog_writes_change_the_etag(self):
+        etag = self.client.get('/api/products/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Renamed'
+            self.product.save()
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['name'], 'Renamed')
+
+        self.client.force_authenticate(user=self.admin)
+        etag = self.client.get('/api/departments/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Department.objects.create(name='Toys')
+        response = self.client.get('/api/departments/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(response.data['results']), 2)
+
+    @max_queries(2)
+    def test_stock_changes_keep_department_cache(self):
+        self.client.force_authenticate(user=self.admin)
+        departments = self.client.get('/api/departments/')['ETag']
+        products = self.client.get('/api/products/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.update_inventory(2)
+            reserve_many({self.product.id: 1}, 'cart:1')
+        self.assertEqual(self.client.get('/api/departments/')['ETag'], departments)
+        self.assertNotEqual(self.client.get('/api/products/')['ETag'], products)
+
+    @max_queries(1)
+    def test_zero_timeout_turns_the_cache_off(self):
+        with self.settings(CATALOG_CACHE_TIMEOUT=0):
+            for _ in range(2):
+                with self.assertNumQueries(1):
+                    response = self.client.get(f'/api/products/{self.product.id}/')
+        self.assertNotIn('ETag', response)
+
+    @max_queries(2)
+    def test_stock_changes_invalidate(self):
+        self.client.get('/api/products/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.update_inventory(3)
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.data['results'][0]['on_hand'], 3)
+
+
+class CompiledSerializerTestCase(CartFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.fill_cart(3)
+        product = Product.objects.first()
+        product.image = 'products/repair.webp'
+        product.description = 'Has an image'
+        product.save()
+        self.request = APIRequestFactory().get('/api/products/')
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def test_product_output_is_byte_identical(self):
+        for context in ({}, {'request': Request(self.request)}):
+            queryset = Product.objects.order_by('id')
+            expected = self.render(ProductSerializer(queryset, many=True, context=context).data)
+            fast = ProductReadSerializer(context=context)
+            self.assertEqual(self.render(fast.many_from_values(fast.values(queryset))), expected)
+            self.assertEqual(self.render(fast.many(queryset)), expected)
+
+    def test_cart_output_is_byte_identical(self):
+        cart = Cart.objects.prefetch_related('items__product__department').get(user=self.user)
+        context = {'request': Request(self.request)}
+        self.assertEqual(self.render(CartReadSerializer(context=context).to_representation(cart)),
+                         self.render(CartSerializer(cart, context=context).data))
+
+    @max_queries(2)
+    def test_product_list_endpoint_matches_model_serializer(self):
+        response = self.client.get('/api/products/?ordering=-name')
+        expected = ProductSerializer(Product.objects.order_by('-name'), many=True,
+                                     context={'request': response.wsgi_request}).data
+        self.assertEqual(self.render(response.data['results']), self.render(expected))
+
+
+class AsyncEndpointTestCase(CartFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.fill_cart(3)
+        Product.objects.filter(name='Product 1').update(barcode='0042', price='12.50')
+
+    def assertSameJSON(self, sync_url, async_url, client=None):
+        client = client or self.client
+        expected = client.get(sync_url)
+        response = client.get(async_url)
+        self.assertEqual(response.status_code, expected.status_code)
+        # Pagination links point back at the endpoint that was called.
+        self.assertEqual(json.loads(response.content.decode().replace('/api/async/', '/api/')), expected.json())
+        return response
+
+    @max_queries(3)
+    def test_product_endpoints_match_sync_views(self):
+        anonymous = APIClient()
+        product = Product.objects.get(barcode='0042')
+        for query in ('', '?page_size=2', '?page=2&page_size=2', '?ordering=-price', '?search=product&page_size=1',
+                      f'?department={self.department.id}&max_price=11', '?page=9'):
+            self.assertSameJSON(f'/api/products/{query}', f'/api/async/products/{query}', anonymous)
+        self.assertSameJSON(f'/api/products/{product.id}/', f'/api/async/products/{product.id}/', anonymous)
+        self.assertSameJSON('/api/products/by-barcode/0042/', '/api/async/products/by-barcode/0042/', anonymous)
+        response = anonymous.get('/api/async/products/by-barcode/missing/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @max_queries(1)
+    def test_invalid_filter_is_a_bad_request(self):
+        response = self.assertSameJSON('/api/products/?department=abc', '/api/async/products/?department=abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('department', response.json())
+
+    @max_queries(1)
+    def test_product_detail_is_one_query(self):
+        product = Product.objects.first()
+        with self.assertNumQueries(1):
+            self.client.get(f'/api/async/products/{product.id}/')
+
+    @max_queries(0)
+    def test_cart_requires_a_token(self):
+        self.assertEqual(APIClient().get('/api/async/carts/').status_code, status.HTTP_401_UNAUTHORIZED)
+        response = APIClient().get('/api/async/carts/', HTTP_AUTHORIZATION='Bearer nonsense')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @max_queries(4)
+    def test_cart_matches_sync_view(self):
+        token = RefreshToken.for_user(self.user).access_token
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        response = self.assertSameJSON('/api/carts/', '/api/async/carts/', client)
+        self.assertEqual(len(response.json()['items']), 3)
+
+
+    @max_queries(6)
+    def test_cart_loads_rates_off_the_event_loop(self):
+        # A fresh worker, or one that just saw a rate change, has no table yet.
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        with mock.patch.object(pricing, '_table', None):
+            response = client.get('/api/async/carts/')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['total'], '32.40')
+
+
+class ProductExportTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.department = Department.objects.create(name='Electronics')
+        other = Department.objects.create(name='Garden')
+        location = Location.objects.create(name='Warehouse A')
+        Product.objects.bulk_create([
+            Product(name=f'Product {i}', price=i + 1, cost=1, on_hand=i, barcode=f'{i:04d}',
+                    description='Comma, "quoted"' if i == 0 else '',
+                    department=self.department if i % 2 else other, location=location)
+            for i in range(25)
+        ])
+
+    def read(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    # The department filter validates its id with a query of its own.
+    @max_queries(2)
+    def test_ndjson_matches_serializer(self):
+        response = self.client.get(f'/api/products/export/?format=ndjson&department={self.department.id}')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        expected = ProductSerializer(Product.objects.filter(department=self.department).order_by('id'),
+                                     many=True, context={'request': response.wsgi_request}).data
+        self.assertEqual(rows, json.loads(JSONRenderer().render(expected)))
+
+    @max_queries(1)
+    def test_csv_has_header_and_escapes(self):
+        response = self.client.get('/api/products/export/?format=csv&ordering=price')
+        self.assertIn('filename="products.csv"', response['Content-Disposition'])
+        rows = list(csv.reader(StringIO(self.read(response))))
+        self.assertEqual(rows[0], list(ProductSerializer().fields))
+        self.assertEqual(len(rows), 26)
+        self.assertEqual(rows[1][rows[0].index('description')], 'Comma, "quoted"')
+        self.assertEqual(rows[1][rows[0].index('image')], '')
+
+    @max_queries(1)
+    def test_export_is_a_single_query(self):
+        with self.assertNumQueries(1):
+            self.read(self.client.get('/api/products/export/?format=ndjson'))
+
+    @max_queries(0)
+    def test_unknown_format(self):
+        response = self.client.get('/api/products/export/?format=xml')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ProductImportTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.create_superuser(username='admin', password='admin123'))
+        self.department = Department.objects.create(name='Electronics')
+        self.location = Location.objects.create(name='Warehouse A')
+        self.existing = Product.objects.create(name='Old name', price=5, cost=2, on_hand=3, barcode='1001',
+                                               department=self.department, location=self.location)
+
+    @max_queries(8)
+    def test_csv_upserts_by_barcode_and_reports_errors(self):
+        body = (
+            'barcode,name,price,cost,on_hand,department,location\n'
+            '1001,New name,6.50,2.00,7,Electronics,Warehouse A\n'
+            '2002,Fresh,3.00,1.00,,Electronics,Warehouse A\n'
+            '3003,Broken,abc,1.00,1,Electronics,Warehouse A\n'
+            '4004,Lost,1.00,1.00,1,Nowhere,Warehouse A\n'
+            ',No barcode,1.00,1.00,1,Electronics,Warehouse A\n'
+        )
+        response = self.client.post('/api/products/bulk/', body, content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1))
+        self.assertEqual([error['line'] for error in response.data['errors']], [4, 5, 6])
+        self.assertIn('price', response.data['errors'][0]['error'])
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.price, self.existing.on_hand),
+                         ('New name', Decimal('6.50'), 7))
+        self.assertEqual(Product.objects.get(barcode='2002').on_hand, 0)
+
+    @max_queries(8)
+    def test_csv_booleans_are_case_insensitive(self):
+        body = (
+            'barcode,is_available\n'
+            '1001,false\n'
+            '1002,maybe\n'
+        )
+        response = self.client.post('/api/products/bulk/', body, content_type='text/csv')
+        self.assertEqual([error['line'] for error in response.data['errors']], [3])
+        self.existing.refresh_from_db()
+        self.assertFalse(self.existing.is_available)
+
+        for raw, expected in (('TRUE', True), ('no', False), ('Yes', True), ('0', False), ('1', True)):
+            self.client.post('/api/products/bulk/', f'barcode,is_available\n1001,{raw}\n', content_type='text/csv')
+            self.existing.refresh_from_db()
+            self.assertEqual(self.existing.is_available, expected, raw)
+
+    @max_queries(6)
+    def test_ndjson_partial_update_keeps_other_columns(self):
+        body = '{"barcode": "1001", "price": 9.25}\n\nnot json\n{"barcode": "5005", "name": "New"}\n'
+        response = self.client.post('/api/products/bulk/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual([error['line'] for error in response.data['errors']], [3, 4])
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.price), ('Old name', Decimal('9.25')))
+
+    @max_queries(9)
+    def test_import_is_batched(self):
+        lines = ['barcode,name,price,cost,department,location']
+        lines += [f'{9000 + i},Item {i},1.00,0.50,Electronics,Warehouse A' for i in range(250)]
+        upload = SimpleUploadedFile('feed.csv', '\n'.join(lines).encode('utf-8'), content_type='text/csv')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/products/bulk/', {'file': upload}, format='multipart')
+        self.assertEqual(response.data['created'], 250)
+        self.assertLess(len(queries), 20)
+
+    @max_queries(0)
+    def test_requires_admin(self):
+        self.client.force_authenticate(user=User.objects.create_user(username='user', password='pass12345'))
+        response = self.client.post('/api/products/bulk/', 'barcode\n1\n', content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_management_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as feed:
+            feed.write('barcode,name,price,cost,department,location\n6006,Cmd,1,1,Electronics,Warehouse A\n')
+        self.addCleanup(os.remove, feed.name)
+        out = StringIO()
+        call_command('import_products', feed.name, stdout=out, stderr=StringIO())
+        self.assertIn('Created 1, updated 0, 0 errors', out.getvalue())
+        self.assertTrue(Product.objects.filter(barcode='6006', name='Cmd').exists())
+
+
+class ClaimsAuthenticationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='shopper', password='testpass123')
+
+    def token(self):
+        response = self.client.post('/api/token/', {'username': 'shopper', 'password': 'testpass123'})
+        return response.data['access']
+
+    def get_cart(self, token):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/carts/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        user_queries = [query for query in queries if 'FROM "auth_user"' in query['sql']]
+        return response, len(user_queries)
+
+    @max_queries(6)
+    def test_claims_skip_the_user_query(self):
+        response, user_queries = self.get_cart(self.token())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['user'], self.user.id)
+        self.assertEqual(user_queries, 0)
+
+    @max_queries(7)
+    def test_token_without_claims_is_cached(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.assertEqual(self.get_cart(token)[1], 1)
+        self.assertEqual(self.get_cart(token)[1], 0)
+
+    @max_queries(1)
+    def test_deactivation_rejects_existing_tokens(self):
+        token = self.token()
+        self.user.is_active = False
+        self.user.save()
+        response, _ = self.get_cart(token)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @max_queries(6)
+    def test_invalidate_hook_covers_queryset_updates(self):
+        token = self.token()
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.get_cart(token)[0].status_code, status.HTTP_200_OK)
+        invalidate_user(self.user.pk)
+        self.assertEqual(self.get_cart(token)[0].status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @max_queries(6)
+    def test_invalidation_survives_cache_loss(self):
+        token = self.token()
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        invalidate_user(self.user.pk)
+        # A new worker, or an evicted entry, reads the watermark back.
+        cache.clear()
+        self.assertEqual(self.get_cart(token)[0].status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @max_queries(6)
+    def test_logins_keep_existing_tokens(self):
+        token = self.token()
+        update_last_login(None, self.user)
+        self.assertFalse(TokenWatermark.objects.exists())
+        self.assertEqual(self.get_cart(token)[1], 0)
+
+        self.user.set_password('changed-pass-456')
+        self.user.save(update_fields=['password'])
+        self.assertTrue(TokenWatermark.objects.filter(user_id=self.user.pk).exists())
+        self.assertEqual(self.get_cart(token)[1], 1)
+
+    @max_queries(2)
+    def test_role_change_applies_to_existing_tokens(self):
+        token = self.token()
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/api/locations/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @max_queries(1)
+    def test_deferred_fields_load_on_demand(self):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.token()}')
+        user, _ = ClaimsJWTAuthentication().authenticate(request)
+        with self.assertNumQueries(0):
+            self.assertEqual((user.username, user.is_staff), ('shopper', False))
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('testpass123'))
+
+
+class DatabaseSettingsTestCase(SimpleTestCase):
+    databases = {'default'}
+
+    def test_sqlite_defaults(self):
+        config = database_settings({}, Path('/srv/app'))
+        self.assertEqual(config['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(config['NAME'], Path('/srv/app/db.sqlite3'))
+        self.assertEqual((config['CONN_MAX_AGE'], config['CONN_HEALTH_CHECKS']), (60, True))
+
+    def test_postgres_from_environment(self):
+        config = database_settings({
+            'DATABASE_ENGINE': 'postgresql', 'DATABASE_NAME': 'shop', 'DATABASE_HOST': 'db',
+            'DATABASE_CONN_MAX_AGE': 'none', 'DATABASE_CONN_HEALTH_CHECKS': 'false',
+        }, Path('/srv/app'))
+        self.assertEqual(config['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual((config['NAME'], config['HOST']), ('shop', 'db'))
+        self.assertEqual((config['CONN_MAX_AGE'], config['CONN_HEALTH_CHECKS']), (None, False))
+
+    def test_asgi_disables_persistent_connections(self):
+        self.assertEqual(database_settings({'DJANGO_ASGI': '1'}, Path('/srv/app'))['CONN_MAX_AGE'], 0)
+        for max_age in ('60', 'none'):
+            with self.assertRaises(ImproperlyConfigured):
+                database_settings({'DJANGO_ASGI': '1', 'DATABASE_CONN_MAX_AGE': max_age}, Path('/srv/app'))
+
+    def test_pool_requires_postgres(self):
+        with self.assertRaises(ImproperlyConfigured):
+            database_settings({'DATABASE_POOL': '2:10'}, Path('/srv/app'))
+
+    def test_sqlite_pragma_overrides(self):
+        pragmas = sqlite_pragmas({'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_MMAP_SIZE': ''})
+        self.assertEqual(pragmas['synchronous'], 'FULL')
+        self.assertNotIn('mmap_size', pragmas)
+        self.assertEqual(pragmas['journal_mode'], 'WAL')
+
+    def test_pragmas_applied_on_connect(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], int(settings.SQLITE_PRAGMAS['busy_timeout']))
+
+
+class OrderHistoryTestCase(CartFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Widget', price=10, cost=5, on_hand=0,
+                                              department=self.department, location=self.location)
+
+    def place_orders(self, count, lines=3):
+        orders = Order.objects.bulk_create([Order(user=self.user, total=30) for _ in range(count)])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.product, quantity=1, price=10)
+            for order in orders for _ in range(lines)
+        ])
+        return orders
+
+    @max_queries(2)
+    def test_list_query_count_is_constant(self):
+        self.place_orders(1)
+        with self.assertNumQueries(2):
+            self.client.get('/api/orders/')
+        self.place_orders(40)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/orders/')
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(len(response.data['results'][0]['items']), 3)
+        self.assertNotIn('count', response.data)
+
+    @max_queries(2)
+    def test_pages_walk_newest_first(self):
+        self.place_orders(45, lines=1)
+        ids, url = [], '/api/orders/?page_size=10'
+        while url:
+            response = self.client.get(url)
+            ids += [order['id'] for order in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    @max_queries(1)
+    def test_other_users_orders_are_hidden(self):
+        order = self.place_orders(1)[0]
+        self.client.force_authenticate(user=User.objects.create_user(username='other', password='pass12345'))
+        self.assertEqual(self.client.get('/api/orders/').data['results'], [])
+        self.assertEqual(self.client.get(f'/api/orders/{order.id}/').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class OrderItemSnapshotTestCase(CartFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Lamp', price='19.99', cost='8.00', barcode='L-1',
+                                              on_hand=5, department=self.department, location=self.location)
+        self.client.post('/api/carts/add_item/', {'product_id': self.product.id, 'quantity': 3})
+        self.client.post('/api/orders/checkout/')
+
+    @max_queries(2)
+    def test_checkout_snapshots_product(self):
+        item = OrderItem.objects.get()
+        self.assertEqual((item.product_name, item.barcode, item.cost, item.tax),
+                         ('Lamp', 'L-1', Decimal('8.00'), Decimal('4.80')))
+
+        self.product.name = 'Renamed lamp'
+        self.product.save()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/orders/')
+        self.assertFalse(any('"cart_product"' in query['sql'] for query in queries))
+        self.assertEqual(response.data['results'][0]['items'][0]['product_name'], 'Lamp')
+        self.assertEqual(response.data['results'][0]['items'][0]['tax'], '4.80')
+
+    def test_migration_backfills_existing_items(self):
+        OrderItem.objects.update(product_name='', barcode='', cost=0, tax=0)
+        migration = importlib.import_module('cart.migrations.0010_order_item_snapshots')
+        migration.backfill_order_item_snapshots(django_apps, None)
+        item = OrderItem.objects.get()
+        self.assertEqual((item.product_name, item.barcode, item.cost, item.tax),
+                         ('Lamp', 'L-1', Decimal('8.00'), Decimal('4.80')))
+
+
+class SalesReportTestCase(CartFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.grocery = Department.objects.create(name='Grocery', is_taxable=False)
+        self.lamp = Product.objects.create(name='Lamp', price='20.00', cost='12.00', on_hand=50,
+                                           department=self.department, location=self.location)
+        self.bread = Product.objects.create(name='Bread', price='3.00', cost='1.00', on_hand=50,
+                                            department=self.grocery, location=self.location)
+        for quantities in ((2, 5), (1, 0)):
+            for product, quantity in zip((self.lamp, self.bread), quantities):
+                if quantity:
+                    self.client.post('/api/carts/add_item/', {'product_id': product.id, 'quantity': quantity})
+            self.client.post('/api/orders/checkout/')
+        self.admin = User.objects.create_superuser(username='admin', password='admin123')
+
+    def rollups(self):
+        return sorted(SalesRollup.objects.values_list('day', 'department_id', 'location_id', 'units',
+                                                      'revenue', 'tax', 'cost'))
+
+    def test_checkout_maintains_rollups(self):
+        today = timezone.localdate()
+        self.assertEqual(self.rollups(), sorted([
+            (today, self.department.id, self.location.id, 3, Decimal('60.00'), Decimal('4.80'), Decimal('36.00')),
+            (today, self.grocery.id, self.location.id, 5, Decimal('15.00'), Decimal('0.00'), Decimal('5.00')),
+        ]))
+
+    def test_rebuild_matches_incremental(self):
+        incremental = self.rollups()
+        SalesRollup.objects.update(units=0)
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    @max_queries(1)
+    def test_report_reads_only_rollups(self):
+        self.client.force_authenticate(user=self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/reports/sales/?group_by=department')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(any('cart_orderitem' in query['sql'] for query in queries))
+        self.assertEqual(response.data, [
+            {'department': self.department.id, 'department_name': 'Electronics', 'units': 3,
+             'revenue': '60.00', 'tax': '4.80', 'cost': '36.00', 'margin': '24.00', 'margin_percent': '40.00'},
+            {'department': self.grocery.id, 'department_name': 'Grocery', 'units': 5,
+             'revenue': '15.00', 'tax': '0.00', 'cost': '5.00', 'margin': '10.00', 'margin_percent': '66.67'},
+        ])
+
+        today = timezone.localdate().isoformat()
+        response = self.client.get(f'/api/reports/sales/?start={today}&end={today}&location={self.location.id}')
+        self.assertEqual([(row['day'], row['units']) for row in response.data], [(today, 8)])
+
+    @max_queries(1)
+    def test_report_handles_extreme_margins(self):
+        clearance = Department.objects.create(name='Clearance')
+        SalesRollup.objects.create(day=timezone.localdate(), department=clearance, location=self.location,
+                                   units=1, revenue='0.01', tax='0.00', cost='20.00')
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(f'/api/reports/sales/?group_by=department&department={clearance.id}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data[0]['margin'], response.data[0]['margin_percent']), ('-19.99', '-199900.00'))
+
+    @max_queries(0)
+    def test_report_validation_and_permissions(self):
+        self.assertEqual(self.client.get('/api/reports/sales/').status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=self.admin)
+        self.assertEqual(self.client.get('/api/reports/sales/?group_by=product').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/api/reports/sales/?start=2024-02-01&end=2024-01-01').status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+
+class InventoryLedgerTestCase(CartFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.lamp = Product.objects.create(name='Lamp', price=20, cost=12, on_hand=10,
+                                           department=self.department, location=self.location)
+        self.bread = Product.objects.create(name='Bread', price=3, cost=1, on_hand=5,
+                                            department=self.department, location=self.location)
+
+    def on_hand(self):
+        return dict(Product.objects.values_list('id', 'on_hand'))
+
+    @max_queries(22)
+    def test_every_stock_change_is_recorded(self):
+        self.client.post('/api/carts/add_item/', {'product_id': self.lamp.id, 'quantity': 3})
+        self.client.post('/api/carts/bulk/', [
+            {'product_id': self.lamp.id, 'quantity': -1},
+            {'product_id': self.bread.id, 'quantity': 2},
+        ], format='json')
+        self.bread.on_hand = 20
+        self.bread.save()
+
+        reasons = list(InventoryMovement.objects.filter(product=self.bread).order_by('id')
+                       .values_list('reason', 'quantity'))
+        self.assertEqual(reasons, [('restock', 5), ('reserve', -2), ('adjustment', 17)])
+        self.assertEqual(ledger_balances(), self.on_hand())
+
+        order = self.client.post('/api/orders/checkout/').data
+        self.assertEqual(ledger_balances(), self.on_hand())
+        sold = InventoryMovement.objects.filter(reason=InventoryMovement.CHECKOUT, reference=f"order:{order['id']}")
+        self.assertEqual(dict(sold.values_list('product_id', 'quantity')), {self.lamp.id: -2, self.bread.id: -2})
+        with self.assertNumQueries(1):
+            self.assertEqual(available([self.lamp.id, self.bread.id]), {self.lamp.id: 8, self.bread.id: 20})
+
+    @max_queries(22)
+    def test_compaction_keeps_balances(self):
+        self.client.post('/api/carts/add_item/', {'product_id': self.lamp.id, 'quantity': 4})
+        self.assertEqual(compact_ledger(older_than=timedelta(0)), (2, 4))
+        self.assertEqual(compact_ledger(older_than=timedelta(0)), (0, 0))
+        checkpoint = InventoryCheckpoint.objects.get(product=self.lamp)
+        self.assertEqual(checkpoint.balance, 6)
+
+        self.lamp.update_inventory(-1)
+        with self.assertNumQueries(2):
+            self.assertEqual(ledger_balances([self.lamp.id]), {self.lamp.id: 5})
+        self.assertEqual(ledger_balances(), self.on_hand())
+
+    def test_compaction_folds_by_id_not_timestamp(self):
+        self.lamp.update_inventory(-2)
+        restock, adjustment = InventoryMovement.objects.filter(product=self.lamp).order_by('id')
+        # Another process's clock stamped the earlier id later.
+        InventoryMovement.objects.filter(pk=restock.pk).update(created_at=timezone.now() + timedelta(hours=1))
+        InventoryMovement.objects.filter(pk=adjustment.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        compact_ledger()
+        self.assertEqual(InventoryCheckpoint.objects.get(product=self.lamp).balance, 8)
+        self.assertEqual(ledger_balances([self.lamp.id]), {self.lamp.id: 8})
+
+    def test_check_inventory_reports_and_fixes_drift(self):
+        Product.objects.filter(pk=self.lamp.pk).update(on_hand=7)
+        out = StringIO()
+        call_command('check_inventory', stdout=out)
+        self.assertIn(f'product {self.lamp.id}: on_hand 7 != ledger 10', out.getvalue())
+        self.assertIn('found 1 with drift', out.getvalue())
+
+        call_command('check_inventory', '--fix', stdout=StringIO())
+        self.assertEqual(ledger_balances(), self.on_hand())
+        self.assertTrue(InventoryMovement.objects.filter(reference='consistency-check', quantity=-3).exists())
+
+
+class CartReaperTestCase(CartFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = [
+            Product.objects.create(name=f'Product {i}', price=10, cost=5, on_hand=10,
+                                   department=self.department, location=self.location)
+            for i in range(3)
+        ]
+        self.carts = []
+        for i in range(4):
+            user = User.objects.create_user(username=f'shopper{i}', password='testpass123')
+            cart = Cart.objects.create(user=user)
+            for product in self.products:
+                CartItem.objects.create(cart=cart, product=product, quantity=2)
+            self.carts.append(cart)
+        stale = [cart.pk for cart in self.carts[:3]]
+        Cart.objects.filter(pk__in=stale).update(updated_at=timezone.now() - timedelta(hours=3))
+
+    def test_reaps_only_idle_carts(self):
+        result = reap_abandoned_carts(timedelta(hours=2), batch_size=2)
+        self.assertEqual((result.carts, result.lines, result.units), (3, 9, 18))
+
+        self.assertEqual(set(Product.objects.values_list('on_hand', flat=True)), {8})
+        self.assertEqual(CartItem.objects.count(), 3)
+        self.assertTrue(all(item.cart_id == self.carts[3].pk for item in CartItem.objects.all()))
+        emptied = Cart.objects.get(pk=self.carts[0].pk)
+        self.assertEqual((emptied.item_count, emptied.total), (0, Decimal('0.00')))
+        self.assertEqual(ledger_balances(), dict(Product.objects.values_list('id', 'on_hand')))
+
+        self.assertEqual(reap_abandoned_carts(timedelta(hours=2)).carts, 0)
+
+    def test_release_is_grouped_by_product(self):
+        with CaptureQueriesContext(connection) as queries:
+            reap_abandoned_carts(timedelta(hours=2))
+        product_updates = [query for query in queries if query['sql'].startswith('UPDATE "cart_product"')]
+        self.assertEqual(len(product_updates), 1)
+        releases = InventoryMovement.objects.filter(reference='reaper')
+        self.assertEqual(sorted(releases.values_list('quantity', flat=True)), [6, 6, 6])
+
+    def test_command_and_scheduler(self):
+        out = StringIO()
+        call_command('reap_carts', '--ttl', '7200', stdout=out)
+        self.assertIn('Reaped 3 carts: 9 lines, 18 units released', out.getvalue())
+
+        ran = threading.Event()
+        def job():
+            ran.set()
+        scheduler = Scheduler(job, interval=0.01)
+        scheduler.start()
+        self.assertTrue(ran.wait(5))
+        scheduler.stop()
+        scheduler.join(5)
+        self.assertFalse(scheduler.is_alive())
+
+
+class MetricsTestCase(CartFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+        Product.objects.create(name='Lamp', price=20, cost=12, on_hand=10,
+                               department=self.department, location=self.location)
+
+    @max_queries(2)
+    def test_requests_are_measured(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/products/'))
+        with self.settings(METRICS_SERVER_TIMING=True):
+            response = self.client.get('/api/products/')
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"$')
+
+        metrics = self.client.get('/api/metrics')
+        self.assertEqual(metrics.status_code, status.HTTP_200_OK)
+        self.assertTrue(metrics['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = metrics.content.decode()
+        self.assertIn('http_requests_total{route="product-list",method="GET",status="200"} 2', text)
+        self.assertIn('http_request_duration_seconds_count{route="product-list"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket{route="product-list",le="+Inf"} 2', text)
+        self.assertIn('http_response_size_bytes_count{route="product-list"} 2', text)
+        self.assertRegex(text, r'db_queries_total\{route="product-list"\} [1-9]')
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+
+    def test_async_requests_stay_async(self):
+        async def view(request):
+            return HttpResponse(str(await Product.objects.acount()))
+
+        middleware = MetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = AsyncRequestFactory().get('/api/async/products/')
+        request.resolver_match = resolve('/api/async/products/')
+        response = async_to_sync(middleware)(request)
+        self.assertEqual(response.content, b'1')
+        text = registry.render()
+        self.assertIn('http_requests_total{route="async-product-list",method="GET",status="200"} 1', text)
+        self.assertIn('db_queries_total{route="async-product-list"} 1', text)
+
+    @max_queries(0)
+    def test_metrics_are_limited_to_allowed_addresses(self):
+        response = self.client.get('/api/metrics', REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_overhead_is_under_50_microseconds(self):
+        request = APIRequestFactory().get('/api/products/')
+        request.resolver_match = resolve('/api/products/')
+        response = HttpResponse(b'{}')
+
+        def view(request):
+            return response
+
+        def per_call(handler, calls=2000):
+            started = time.perf_counter()
+            for _ in range(calls):
+                handler(request)
+            return (time.perf_counter() - started) / calls
+
+        middleware = MetricsMiddleware(view)
+        overhead = min(per_call(middleware) for _ in range(5)) - min(per_call(view) for _ in range(5))
+        self.assertLess(overhead, 50e-6)
+
+
+class QueryCheckTestCase(CartFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.fill_cart(3)
+        self.request = APIRequestFactory().get('/api/carts/')
+
+    def lazy_view(self, request):
+        names = []
+        for item in CartItem.objects.all():
+            names.append(item.product.name)
+        return HttpResponse(', '.join(names))
+
+    def eager_view(self, request):
+        names = [item.product.name for item in CartItem.objects.select_related('product')]
+        return HttpResponse(', '.join(names))
+
+    def test_repeated_lazy_loads_raise_with_call_site(self):
+        with self.assertRaises(NPlusOneError) as caught:
+            QueryCheckMiddleware(self.lazy_view)(self.request)
+        self.assertIn('3x from cart/tests.py', str(caught.exception))
+        self.assertIn('in lazy_view', str(caught.exception))
+        QueryCheckMiddleware(self.eager_view)(self.request)
+
+    def test_async_requests_are_checked(self):
+        async def view(request):
+            return await sync_to_async(self.lazy_view)(request)
+
+        middleware = QueryCheckMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with self.assertRaises(NPlusOneError) as caught:
+            async_to_sync(middleware)(self.request)
+        self.assertIn('in lazy_view', str(caught.exception))
+
+    def test_streamed_queries_are_checked(self):
+        def view(request):
+            return StreamingHttpResponse(item.product.name for item in CartItem.objects.all())
+
+        response = QueryCheckMiddleware(view)(self.request)
+        with self.assertRaises(NPlusOneError) as caught:
+            b''.join(response.streaming_content)
+        self.assertIn('3x from cart/tests.py', str(caught.exception))
+
+        async def names():
+            for item in await sync_to_async(list)(CartItem.objects.select_related('product')):
+                yield item.product.name
+
+        async def async_view(request):
+            return StreamingHttpResponse(names())
+
+        @max_queries(0)
+        def consume():
+            async def read():
+                response = await QueryCheckMiddleware(async_view)(self.request)
+                return [chunk async for chunk in response.streaming_content]
+            return async_to_sync(read)()
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'ran 1 queries, more than the 0 allowed.'):
+            consume()
+
+    def test_warn_mode(self):
+        with self.settings(NPLUSONE_MODE='warn'), self.assertWarns(UserWarning), \
+                self.assertLogs('cart.querycheck', 'WARNING'):
+            QueryCheckMiddleware(self.lazy_view)(self.request)
+
+    def test_in_lists_share_a_shape(self):
+        self.assertEqual(query_shape('SELECT 1 WHERE id IN (%s, %s, %s)'), query_shape('SELECT 1 WHERE id IN (%s)'))
+
+    def test_max_queries_budget(self):
+        @max_queries(0)
+        def within_budget():
+            return QueryCheckMiddleware(self.eager_view)(self.request)
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'GET /api/carts/ ran 1 queries, more than the 0 allowed.'):
+            within_budget()
+
+
+class BenchmarkSuiteTestCase(TestCase):
+    def test_seed_shoppers(self):
+        seed_catalog(50, departments=3, locations=2, on_hand=100)
+        users = seed_shoppers(10, carts=4, orders=30, lines=3, days=5)
+        self.assertEqual(len(users), 10)
+        self.assertEqual(Cart.objects.count(), 4)
+        self.assertEqual(Order.objects.count(), 30)
+        self.assertEqual(Order.objects.dates('created_at', 'day').count(), 5)
+        self.assertTrue(self.client.login(username='shopper0', password='bench-password'))
+
+        out = StringIO()
+        call_command('reconcile_cart_totals', stdout=out)
+        self.assertIn('found 0 with drift', out.getvalue())
+        call_command('check_inventory', stdout=out)
+        self.assertIn('Checked 50 products, found 0 with drift', out.getvalue())
+        sold = OrderItem.objects.aggregate(units=Sum('quantity'))['units']
+        self.assertEqual(SalesRollup.objects.aggregate(units=Sum('units'))['units'], sold)
+
+    def test_scenarios_through_the_test_client(self):
+        seed_catalog(30, departments=2, locations=2, on_hand=1000)
+        user = seed_shoppers(1, orders=25)[0]
+        token = str(RefreshToken.for_user(user).access_token)
+        products = list(Product.objects.filter(is_available=True).values_list('id', flat=True))
+        departments = list(Department.objects.values_list('id', flat=True))
+        session = Session(ClientTransport(), token, products, departments)
+
+        results = {name: run_scenario(scenario, [session], duration=0.2) for name, scenario in SCENARIOS.items()}
+        self.assertEqual(set(results['browse']), {'product list (filtered)', 'product detail'})
+        self.assertEqual(set(results['order_history']), {'order history', 'order history (next page)'})
+        for endpoints in results.values():
+            for summary in endpoints.values():
+                self.assertEqual(summary['errors'], 0)
+                self.assertGreater(summary['runs'], 0)
+                self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+        json.dumps(results)
+
+    def test_compare_flags_p95_regressions(self):
+        baseline = {'browse': {'product detail': {'p95_ms': 10.0}, 'product list (filtered)': {'p95_ms': 10.0}}}
+        current = {'browse': {'product detail': {'p95_ms': 10.5}, 'product list (filtered)': {'p95_ms': 12.0}},
+                   'checkout': {'checkout': {'p95_ms': 50.0}}}
+        rows, regressions = compare_results(baseline, current, threshold=10)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual([(label, round(change)) for _, label, _, _, change in regressions],
+                         [('product list (filtered)', 20)])
+
+
+class PricingTestCase(CartFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.grocery = Department.objects.create(name='Grocery', is_taxable=False)
+        self.store = Location.objects.create(name='Store B')
+        self.lamp = Product.objects.create(name='Lamp', price='19.99', cost=10, on_hand=50,
+                                           department=self.department, location=self.location)
+        self.bread = Product.objects.create(name='Bread', price='3.00', cost=1, on_hand=50,
+                                            department=self.grocery, location=self.location)
+        # Rates are cached per process; start and end every test from the table in the database.
+        invalidate_rates()
+        self.addCleanup(rate_table)
+        self.addCleanup(invalidate_rates)
+
+    def test_most_specific_rate_wins(self):
+        table = RateTable('0.08', [(1, None, '0.07'), (None, 2, '0.02'), (1, 2, '0.05')])
+        self.assertEqual(table.rate(1, 2), Decimal('0.05'))
+        self.assertEqual(table.rate(1, 3), Decimal('0.07'))
+        self.assertEqual(table.rate(9, 2), Decimal('0.02'))
+        self.assertEqual(table.rate(9, 9), Decimal('0.08'))
+        self.assertEqual(table.rate(1, 2, is_taxable=False), Decimal('0'))
+
+    def test_lines_round_half_up_per_line(self):
+        table = RateTable('0.10')
+        rows = [(Decimal('0.05'), 1, True, 1, 1), ('0.15', 3, True, 1, 1), (2.5, 2, False, 1, 1)]
+        self.assertEqual(price_lines(rows, table), [
+            (Decimal('0.05'), Decimal('0.01')),
+            (Decimal('0.45'), Decimal('0.05')),
+            (Decimal('5.0'), Decimal('0.00')),
+        ])
+        totals = cart_totals([(7, *row) for row in rows], table)
+        self.assertEqual(totals[7], {'subtotal': Decimal('5.50'), 'tax': Decimal('0.06'),
+                                     'total': Decimal('5.56'), 'item_count': 6})
+
+    @max_queries(23)
+    def test_location_rate_applies_to_cart_and_checkout(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            TaxRate.objects.create(location=self.location, rate='0.05')
+        self.client.post('/api/carts/add_item/', {'product_id': self.lamp.id, 'quantity': 2})
+        response = self.client.post('/api/carts/add_item/', {'product_id': self.bread.id, 'quantity': 1})
+        lamp_line = next(item for item in response.data['items'] if item['product']['id'] == self.lamp.id)
+        self.assertEqual((lamp_line['subtotal'], lamp_line['tax']), ('39.98', '2.00'))
+        self.assertEqual((response.data['subtotal'], response.data['tax'], response.data['total']),
+                         ('42.98', '2.00', '44.98'))
+
+        response = self.client.post('/api/orders/checkout/')
+        self.assertEqual(response.data['total'], '44.98')
+        self.assertEqual(OrderItem.objects.get(product=self.lamp).tax, Decimal('2.00'))
+
+    @max_queries(20)
+    def test_rate_changes_reprice_stored_cart_totals(self):
+        self.client.post('/api/carts/add_item/', {'product_id': self.lamp.id, 'quantity': 1})
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(cart.tax, Decimal('1.60'))
+
+        rate = TaxRate.objects.create(department=self.department, rate='0.10')
+        cart.refresh_from_db()
+        self.assertEqual((cart.tax, cart.total), (Decimal('2.00'), Decimal('21.99')))
+        rate.delete()
+        cart.refresh_from_db()
+        self.assertEqual(cart.tax, Decimal('1.60'))
+
+    @max_queries(20)
+    def test_price_changes_reprice_open_carts(self):
+        kettle = Product.objects.create(name='Kettle', price=10, cost=5, on_hand=10,
+                                        department=self.department, location=self.location)
+        self.client.post('/api/carts/add_item/', {'product_id': kettle.id, 'quantity': 1})
+        kettle.price = 20
+        with self.captureOnCommitCallbacks(execute=True):
+            kettle.save()
+        self.client.post('/api/carts/add_item/', {'product_id': kettle.id, 'quantity': 1})
+
+        response = self.client.get('/api/carts/')
+        self.assertEqual(response.data['items'][0]['subtotal'], '40.00')
+        self.assertEqual((response.data['subtotal'], response.data['tax'], response.data['total']),
+                         ('40.00', '3.20', '43.20'))
+        response = self.client.post('/api/orders/checkout/')
+        self.assertEqual(response.data['total'], '43.20')
+
+    @max_queries(23)
+    def test_taxability_changes_reprice_open_carts(self):
+        self.client.post('/api/carts/add_item/', {'product_id': self.bread.id, 'quantity': 2})
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(cart.tax, Decimal('0.00'))
+        grocery = Department.objects.get(pk=self.grocery.pk)
+        grocery.is_taxable = True
+        with self.captureOnCommitCallbacks(execute=True):
+            grocery.save()
+        cart.refresh_from_db()
+        self.assertEqual((cart.tax, cart.total), (Decimal('0.48'), Decimal('6.48')))
+
+    def test_other_product_changes_leave_carts_alone(self):
+        lamp = Product.objects.get(pk=self.lamp.pk)
+        with mock.patch('cart.signals.reprice_carts') as reprice, self.captureOnCommitCallbacks(execute=True):
+            lamp.name = 'Desk lamp'
+            lamp.save()
+            lamp.price = '19.99'
+            lamp.on_hand = 40
+            lamp.save(update_fields=['price', 'on_hand'])
+        reprice.assert_not_called()
+
+    def test_rate_changes_are_published_on_commit(self):
+        version = shared_cache.get(RATES_VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            TaxRate.objects.create(department=self.department, rate='0.10')
+            self.assertEqual(shared_cache.get(RATES_VERSION_KEY), version)
+        self.assertNotEqual(shared_cache.get(RATES_VERSION_KEY), version)
+        self.assertEqual(rate_table().rate(self.location.id, self.department.id), Decimal('0.10'))
+
+    def test_other_processes_find_rate_changes_in_the_database(self):
+        # Another worker holds the old table; its cache never saw the change.
+        old_table, old_version = rate_table(), shared_cache.get(RATES_VERSION_KEY)
+        TaxRate.objects.create(department=self.department, rate='0.10')
+        cache.clear()
+        with mock.patch.multiple(pricing, _table=old_table, _version=old_version, _checked_at=float('-inf')):
+            with self.settings(TAX_RATE_CHECK_INTERVAL=5):
+                table = rate_table()
+        self.assertNotEqual(old_version, rates_version())
+        self.assertEqual(table.rate(self.location.id, self.department.id), Decimal('0.10'))
+
+    @max_queries(17)
+    def test_cart_lines_are_priced_in_one_batch(self):
+        self.client.post('/api/carts/bulk/', [
+            {'product_id': self.lamp.id, 'quantity': 1}, {'product_id': self.bread.id, 'quantity': 2},
+        ], format='json')
+        with mock.patch('cart.models.price_lines', side_effect=price_lines) as per_item, \
+                mock.patch('cart.pricing.price_lines', side_effect=price_lines) as batched:
+            response = self.client.get('/api/carts/')
+        self.assertEqual(len(response.data['items']), 2)
+        self.assertEqual(per_item.call_count, 0)
+        self.assertEqual(batched.call_count, 1)
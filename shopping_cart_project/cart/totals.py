@@ -0,0 +1,10 @@
+# cart/totals.py
+
+from decimal import Decimal
+
+CENT = Decimal('0.01')
+TOTAL_FIELDS = ('subtotal', 'tax', 'total', 'item_count')
+
+
+def empty_totals():
+    return {'subtotal': Decimal('0.00'), 'tax': Decimal('0.00'), 'total': Decimal('0.00'), 'item_count': 0}
@@ -1,7 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
-from .views import ProductViewSet, CartViewSet, OrderViewSet, LocationViewSet, DepartmentViewSet, register_user, CustomTokenObtainPairView
+from . import async_views
+from .metrics import metrics_view
+from .views import ProductViewSet, CartViewSet, OrderViewSet, LocationViewSet, DepartmentViewSet, register_user, CustomTokenObtainPairView, SalesReportViewSet
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet)
@@ -9,6 +11,7 @@ router.register(r'locations', LocationViewSet)
 router.register(r'departments', DepartmentViewSet)
 router.register(r'carts', CartViewSet, basename='cart')
 router.register(r'orders', OrderViewSet, basename='order')
+router.register(r'reports/sales', SalesReportViewSet, basename='sales-report')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -16,4 +19,9 @@ urlpatterns = [
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('register/', register_user, name='register'),
     path('carts/remove_item/', CartViewSet.as_view({'delete': 'remove_item'}), name='cart-remove-item'),
+    path('async/products/', async_views.product_list, name='async-product-list'),
+    path('async/products/<int:pk>/', async_views.product_detail, name='async-product-detail'),
+    path('async/products/by-barcode/<str:code>/', async_views.product_by_barcode, name='async-product-by-barcode'),
+    path('async/carts/', async_views.cart_detail, name='async-cart-detail'),
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -5,19 +5,33 @@ from django.core.exceptions import ValidationError
 from rest_framework import viewsets, filters, status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Location, Department, Product, CartItem, Cart, Order, OrderItem
+from .models import Location, Department, Product, CartItem, Cart, Order, OrderItem, SalesRollup
 from .serializers import (
     LocationSerializer, DepartmentSerializer, ProductSerializer, 
-    CartItemSerializer, CartSerializer, OrderSerializer, UserSerializer
+    CartItemSerializer, CartSerializer, OrderSerializer, UserSerializer,
+    CartItemDeltaSerializer, ProductReadSerializer, CartReadSerializer,
+    SalesReportQuerySerializer, SalesReportRowSerializer
 )
 from .filters import ProductFilter
-from rest_framework.pagination import PageNumberPagination
+from .search import ProductSearchFilter
 from django.db import transaction
+from django.db.models import Prefetch, Sum, prefetch_related_objects
+from django.utils import timezone
 from .permissions import IsAdminOrReadOnly, IsOwnerOrAdmin
+from .inventory import record_sale, reserve_many, release_many
+from .cache import CATALOG_VERSION_KEY, PRODUCTS_VERSION_KEY, get_product_by_barcode
+from .pricing import price_items, price_line, rate_table
+from .totals import empty_totals
+from .reports import record_sales
+from .mixins import CachedCatalogMixin, FastListMixin
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAdminUser
 import logging
-# from .pagination import ProductPagination
+from decimal import Decimal
+from .pagination import ProductPagination, ProductKeysetPagination, OrderPagination
+from .renderers import NDJSONRenderer, CSVRenderer
+from .importers import PARSERS, ProductImporter, decode_lines, guess_format
+from django.http import StreamingHttpResponse
 
 
 logger = logging.getLogger(__name__)
@@ -25,9 +39,26 @@ logger = logging.getLogger(__name__)
 
 class CartViewSet(viewsets.ModelViewSet):
     serializer_class = CartSerializer
-    
+    read_serializer_class = CartReadSerializer
+
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        # Load every line with its product and department up front so that
+        # serialization and Cart.total never fall back to per-item queries.
+        items = CartItem.objects.select_related('product__department')
+        return Cart.objects.filter(user=self.request.user).prefetch_related(
+            Prefetch('items', queryset=items)
+        )
+
+    def cart_data(self, cart, context=None):
+        context = self.get_serializer_context() if context is None else context
+        # Price every line in one batch; the item serializer then only reads.
+        if 'items' not in getattr(cart, '_prefetched_objects_cache', {}):
+            prefetch_related_objects([cart], Prefetch('items', queryset=CartItem.objects.select_related(
+                'product__department')))
+        price_items(cart.items.all())
+        if self.read_serializer_class is None:
+            return self.serializer_class(cart, context=context).data
+        return self.read_serializer_class(context=context).to_representation(cart)
 
     @action(detail=False, methods=['delete'])
     def remove_item(self, request):
@@ -36,20 +67,18 @@ class CartViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Item ID is required'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            cart_item = CartItem.objects.get(id=item_id, cart__user=request.user)
+            cart_item = CartItem.objects.select_related('product__department').get(
+                id=item_id, cart__user=request.user)
             cart_item.delete()
-            cart = self.get_queryset().first()
-            serializer = self.get_serializer(cart)
-            return Response(serializer.data)
+            return Response(self.cart_data(self.get_queryset().first()))
         except CartItem.DoesNotExist:
             return Response({'error': 'Item not found in cart'}, status=status.HTTP_404_NOT_FOUND)
 
 
 
     def list(self, request):
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        serializer = self.get_serializer(cart)
-        return Response(serializer.data)
+        cart, created = self.get_queryset().get_or_create(user=request.user)
+        return Response(self.cart_data(cart))
 
     @action(detail=False, methods=['post'])
     def add_item(self, request):
@@ -58,12 +87,12 @@ class CartViewSet(viewsets.ModelViewSet):
             product_id = request.data.get('product_id')
             quantity = int(request.data.get('quantity', 1))
 
-            logger.info(f"Adding product {product_id} to cart for user {request.user.username}")
+            logger.info("Adding product %s to cart for user %s", product_id, request.user.username)
 
             try:
-                product = Product.objects.get(id=product_id)
+                product = Product.objects.select_related('department').get(id=product_id)
             except Product.DoesNotExist:
-                logger.error(f"Product with id {product_id} not found")
+                logger.error("Product with id %s not found", product_id)
                 return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
 
             try:
@@ -74,16 +103,99 @@ class CartViewSet(viewsets.ModelViewSet):
                     cart_item.quantity = quantity
                 cart_item.save()
             except ValidationError as e:
-                logger.error(f"Validation error: {str(e)}")
+                logger.error("Validation error: %s", e)
                 return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            logger.info(f"Product {product_id} added to cart successfully")
+            logger.info("Product %s added to cart successfully", product_id)
 
-            serializer = CartSerializer(cart)
-            return Response(serializer.data)
+            # add_item has always serialized without the request context.
+            return Response(self.cart_data(self.get_queryset().get(pk=cart.pk), context={}))
         except Exception as e:
-            logger.error(f"Error adding product to cart: {str(e)}")
+            logger.error("Error adding product to cart: %s", e)
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        lines = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(lines, list):
+            return Response({'error': 'A list of items is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        errors = []
+        deltas = {}
+        line_indexes = {}
+        for index, line in enumerate(lines):
+            line_serializer = CartItemDeltaSerializer(data=line)
+            if not line_serializer.is_valid():
+                product_id = line.get('product_id') if isinstance(line, dict) else None
+                errors.append({'index': index, 'product_id': product_id, 'error': line_serializer.errors})
+                continue
+            product_id = line_serializer.validated_data['product_id']
+            deltas[product_id] = deltas.get(product_id, 0) + line_serializer.validated_data['quantity']
+            line_indexes.setdefault(product_id, []).append(index)
+
+        def fail(product_id, message):
+            for index in line_indexes[product_id]:
+                errors.append({'index': index, 'product_id': product_id, 'error': message})
+
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user=request.user)
+            products = Product.objects.select_related('department').in_bulk(list(deltas))
+            items = {item.product_id: item for item in cart.items.filter(product_id__in=list(deltas))}
+
+            changes = {}
+            for product_id, delta in deltas.items():
+                if product_id not in products:
+                    fail(product_id, 'Product not found')
+                    continue
+                current = items[product_id].quantity if product_id in items else 0
+                change = max(current + delta, 0) - current
+                if change:
+                    changes[product_id] = change
+
+            reference = f'cart:{cart.pk}'
+            short = reserve_many({pk: change for pk, change in changes.items() if change > 0}, reference)
+            release_many({pk: -change for pk, change in changes.items() if change < 0}, reference)
+            if short:
+                # products was read before the reservation; report what is left now.
+                on_hand = dict(Product.objects.filter(pk__in=short).values_list('pk', 'on_hand'))
+                for product_id in short:
+                    fail(product_id, f"Not enough inventory. Only {on_hand[product_id]} available.")
+
+            now = timezone.now()
+            table = rate_table()
+            created, updated, removed = [], [], []
+            subtotal_change, tax_change, count_change = 0, 0, 0
+            for product_id, change in changes.items():
+                if product_id in short:
+                    continue
+                product = products[product_id]
+                current = items[product_id].quantity if product_id in items else 0
+                place = product.department.is_taxable, product.location_id, product.department_id
+                old_subtotal, old_tax = price_line(product.price, current, *place, table=table)
+                new_subtotal, new_tax = price_line(product.price, current + change, *place, table=table)
+                subtotal_change += new_subtotal - old_subtotal
+                tax_change += new_tax - old_tax
+                count_change += change
+
+                item = items.get(product_id)
+                if item is None:
+                    created.append(CartItem(cart=cart, product_id=product_id, quantity=change))
+                elif item.quantity + change == 0:
+                    removed.append(item.pk)
+                else:
+                    item.quantity += change
+                    item.updated_at = now
+                    updated.append(item)
+            # Inventory was settled above, so bypass CartItem.save()/delete().
+            CartItem.objects.bulk_create(created)
+            CartItem.objects.bulk_update(updated, ['quantity', 'updated_at'])
+            CartItem.objects.filter(pk__in=removed).delete()
+            if count_change or subtotal_change:
+                Cart.adjust_totals(cart.pk, subtotal_change, tax_change, count_change)
+
+        errors.sort(key=lambda error: error['index'])
+        cart = self.get_queryset().get(pk=cart.pk)
+        return Response({'cart': self.cart_data(cart), 'errors': errors})
         
 
 @api_view(['POST'])
@@ -96,35 +208,44 @@ def register_user(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class LocationViewSet(viewsets.ModelViewSet):
+class LocationViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
     queryset = Location.objects.all()
     serializer_class = LocationSerializer
     permission_classes = [IsAdminUser]
 
 
-class DepartmentViewSet(viewsets.ModelViewSet):
+class DepartmentViewSet(CachedCatalogMixin, viewsets.ModelViewSet):
     queryset = Department.objects.all()
     serializer_class = DepartmentSerializer
     permission_classes = [IsAdminUser]
 
 
-class ProductPagination(PageNumberPagination):
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
-
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(CachedCatalogMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    read_serializer_class = ProductReadSerializer
+    catalog_version_keys = (CATALOG_VERSION_KEY, PRODUCTS_VERSION_KEY)
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, filters.OrderingFilter]
     filterset_class = ProductFilter
     search_fields = ['name', 'description', 'barcode']
     ordering_fields = ['name', 'price', 'created_at']
     pagination_class = ProductPagination
+    keyset_pagination_class = ProductKeysetPagination
+    export_chunk_size = 2000
+
+    @property
+    def paginator(self):
+        # ?pagination=keyset opts into cursor paging; its links carry the flag.
+        if not hasattr(self, '_paginator'):
+            pagination_class = self.pagination_class
+            request = getattr(self, 'request', None)
+            if request is not None and request.query_params.get('pagination') == 'keyset':
+                pagination_class = self.keyset_pagination_class
+            self._paginator = pagination_class() if pagination_class else None
+        return self._paginator
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'by_barcode', 'export']:
             permission_classes = [AllowAny]
         else:
             permission_classes = [IsAdminUser]
@@ -137,6 +258,60 @@ class ProductViewSet(viewsets.ModelViewSet):
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        # Accept an uploaded file or a raw text/csv / application/x-ndjson
+        # body; either way rows are parsed as they are read.
+        upload = request.FILES.get('file') if request.content_type.startswith('multipart/') else None
+        if upload is not None:
+            source_format, stream = guess_format(upload.name) or guess_format(upload.content_type), upload
+        else:
+            source_format, stream = guess_format(request.content_type), request.stream
+        if source_format is None:
+            return Response({'error': 'Send CSV or NDJSON, as the body or a "file" upload'},
+                            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        rows = PARSERS[source_format](decode_lines(stream or []))
+        result = ProductImporter().run(rows)
+        logger.info('Imported products: %d created, %d updated, %d errors, %.0f rows/sec',
+                    result.created, result.updated, len(result.errors), result.rows_per_sec)
+        return Response(result.as_dict())
+
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        # Rows are read with a server-side iterator and rendered as they
+        # arrive, so memory stays flat however large the catalog is.
+        queryset = self.filter_queryset(self.get_queryset())
+        if not queryset.ordered:
+            queryset = queryset.order_by('id')
+        read_serializer = self.read_serializer_class(context=self.get_serializer_context())
+        rows = read_serializer.values(queryset).iterator(chunk_size=self.export_chunk_size)
+        fields = [name for name, *_ in read_serializer.steps]
+
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(map(read_serializer.from_values, rows), fields),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        response['Content-Disposition'] = f'attachment; filename="products.{renderer.format}"'
+        return response
+
+    @action(detail=False, methods=['get'], url_path=r'by-barcode/(?P<code>[^/]+)')
+    def by_barcode(self, request, code=None):
+        def load(code):
+            product = Product.objects.filter(barcode=code).order_by('id').first()
+            if product is None:
+                return None
+            # Cached without a request, so image URLs stay host-independent.
+            return product.pk, dict(ProductSerializer(product).data)
+
+        data = get_product_by_barcode(code, load)
+        if data is None:
+            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+        if data['image']:
+            data = {**data, 'image': request.build_absolute_uri(data['image'])}
+        return Response(data)
+
 
 class CartItemViewSet(viewsets.ModelViewSet):
     queryset = CartItem.objects.all()
@@ -147,29 +322,55 @@ class CartItemViewSet(viewsets.ModelViewSet):
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+    pagination_class = OrderPagination
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        # One query for the page of orders and one for all of their items;
+        # the items carry their own product snapshot, so no join is needed.
+        items = OrderItem.objects.order_by('id')
+        return Order.objects.filter(user=self.request.user).order_by('-created_at', '-id').prefetch_related(
+            Prefetch('items', queryset=items)
+        )
 
     @action(detail=False, methods=['post'])
     def checkout(self, request):
         try:
             with transaction.atomic():
-                cart = Cart.objects.get(user=request.user)
-                if not cart.items.exists():
+                # Locked so the reaper can't release the stock of lines this
+                # checkout is about to sell.
+                cart = Cart.objects.select_for_update().get(user=request.user)
+                cart_items = price_items(cart.items.select_related('product__department'))
+                if not cart_items:
                     return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
 
-                order = Order.objects.create(user=request.user, total=cart.total)
-                for cart_item in cart.items.all():
-                    OrderItem.objects.create(
+                total = sum(item.total_price for item in cart_items)
+                order = Order.objects.create(user=request.user, total=total.quantize(Decimal('0.01')))
+                order_items = OrderItem.objects.bulk_create([
+                    OrderItem(
                         order=order,
                         product=cart_item.product,
                         quantity=cart_item.quantity,
-                        price=cart_item.product.price
+                        price=cart_item.product.price,
+                        product_name=cart_item.product.name,
+                        barcode=cart_item.product.barcode,
+                        tax=cart_item.tax,
+                        cost=cart_item.product.cost,
+                        department_id=cart_item.product.department_id,
+                        location_id=cart_item.product.location_id,
                     )
-                cart.items.all().delete()  # Clear the cart
-
-            serializer = OrderSerializer(order)
+                    for cart_item in cart_items
+                ])
+                record_sales(order, order_items)
+                sold = {}
+                for item in cart_items:
+                    sold[item.product_id] = sold.get(item.product_id, 0) + item.quantity
+                record_sale(sold, f'order:{order.pk}')
+                # The stock reserved by these lines is now sold, so clear them with
+                # a bulk delete that deliberately skips CartItem.delete()'s restock.
+                CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+                Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now(), **empty_totals())
+
+            serializer = OrderSerializer(self.get_queryset().get(pk=order.pk))
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         except Cart.DoesNotExist:
             return Response({'error': 'Cart not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -185,3 +386,43 @@ from .serializers import CustomTokenObtainPairSerializer
 @method_decorator(csrf_exempt, name='dispatch')
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+
+
+class SalesReportViewSet(viewsets.GenericViewSet):
+    """
+    Units, revenue, tax, cost and gross margin, summed from SalesRollup
+    (never OrderItem) and grouped by any of day, department and location.
+    """
+    permission_classes = [IsAdminUser]
+    serializer_class = SalesReportRowSerializer
+    pagination_class = None
+    group_columns = {
+        'day': ['day'],
+        'department': ['department_id', 'department__name'],
+        'location': ['location_id', 'location__name'],
+    }
+
+    def list(self, request):
+        query = SalesReportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        rollups = SalesRollup.objects.all()
+        if 'start' in params:
+            rollups = rollups.filter(day__gte=params['start'])
+        if 'end' in params:
+            rollups = rollups.filter(day__lte=params['end'])
+        if 'department' in params:
+            rollups = rollups.filter(department_id=params['department'])
+        if 'location' in params:
+            rollups = rollups.filter(location_id=params['location'])
+
+        columns = [column for group in params['group_by'] for column in self.group_columns[group]]
+        rows = rollups.values(*columns).annotate(
+            units=Sum('units'), revenue=Sum('revenue'), tax=Sum('tax'), cost=Sum('cost')
+        ).order_by(*columns)
+        for row in rows:
+            row['margin'] = row['revenue'] - row['cost']
+            row['margin_percent'] = row['margin'] * 100 / row['revenue'] if row['revenue'] else None
+        return Response(self.get_serializer(rows, many=True).data)
+
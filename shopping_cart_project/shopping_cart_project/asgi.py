@@ -12,5 +12,13 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shopping_cart_project.settings')
+# Tells database_settings() to leave persistent connections off.
+os.environ['DJANGO_ASGI'] = '1'
 
 application = get_asgi_application()
+
+# Only web processes run the in-process cart reaper (CART_REAPER_INTERVAL);
+# management commands, including reap_carts itself, never load this module.
+from cart.reaper import start_reaper  # noqa: E402
+
+start_reaper()
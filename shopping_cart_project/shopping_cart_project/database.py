@@ -0,0 +1,108 @@
+# shopping_cart_project/database.py
+
+import django
+from django.core.exceptions import ImproperlyConfigured
+
+ENGINES = {
+    'sqlite': 'django.db.backends.sqlite3',
+    'postgresql': 'django.db.backends.postgresql',
+    'postgres': 'django.db.backends.postgresql',
+    'mysql': 'django.db.backends.mysql',
+}
+
+# Applied to every new SQLite connection by cart.signals. WAL lets readers
+# run alongside a writer, NORMAL sync is safe under WAL, and busy_timeout
+# makes a locked writer wait instead of failing immediately.
+SQLITE_PRAGMA_DEFAULTS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': '5000',
+    'mmap_size': str(256 * 1024 * 1024),
+    'temp_store': 'MEMORY',
+}
+
+
+def env_bool(environ, name, default):
+    value = environ.get(name)
+    if value is None or value == '':
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int(environ, name, default):
+    value = environ.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ImproperlyConfigured(f'{name} must be an integer, got {value!r}')
+
+
+def database_settings(environ, base_dir):
+    """
+    Build DATABASES['default'] from DATABASE_* environment variables.
+
+    DATABASE_ENGINE is sqlite (the default), postgresql or mysql, or a full
+    backend path. Connections persist for DATABASE_CONN_MAX_AGE seconds
+    (60; 'none' keeps them forever) and are health-checked before reuse.
+    Under ASGI (DJANGO_ASGI, set by asgi.py) Django wants persistent
+    connections off, so there it must be 0, which is also the default.
+    DATABASE_POOL=min:max (or 1) enables psycopg's pool on PostgreSQL, which
+    Django supports from 5.1; pooled connections are not also persisted.
+    """
+    engine = environ.get('DATABASE_ENGINE', 'sqlite')
+    engine = ENGINES.get(engine, engine)
+    sqlite = engine == ENGINES['sqlite']
+
+    config = {
+        'ENGINE': engine,
+        'NAME': environ.get('DATABASE_NAME') or (base_dir / 'db.sqlite3' if sqlite else ''),
+        'CONN_HEALTH_CHECKS': env_bool(environ, 'DATABASE_CONN_HEALTH_CHECKS', True),
+        'OPTIONS': {},
+    }
+    asgi = env_bool(environ, 'DJANGO_ASGI', False)
+    default_max_age = 0 if asgi else 60
+    max_age = environ.get('DATABASE_CONN_MAX_AGE') or str(default_max_age)
+    config['CONN_MAX_AGE'] = (None if max_age.lower() == 'none'
+                              else env_int(environ, 'DATABASE_CONN_MAX_AGE', default_max_age))
+    if asgi and config['CONN_MAX_AGE'] != 0:
+        raise ImproperlyConfigured(
+            'DATABASE_CONN_MAX_AGE must be 0 under ASGI; use DATABASE_POOL or PgBouncer to reuse connections.'
+        )
+
+    if not sqlite:
+        config.update({
+            'USER': environ.get('DATABASE_USER', ''),
+            'PASSWORD': environ.get('DATABASE_PASSWORD', ''),
+            'HOST': environ.get('DATABASE_HOST', ''),
+            'PORT': environ.get('DATABASE_PORT', ''),
+        })
+        if environ.get('DATABASE_CONNECT_TIMEOUT'):
+            config['OPTIONS']['connect_timeout'] = env_int(environ, 'DATABASE_CONNECT_TIMEOUT', 10)
+
+    pool = environ.get('DATABASE_POOL', '')
+    if pool and pool.lower() not in ('0', 'false', 'no', 'off'):
+        if engine != ENGINES['postgresql']:
+            raise ImproperlyConfigured('DATABASE_POOL is only supported with PostgreSQL.')
+        if django.VERSION < (5, 1):
+            raise ImproperlyConfigured(
+                'DATABASE_POOL needs Django 5.1+; use persistent connections or PgBouncer instead.'
+            )
+        if ':' in pool:
+            min_size, max_size = (int(size) for size in pool.split(':', 1))
+            config['OPTIONS']['pool'] = {'min_size': min_size, 'max_size': max_size}
+        else:
+            config['OPTIONS']['pool'] = True
+        config['CONN_MAX_AGE'] = 0
+    return config
+
+
+def sqlite_pragmas(environ):
+    """SQLITE_<PRAGMA> overrides the defaults; an empty value drops one."""
+    pragmas = {}
+    for name, default in SQLITE_PRAGMA_DEFAULTS.items():
+        value = environ.get(f'SQLITE_{name.upper()}', default)
+        if value != '':
+            pragmas[name] = value
+    return pragmas
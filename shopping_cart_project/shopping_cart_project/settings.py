@@ -10,8 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from decimal import Decimal
+from .database import database_settings, env_int, sqlite_pragmas
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -47,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'cart.metrics.MetricsMiddleware',
+    'cart.querycheck.QueryCheckMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Add this
@@ -81,13 +85,13 @@ WSGI_APPLICATION = 'shopping_cart_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# Configured from DATABASE_* environment variables; see database.py.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_settings(os.environ, BASE_DIR),
 }
 
+SQLITE_PRAGMAS = sqlite_pragmas(os.environ)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -133,7 +137,7 @@ CORS_ALLOW_ALL_ORIGINS = True  # Only for development! Configure properly for pr
 # Rest Framework settings (optional, but often useful)
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'cart.authentication.ClaimsJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -181,6 +185,47 @@ SIMPLE_JWT = {
 
 TAX_RATE = Decimal('0.08')  # 8% tax rate
 
+# TAX_RATE applies where no cart.TaxRate row does. Each process re-checks
+# the cached rate-table version at most this often (seconds), and the cache
+# recomputes it from the database after TAX_RATE_VERSION_TIMEOUT; with a
+# per-process cache that bounds how long other workers keep old rates.
+TAX_RATE_CHECK_INTERVAL = 5
+TAX_RATE_VERSION_TIMEOUT = 60
+
+# Barcode lookups: shared cache timeout plus a short-lived per-process LRU
+PRODUCT_CACHE_TIMEOUT = 300
+PRODUCT_LOCAL_CACHE_SIZE = 4096
+PRODUCT_LOCAL_CACHE_TTL = 5
+
+# Product, department and location list/retrieve responses; 0 turns the
+# cache off, as the benchmarks and load test do to measure the queries
+# behind it.
+CATALOG_CACHE_TIMEOUT = env_int(os.environ, 'CATALOG_CACHE_TIMEOUT', 600)
+
+# Users authenticated from tokens without claims are cached this long
+AUTH_USER_CACHE_TIMEOUT = 60
+
+# Carts idle this many seconds give their reserved stock back
+# (`manage.py reap_carts`); set CART_REAPER_INTERVAL to also run the reaper
+# on a thread in each web process.
+CART_RESERVATION_TTL = 2 * 60 * 60
+CART_REAPER_INTERVAL = None
+
+# Prometheus scrapes of /api/metrics are accepted from these addresses
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+# Send app and database timings to clients in a Server-Timing header
+METRICS_SERVER_TIMING = False
+
+# Repeated-query (N+1) detection per request: 'warn', 'raise' or None.
+# The test runner always raises.
+NPLUSONE_MODE = None
+NPLUSONE_THRESHOLD = 3
+TEST_RUNNER = 'cart.querycheck.QueryCheckRunner'
+
+# Product search: dotted path to a cart.search backend, or None to pick
+# FTS5 on SQLite and tsvector on PostgreSQL
+PRODUCT_SEARCH_BACKEND = None
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Shopping Cart API',
     'DESCRIPTION': 'API for managing a shopping cart system',
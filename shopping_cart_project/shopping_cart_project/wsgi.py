@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shopping_cart_project.settings')
 
 application = get_wsgi_application()
+
+# Only web processes run the in-process cart reaper (CART_REAPER_INTERVAL);
+# management commands, including reap_carts itself, never load this module.
+from cart.reaper import start_reaper  # noqa: E402
+
+start_reaper()